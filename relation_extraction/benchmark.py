@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import platform
+import tempfile
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+import load_data
+import synthetic_corpus
+from instrumentation import RunRecorder, StageTimer
+
+#pipeline stages in the order they run, each is timed and memory sampled on its own
+STAGES = ['parse_xml', 'build_instances', 'build_features', 'vectorize', 'train', 'predict']
+DEFAULT_SCALES = [50, 200, 800]
+#small scale results committed with the benchmark, compared against unless another baseline is given
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+#a stage is a regression if it is this much slower than the baseline and took longer than MIN_SECONDS,
+#wide enough that a slower machine than the one the baseline was recorded on does not fail
+SLOWDOWN_THRESHOLD = 3.0
+MIN_SECONDS = 0.1
+#or if time grows faster with corpus size, compared as log-log slope between smallest and largest scale
+SCALING_THRESHOLD = 0.5
+
+
+def run_stage(results, recorder, stage, function, count_items):
+    '''Runs function as a stage of recorder, records seconds, memory and throughput of the stage,
+    returns the function result'''
+    with StageTimer(recorder, stage):
+        output = function()
+    seconds = recorder.stages[stage]['seconds']
+    peak_increase_mb = recorder.stages[stage]['peak_rss_increase_mb']
+    items = count_items(output)
+    results[stage] = {'seconds': seconds,
+                      'items': items,
+                      'items_per_second': items / max(seconds, 1e-9),
+                      'peak_rss_mb': recorder.stages[stage]['peak_rss_mb'],
+                      'peak_rss_increase_mb': peak_increase_mb}
+    print(stage + ': ' + str(round(seconds, 3)) + 's ' + str(items) + ' items ' +
+          str(round(peak_increase_mb, 1)) + 'MB')
+    return output
+
+
+def run_pipeline(paths, settings, symmetric = False):
+    '''Times every stage of distant training and prediction on a generated dataset'''
+    stage_results = {}
+    recorder = RunRecorder()
+    xml_files = load_data.list_xml_files(paths['corpus'])
+    entity_1_ids = load_data.load_id_list(paths['entity_1_ids'], 0)
+    entity_2_ids = load_data.load_id_list(paths['entity_2_ids'], 0)
+    distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(paths['knowledge_base'], 0, 1, 2)
+
+    def parse_xml():
+        sentences = []
+        for xml_file in xml_files:
+            sentences.extend(load_data.load_xml(xml_file, settings.entity_1, settings.entity_2))
+        return sentences
+    sentences = run_stage(stage_results, recorder, 'parse_xml', parse_xml, len)
+
+    candidate_pairs = run_stage(stage_results, recorder, 'build_instances',
+                                lambda: load_data.build_candidate_pairs(sentences, entity_1_ids, entity_2_ids),
+                                lambda pairs: 2 * len(pairs))
+
+    selected = run_stage(stage_results, recorder, 'build_features',
+                         lambda: load_data.select_training_instances(candidate_pairs, distant_interactions,
+                                                                     reverse_distant_interactions, symmetric),
+                         lambda result: len(result[0]))
+    training_instances = selected[0]
+    dictionaries = selected[1:]
+    num_features = load_data.get_feature_space_size(*dictionaries)
+
+    X = run_stage(stage_results, recorder, 'vectorize',
+                  lambda: load_data.build_feature_matrix(training_instances, num_features),
+                  lambda matrix: matrix.shape[0])
+    y = np.array([t.get_label() for t in training_instances])
+
+    model = run_stage(stage_results, recorder, 'train', lambda: LogisticRegression().fit(X, y), lambda m: X.shape[0])
+
+    def predict():
+        predict_instances = load_data.build_instances_predict(sentences, dictionaries[0], dictionaries[1],
+                                                              dictionaries[2], dictionaries[3], entity_1_ids,
+                                                              entity_2_ids, symmetric)
+        model.predict_proba(load_data.build_feature_matrix(predict_instances, num_features))
+        return predict_instances
+    run_stage(stage_results, recorder, 'predict', predict, len)
+    #stops the memory sampling thread, nothing is written without a report file
+    recorder.write_report()
+    return stage_results
+
+
+def get_scaling_exponents(scale_results):
+    '''Slope of log(seconds) over log(documents) between smallest and largest scale for each stage,
+    1 means linear scaling'''
+    scales = sorted(scale_results, key=int)
+    exponents = {}
+    if len(scales) < 2:
+        return exponents
+    smallest = scale_results[scales[0]]
+    largest = scale_results[scales[-1]]
+    size_ratio = math.log(float(scales[-1]) / float(scales[0]))
+    for stage in STAGES:
+        if stage in smallest and stage in largest:
+            exponents[stage] = math.log(max(largest[stage]['seconds'], 1e-6) /
+                                        max(smallest[stage]['seconds'], 1e-6)) / size_ratio
+    return exponents
+
+
+def run_benchmarks(scales = None, seed = 0, work_folder = None, symmetric = False):
+    '''Generates a dataset per scale and runs the pipeline on it, returns machine readable results'''
+    if scales is None:
+        scales = DEFAULT_SCALES
+    cleanup = work_folder is None
+    if work_folder is None:
+        work_folder = tempfile.mkdtemp(prefix='relation_extraction_benchmark_')
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'symmetric': symmetric,
+               'scales': {}}
+    try:
+        for num_documents in scales:
+            print('Scale: ' + str(num_documents) + ' documents')
+            settings = synthetic_corpus.SyntheticCorpusSettings(num_documents=num_documents, seed=seed)
+            paths = synthetic_corpus.generate_dataset(os.path.join(work_folder, str(num_documents)), settings)
+            scale_results = run_pipeline(paths, settings, symmetric)
+            results['scales'][str(num_documents)] = {'settings': settings.to_dict(), 'stages': scale_results}
+    finally:
+        if cleanup:
+            shutil.rmtree(work_folder)
+    results['scaling_exponents'] = get_scaling_exponents(
+        dict((scale, r['stages']) for scale, r in results['scales'].items()))
+    return results
+
+
+def compare_to_baseline(results, baseline, slowdown_threshold = SLOWDOWN_THRESHOLD,
+                        scaling_threshold = SCALING_THRESHOLD):
+    '''Returns list of regressions, stages that got slower at a scale or scale worse with corpus size'''
+    regressions = []
+    for scale, scale_results in sorted(results['scales'].items()):
+        if scale not in baseline['scales']:
+            continue
+        baseline_stages = baseline['scales'][scale]['stages']
+        for stage in STAGES:
+            if stage not in scale_results['stages'] or stage not in baseline_stages:
+                continue
+            seconds = scale_results['stages'][stage]['seconds']
+            baseline_seconds = baseline_stages[stage]['seconds']
+            if seconds > MIN_SECONDS and seconds > slowdown_threshold * baseline_seconds:
+                regressions.append({'scale': scale, 'stage': stage, 'kind': 'slowdown',
+                                    'seconds': seconds, 'baseline_seconds': baseline_seconds})
+    largest = results['scales'][max(results['scales'], key=int)]['stages'] if results['scales'] else {}
+    for stage, exponent in sorted(results['scaling_exponents'].items()):
+        baseline_exponent = baseline.get('scaling_exponents', {}).get(stage)
+        #slopes of stages too short to time reliably are noise
+        if largest.get(stage, {}).get('seconds', 0.0) <= MIN_SECONDS:
+            continue
+        if baseline_exponent is not None and exponent > baseline_exponent + scaling_threshold:
+            regressions.append({'stage': stage, 'kind': 'scaling', 'exponent': exponent,
+                                'baseline_exponent': baseline_exponent})
+    return regressions
+
+
+def main():
+    '''python benchmark.py results.json [baseline.json, DEFAULT or NONE] [scales, e.g. 50,200,800] [seed]
+    Without a baseline argument the committed benchmark_baseline.json is compared against at its scales.
+    Exits with status 1 if a stage regressed against the baseline'''
+    results_file = sys.argv[1]
+    baseline_file = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_BASELINE
+    if baseline_file.upper() == "NONE":
+        baseline_file = None
+    elif baseline_file.upper() == "DEFAULT":
+        baseline_file = DEFAULT_BASELINE
+    baseline = json.load(open(baseline_file)) if baseline_file is not None else None
+    if len(sys.argv) > 3:
+        scales = [int(s) for s in sys.argv[3].split(',')]
+    elif baseline is not None:
+        scales = sorted(int(s) for s in baseline['scales'])
+    else:
+        scales = DEFAULT_SCALES
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+
+    results = run_benchmarks(scales, seed)
+    if baseline is not None:
+        results['baseline'] = baseline_file
+        results['regressions'] = compare_to_baseline(results, baseline)
+    out = open(results_file, 'w')
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.close()
+
+    print(json.dumps(results['scaling_exponents'], sort_keys=True))
+    if len(results.get('regressions', [])) > 0:
+        print('Regressions against ' + baseline_file)
+        for regression in results['regressions']:
+            print(json.dumps(regression, sort_keys=True))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
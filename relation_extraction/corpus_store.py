@@ -0,0 +1,180 @@
+import os
+import mmap
+import zlib
+import cPickle as pickle
+
+from structures.sentence_structure import Sentence, Token, Dependency
+
+#on disk layout of a corpus store directory:
+#   records.bin  concatenated zlib compressed abstract records, memory mapped for reading
+#   index.pkl    format version, entity types, (offset, length) of every abstract and the
+#                size/mtime of every source xml file so unchanged files are not parsed again
+FORMAT_VERSION = 1
+RECORDS_FILE = 'records.bin'
+INDEX_FILE = 'index.pkl'
+
+
+def encode_abstract(sentences):
+    '''Encodes list of candidate sentences to a compact record, dependency types and graphs are not stored'''
+    sentence_records = []
+    for sentence in sentences:
+        tokens = []
+        for t in sentence.get_tokens()[1:]:
+            tokens.append((t.token_id, t.word, t.lemma, t.char_begin, t.char_end, t.pos, t.ner, t.normalized_ner))
+        dependencies = []
+        for d in sentence.dependencies:
+            dependencies.append((d.get_type(), d.get_governor_token().get_token_id(), d.get_dependent_token().get_token_id()))
+        sentence_records.append((sentence.sentence_id, tokens, dependencies, sentence.get_entity_pairs()))
+    return zlib.compress(pickle.dumps(sentence_records, pickle.HIGHEST_PROTOCOL))
+
+
+def decode_abstract(record):
+    '''Rebuilds candidate sentences from a record made by encode_abstract'''
+    sentences = []
+    for sentence_id, tokens, dependencies, pairs in pickle.loads(zlib.decompress(record)):
+        sentence = Sentence(sentence_id)
+        for t in tokens:
+            sentence.add_token(Token(*t))
+        for dep_type, governor, dependent in dependencies:
+            sentence.add_dependency(Dependency(dep_type, sentence.get_token(governor), sentence.get_token(dependent)))
+        sentence.pairs = pairs
+        sentence.build_dependency_types()
+        sentences.append(sentence)
+    return sentences
+
+
+class CorpusStore(object):
+    def __init__(self, store_path):
+        '''Opens corpus store, abstracts are decoded lazily when accessed by key'''
+        self.store_path = store_path
+        index_file = open(os.path.join(store_path, INDEX_FILE), 'rb')
+        index = pickle.load(index_file)
+        index_file.close()
+        if index.get('version') != FORMAT_VERSION:
+            raise ValueError('unsupported corpus store version ' + str(index.get('version')) + ' in ' + store_path)
+        self.entity_1 = index['entity_1']
+        self.entity_2 = index['entity_2']
+        self.abstracts = index['abstracts']
+        self.files = index['files']
+        self.records_file = open(os.path.join(store_path, RECORDS_FILE), 'rb')
+        if os.fstat(self.records_file.fileno()).st_size > 0:
+            self.records = mmap.mmap(self.records_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.records = ''
+
+    def get_record(self, key):
+        '''Returns raw encoded record of abstract'''
+        offset, length = self.abstracts[key]
+        return self.records[offset:offset + length]
+
+    def __getitem__(self, key):
+        return decode_abstract(self.get_record(key))
+
+    def __len__(self):
+        return len(self.abstracts)
+
+    def __contains__(self, key):
+        return 0 <= key < len(self.abstracts)
+
+    def __iter__(self):
+        return iter(range(len(self.abstracts)))
+
+    def iterkeys(self):
+        return iter(self)
+
+    def keys(self):
+        return list(self)
+
+    def get_file_entry(self, relative_path):
+        '''Returns index entry (size, mtime, key, num_sentences) of source xml file or None'''
+        return self.files.get(relative_path)
+
+    def is_current(self, relative_path, size, mtime):
+        '''Checks if xml file was stored with the same size and modification time'''
+        entry = self.files.get(relative_path)
+        return entry is not None and entry['size'] == size and entry['mtime'] == mtime
+
+    def close(self):
+        if not isinstance(self.records, str):
+            self.records.close()
+        self.records_file.close()
+
+
+class CorpusStoreWriter(object):
+    def __init__(self, store_path, entity_1, entity_2):
+        '''Writes a new corpus store next to the old one, replaces it on close'''
+        self.store_path = store_path
+        self.entity_1 = entity_1
+        self.entity_2 = entity_2
+        self.abstracts = []
+        self.files = {}
+        self.offset = 0
+        if not os.path.isdir(store_path):
+            os.makedirs(store_path)
+        self.records_file = open(os.path.join(store_path, RECORDS_FILE + '.tmp'), 'wb')
+
+    def add_record(self, relative_path, size, mtime, record, num_sentences):
+        '''Adds encoded abstract of xml file, record is None for files without candidate sentences'''
+        key = None
+        if record is not None:
+            key = len(self.abstracts)
+            self.records_file.write(record)
+            self.abstracts.append((self.offset, len(record)))
+            self.offset += len(record)
+        self.files[relative_path] = {'size': size, 'mtime': mtime, 'key': key, 'num_sentences': num_sentences}
+        return key
+
+    def add_abstract(self, relative_path, size, mtime, sentences):
+        '''Encodes and adds sentences parsed from xml file'''
+        if len(sentences) == 0:
+            return self.add_record(relative_path, size, mtime, None, 0)
+        return self.add_record(relative_path, size, mtime, encode_abstract(sentences), len(sentences))
+
+    def copy_abstract(self, relative_path, previous_store):
+        '''Copies record of unchanged xml file from previous store without decoding it'''
+        entry = previous_store.get_file_entry(relative_path)
+        record = None
+        if entry['key'] is not None:
+            record = previous_store.get_record(entry['key'])
+        return self.add_record(relative_path, entry['size'], entry['mtime'], record, entry['num_sentences'])
+
+    def close(self):
+        '''Writes index and swaps new files into place, temporary files are removed if that fails'''
+        try:
+            self.records_file.close()
+            index = {'version': FORMAT_VERSION, 'entity_1': self.entity_1, 'entity_2': self.entity_2,
+                     'abstracts': self.abstracts, 'files': self.files}
+            index_file = open(os.path.join(self.store_path, INDEX_FILE + '.tmp'), 'wb')
+            try:
+                pickle.dump(index, index_file, pickle.HIGHEST_PROTOCOL)
+            finally:
+                index_file.close()
+            os.rename(os.path.join(self.store_path, RECORDS_FILE + '.tmp'), os.path.join(self.store_path, RECORDS_FILE))
+            os.rename(os.path.join(self.store_path, INDEX_FILE + '.tmp'), os.path.join(self.store_path, INDEX_FILE))
+        finally:
+            self.remove_temporary_files()
+
+    def abort(self):
+        '''Drops the new store when writing fails, the previous store stays as it was'''
+        self.records_file.close()
+        self.remove_temporary_files()
+
+    def remove_temporary_files(self):
+        for name in [RECORDS_FILE, INDEX_FILE]:
+            temp_path = os.path.join(self.store_path, name + '.tmp')
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def open_corpus_store(store_path, entity_1 = None, entity_2 = None):
+    '''Opens existing store, returns None if missing, of another version or built for other entity types'''
+    if not os.path.exists(os.path.join(store_path, INDEX_FILE)):
+        return None
+    try:
+        store = CorpusStore(store_path)
+    except ValueError:
+        return None
+    if entity_1 is not None and (store.entity_1 != entity_1 or store.entity_2 != entity_2):
+        store.close()
+        return None
+    return store
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import collections
+
+#run reports are off unless enabled, set these to turn them on from the command line
+REPORT_ENVIRONMENT_VARIABLE = 'RELATION_EXTRACTION_REPORT'
+PROFILE_ENVIRONMENT_VARIABLE = 'RELATION_EXTRACTION_PROFILE'
+
+
+def get_rss_mb():
+    '''Current resident memory of the process in MB, peak resident memory where /proc is not available'''
+    try:
+        statm = open('/proc/self/statm')
+        resident_pages = int(statm.read().split()[1])
+        statm.close()
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #kilobytes on linux, bytes on mac
+        return max_rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else max_rss / 1024.0
+
+
+class StageTimer(object):
+    def __init__(self, recorder, name):
+        '''Context manager timing one run of a stage'''
+        self.recorder = recorder
+        self.name = name
+        self.start_mb = None
+        self.peak_mb = None
+        self.profiler = None
+        self.start_time = 0.0
+
+    def __enter__(self):
+        self.recorder.start_memory_tracking(self)
+        self.profiler = self.recorder.start_profiler(self.name)
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self.start_time
+        if self.profiler is not None:
+            self.recorder.stop_profiler(self.profiler)
+        self.recorder.stop_memory_tracking(self)
+        peak_increase_mb = None
+        if self.peak_mb is not None:
+            peak_increase_mb = self.peak_mb - self.start_mb
+        self.recorder.add_stage(self.name, seconds, self.peak_mb, peak_increase_mb)
+        return False
+
+
+class NullStage(object):
+    '''Stands in for StageTimer while instrumentation is off'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_STAGE = NullStage()
+
+
+class RunRecorder(object):
+    def __init__(self, report_file = None, profile_folder = None, sample_memory = True):
+        '''Collects stage timings, counters and memory of a run. Stages run several times (folds, chunks)
+        add up. With profile_folder every stage is also profiled to profile_folder/<stage>.prof'''
+        self.report_file = report_file
+        self.profile_folder = profile_folder
+        self.sample_memory = sample_memory
+        self.start_time = time.time()
+        self.stages = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.profilers = {}
+        self.profiling = False
+        self.peak_rss_mb = 0.0
+        self.lock = threading.Lock()
+        self.info = {}
+        #one sampling thread updates the peak memory of every running stage
+        self.running_stages = set()
+        self.sampler_thread = None
+        self.sample_interval = 0.01
+        self.stopped = threading.Event()
+
+    def sample_memory_loop(self):
+        while not self.stopped.wait(self.sample_interval):
+            rss_mb = get_rss_mb()
+            with self.lock:
+                for stage_timer in self.running_stages:
+                    stage_timer.peak_mb = max(stage_timer.peak_mb, rss_mb)
+
+    def start_memory_tracking(self, stage_timer):
+        if not self.sample_memory:
+            return
+        if self.sampler_thread is None:
+            self.sampler_thread = threading.Thread(target=self.sample_memory_loop)
+            self.sampler_thread.daemon = True
+            self.sampler_thread.start()
+        stage_timer.start_mb = get_rss_mb()
+        stage_timer.peak_mb = stage_timer.start_mb
+        with self.lock:
+            self.running_stages.add(stage_timer)
+
+    def stop_memory_tracking(self, stage_timer):
+        if not self.sample_memory:
+            return
+        rss_mb = get_rss_mb()
+        with self.lock:
+            self.running_stages.discard(stage_timer)
+            stage_timer.peak_mb = max(stage_timer.peak_mb, rss_mb)
+
+    def start_profiler(self, name):
+        '''Profiles stage, only the outermost stage is profiled because one profiler can be active at a time'''
+        if self.profile_folder is None or self.profiling:
+            return None
+        import cProfile
+        if name not in self.profilers:
+            self.profilers[name] = cProfile.Profile()
+        self.profiling = True
+        self.profilers[name].enable()
+        return self.profilers[name]
+
+    def stop_profiler(self, profiler):
+        profiler.disable()
+        self.profiling = False
+
+    def add_stage(self, name, seconds, peak_mb, peak_increase_mb):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = {'seconds': 0.0, 'calls': 0, 'peak_rss_mb': None, 'peak_rss_increase_mb': None}
+            stage = self.stages[name]
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+            if peak_mb is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb, peak_mb)
+                stage['peak_rss_mb'] = max(stage['peak_rss_mb'] or 0.0, peak_mb)
+                stage['peak_rss_increase_mb'] = max(stage['peak_rss_increase_mb'] or 0.0, peak_increase_mb)
+
+    def count(self, name, value = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def get_report(self):
+        return {'info': self.info,
+                'total_seconds': time.time() - self.start_time,
+                'peak_rss_mb': max(self.peak_rss_mb, get_rss_mb()),
+                'stages': [dict(name=name, **stage) for name, stage in self.stages.items()],
+                'counters': dict(self.counters)}
+
+    def write_report(self):
+        '''Writes JSON run report and stage profiles, returns the report'''
+        self.stopped.set()
+        report = self.get_report()
+        if self.report_file is not None:
+            out = open(self.report_file, 'w')
+            json.dump(report, out, indent=2, sort_keys=True)
+            out.close()
+        if self.profile_folder is not None:
+            if not os.path.isdir(self.profile_folder):
+                os.makedirs(self.profile_folder)
+            for name, profiler in self.profilers.items():
+                profiler.dump_stats(os.path.join(self.profile_folder, name + '.prof'))
+        return report
+
+
+#recorder of the current run, None while instrumentation is off
+_recorder = None
+
+
+def enable(report_file = None, profile_folder = None, sample_memory = True):
+    '''Starts recording stages and counters of this process'''
+    global _recorder
+    _recorder = RunRecorder(report_file, profile_folder, sample_memory)
+    return _recorder
+
+
+def enable_from_environment():
+    '''Enables instrumentation if the report or profile environment variable is set'''
+    report_file = os.environ.get(REPORT_ENVIRONMENT_VARIABLE)
+    profile_folder = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE)
+    if report_file or profile_folder:
+        return enable(report_file or None, profile_folder or None)
+    return None
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def stage(name):
+    '''with stage('train'): ... times the block, does nothing while instrumentation is off'''
+    if _recorder is None:
+        return NULL_STAGE
+    return StageTimer(_recorder, name)
+
+
+def count(name, value = 1):
+    '''Adds value to a named counter'''
+    if _recorder is not None:
+        _recorder.count(name, value)
+
+
+def set_info(name, value):
+    '''Adds run information (mode, arguments) to the report'''
+    if _recorder is not None:
+        _recorder.info[name] = value
+
+
+def finish():
+    '''Writes the report of the current run and turns instrumentation off, returns the report or None'''
+    global _recorder
+    if _recorder is None:
+        return None
+    report = _recorder.write_report()
+    _recorder = None
+    return report
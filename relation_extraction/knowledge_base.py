@@ -0,0 +1,187 @@
+import os
+import array
+import cPickle as pickle
+
+import numpy as np
+import six
+
+#on disk layout of a saved knowledge base directory, the arrays are memory mapped when opened:
+#   entities.npy                         sorted entity ids, an entity's number is its position
+#   forward_offsets.npy/forward_targets.npy  adjacency index of relations, targets of entity i are
+#   reverse_offsets.npy/reverse_targets.npy  targets[offsets[i]:offsets[i + 1]] in increasing order
+#   info.pkl                             format version and columns the knowledge base was built from
+FORMAT_VERSION = 1
+INFO_FILE = 'info.pkl'
+ENTITIES_FILE = 'entities.npy'
+#remembered entity id lookups, the cache starts over when it is full so long runs don't grow it without bound
+MAX_CACHED_IDS = 100000
+
+
+def encode_entity(entity):
+    if isinstance(entity, six.text_type):
+        return entity.encode('utf-8')
+    return entity
+
+
+class EntityTable(object):
+    def __init__(self, entities):
+        '''Maps entity ids to numbers by binary search in a sorted byte string array'''
+        self.entities = entities
+        self.numbers = {}
+
+    def get_number(self, entity):
+        '''Returns number of entity id, None if the knowledge base doesn't have it.
+        Up to MAX_CACHED_IDS results are remembered, the same ids come up in many sentences'''
+        try:
+            return self.numbers[entity]
+        except KeyError:
+            pass
+        key = encode_entity(entity)
+        position = int(np.searchsorted(self.entities, key))
+        number = None
+        if position < len(self.entities) and self.entities[position] == key:
+            number = position
+        if len(self.numbers) >= MAX_CACHED_IDS:
+            self.numbers = {}
+        self.numbers[entity] = number
+        return number
+
+    def __len__(self):
+        return len(self.entities)
+
+
+class RelationIndex(object):
+    def __init__(self, entity_table, offsets, targets):
+        '''Relations in one direction as an adjacency index over entity numbers'''
+        self.entity_table = entity_table
+        self.offsets = offsets
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.targets)
+
+    def has_relation(self, entity_1_number, entity_2_number):
+        start = self.offsets[entity_1_number]
+        end = self.offsets[entity_1_number + 1]
+        if start == end:
+            return False
+        position = start + int(np.searchsorted(self.targets[start:end], entity_2_number))
+        return position < end and self.targets[position] == entity_2_number
+
+    def __contains__(self, pair):
+        '''(entity_1 id, entity_2 id) in index, same as for the set of tuples it replaces'''
+        return self.contains_any((pair[0],), (pair[1],))
+
+    def contains_any(self, entity_1_ids, entity_2_ids):
+        '''Checks if any entity_1 id is related to any entity_2 id without building the combinations'''
+        entity_2_numbers = []
+        for entity_2 in entity_2_ids:
+            number = self.entity_table.get_number(entity_2)
+            if number is not None:
+                entity_2_numbers.append(number)
+        if len(entity_2_numbers) == 0:
+            return False
+        for entity_1 in entity_1_ids:
+            entity_1_number = self.entity_table.get_number(entity_1)
+            if entity_1_number is None:
+                continue
+            for entity_2_number in entity_2_numbers:
+                if self.has_relation(entity_1_number, entity_2_number):
+                    return True
+        return False
+
+
+def to_numpy(int_array):
+    '''Views array.array of ints as numpy array without copying'''
+    if len(int_array) == 0:
+        return np.zeros(0, dtype=np.int32)
+    return np.frombuffer(int_array, dtype=np.int32)
+
+
+def build_relation_arrays(sources, targets, num_entities):
+    '''Sorts and deduplicates (source, target) pairs of entity numbers, returns offsets and targets of the adjacency index'''
+    width = max(num_entities, 1)
+    pairs = np.unique(sources.astype(np.int64) * width + targets)
+    sorted_sources = pairs // width
+    sorted_targets = (pairs % width).astype(np.int32)
+    offsets = np.searchsorted(sorted_sources, np.arange(num_entities + 1)).astype(np.int64)
+    return offsets, sorted_targets
+
+
+class DistantKnowledgeBase(object):
+    def __init__(self, entities, forward_offsets, forward_targets, reverse_offsets, reverse_targets, columns = None):
+        '''Forward relations and relations ending in "by" (reverse) over a shared entity table'''
+        self.entity_table = EntityTable(entities)
+        self.forward = RelationIndex(self.entity_table, forward_offsets, forward_targets)
+        self.reverse = RelationIndex(self.entity_table, reverse_offsets, reverse_targets)
+        self.columns = columns
+
+    def save(self, kb_path):
+        '''Writes arrays to a directory that open_knowledge_base can memory map'''
+        if not os.path.isdir(kb_path):
+            os.makedirs(kb_path)
+        np.save(os.path.join(kb_path, ENTITIES_FILE), self.entity_table.entities)
+        for name, index in [('forward', self.forward), ('reverse', self.reverse)]:
+            np.save(os.path.join(kb_path, name + '_offsets.npy'), index.offsets)
+            np.save(os.path.join(kb_path, name + '_targets.npy'), index.targets)
+        info_file = open(os.path.join(kb_path, INFO_FILE), 'wb')
+        pickle.dump({'version': FORMAT_VERSION, 'columns': self.columns}, info_file, pickle.HIGHEST_PROTOCOL)
+        info_file.close()
+
+
+def build_knowledge_base(distant_kb_file, column_a, column_b, distant_rel_col):
+    '''Streams tab separated knowledge base file, column_a is entity 1 and column_b entity 2.
+    Entity ids are numbered as they are read so only unique ids and two int arrays per direction are kept'''
+    entity_numbers = {}
+    relations = {'forward': (array.array('i'), array.array('i')), 'reverse': (array.array('i'), array.array('i'))}
+    file = open(distant_kb_file, 'rU')
+    for l in file:
+        split_line = l.rstrip('\r\n').split('\t')
+        entity_1 = split_line[column_a]
+        entity_2 = split_line[column_b]
+        if entity_1 not in entity_numbers:
+            entity_numbers[entity_1] = len(entity_numbers)
+        if entity_2 not in entity_numbers:
+            entity_numbers[entity_2] = len(entity_numbers)
+        if split_line[distant_rel_col].endswith('by') is False:
+            sources, targets = relations['forward']
+        else:
+            sources, targets = relations['reverse']
+        sources.append(entity_numbers[entity_1])
+        targets.append(entity_numbers[entity_2])
+    file.close()
+
+    #renumber entities in sorted order so numbers are positions in the sorted entity table
+    sorted_entities = sorted(entity_numbers)
+    renumber = np.zeros(len(sorted_entities), dtype=np.int32)
+    for position, entity in enumerate(sorted_entities):
+        renumber[entity_numbers[entity]] = position
+    entities = np.array([encode_entity(e) for e in sorted_entities], dtype=np.bytes_)
+    if len(entities) == 0:
+        entities = np.zeros(0, dtype='S1')
+    del entity_numbers
+
+    arrays = []
+    for name in ['forward', 'reverse']:
+        sources, targets = relations[name]
+        arrays.extend(build_relation_arrays(renumber[to_numpy(sources)], renumber[to_numpy(targets)], len(entities)))
+    return DistantKnowledgeBase(entities, arrays[0], arrays[1], arrays[2], arrays[3],
+                                (column_a, column_b, distant_rel_col))
+
+
+def open_knowledge_base(kb_path, columns = None):
+    '''Opens knowledge base saved with DistantKnowledgeBase.save, arrays are memory mapped.
+    columns (column_a, column_b, distant_rel_col) must match the columns it was built from'''
+    info_file = open(os.path.join(kb_path, INFO_FILE), 'rb')
+    info = pickle.load(info_file)
+    info_file.close()
+    if info.get('version') != FORMAT_VERSION:
+        raise ValueError('unsupported knowledge base version ' + str(info.get('version')) + ' in ' + kb_path)
+    if columns is not None and info['columns'] is not None and tuple(columns) != tuple(info['columns']):
+        raise ValueError('knowledge base ' + kb_path + ' was built from columns ' + str(tuple(info['columns'])) +
+                         ', not ' + str(tuple(columns)))
+    arrays = [np.load(os.path.join(kb_path, ENTITIES_FILE), mmap_mode='r')]
+    for name in ['forward', 'reverse']:
+        arrays.append(np.load(os.path.join(kb_path, name + '_offsets.npy'), mmap_mode='r'))
+        arrays.append(np.load(os.path.join(kb_path, name + '_targets.npy'), mmap_mode='r'))
+    return DistantKnowledgeBase(*arrays, columns=info['columns'])
@@ -0,0 +1,190 @@
+import sys
+import json
+import time
+import threading
+
+import numpy as np
+from scipy.special import expit
+from six.moves import xrange  # pylint: disable=redefined-builtin
+
+from skipgram import build_dataset, generate_skipgram_pairs, get_keep_probabilities, subsample_data
+
+
+def scatter_add(matrix, indices, updates):
+    """Adds rows of updates to matrix[indices], repeated indices are summed instead of overwritten."""
+    order = np.argsort(indices, kind='mergesort')
+    sorted_indices = indices[order]
+    starts = np.flatnonzero(np.r_[True, sorted_indices[1:] != sorted_indices[:-1]])
+    matrix[sorted_indices[starts]] += np.add.reduceat(updates[order], starts, axis=0)
+
+
+class SkipGramTrainer(object):
+    def __init__(self, vocabulary_size, embedding_size = 128, negative = 5, learning_rate = 0.025, seed = 0):
+        """Skip-gram with negative sampling in NumPy. Training runs in one thread unless asked for more,
+        extra threads update the shared weight matrices without locks (Hogwild). Runs with one thread
+        are reproducible for a seed, runs with several threads differ by the order the updates land in."""
+        self.vocabulary_size = vocabulary_size
+        self.embedding_size = embedding_size
+        self.negative = negative
+        self.learning_rate = learning_rate
+        self.seed = seed
+        random_state = np.random.RandomState(seed)
+        self.input_weights = (random_state.random_sample((vocabulary_size, embedding_size)) - 0.5) / embedding_size
+        self.output_weights = np.zeros((vocabulary_size, embedding_size))
+        self.negative_table = None
+        self.total_pairs = 1
+        self.processed_pairs = 0
+        self.loss = 0.0
+        self.seconds = 0.0
+        self.examples = 0
+
+    def set_noise_distribution(self, count):
+        """Negative words are drawn from the unigram distribution raised to 3/4."""
+        weights = np.array([max(c, 0) for _, c in count], dtype=np.float64) ** 0.75
+        self.negative_table = np.cumsum(weights / weights.sum())
+
+    def get_learning_rate(self):
+        """Decays linearly over all pairs of the run, progress is shared by the threads without a lock."""
+        progress = min(float(self.processed_pairs) / self.total_pairs, 1.0)
+        return self.learning_rate * max(1.0 - progress, 1e-4)
+
+    def train_batch(self, centers, contexts, random_state):
+        """One SGD step of skip-gram negative sampling on a batch of (center, context) pairs. Every
+        pair draws its own negative words and gets its own update, as in the word2vec C code, the
+        batch only turns the per pair dot products into einsum calls."""
+        negatives = np.searchsorted(self.negative_table, random_state.random_sample((len(centers), self.negative)))
+        negatives = np.minimum(negatives, self.vocabulary_size - 1)
+
+        hidden = self.input_weights[centers]
+        context_vectors = self.output_weights[contexts]
+        negative_vectors = self.output_weights[negatives]
+        positive_scores = expit(np.einsum('ij,ij->i', hidden, context_vectors))
+        negative_scores = expit(np.einsum('ij,ikj->ik', hidden, negative_vectors))
+
+        learning_rate = self.get_learning_rate()
+        positive_gradient = (1.0 - positive_scores) * learning_rate
+        #a negative that is the context word itself is skipped like in the C code
+        negative_gradient = np.where(negatives == contexts[:, np.newaxis], 0.0, -negative_scores * learning_rate)
+        hidden_update = positive_gradient[:, np.newaxis] * context_vectors + \
+            np.einsum('ik,ikj->ij', negative_gradient, negative_vectors)
+        output_indices = np.concatenate([contexts, negatives.ravel()])
+        output_updates = np.concatenate([positive_gradient[:, np.newaxis] * hidden,
+                                         (negative_gradient[:, :, np.newaxis] * hidden[:, np.newaxis, :]).reshape(
+                                             -1, self.embedding_size)])
+        scatter_add(self.output_weights, output_indices, output_updates)
+        scatter_add(self.input_weights, centers, hidden_update)
+
+        self.processed_pairs += len(centers)
+        self.loss += -np.log(np.maximum(positive_scores, 1e-10)).sum() - \
+            np.log(np.maximum(1.0 - negative_scores, 1e-10)).sum()
+
+    def train_shard(self, centers, contexts, batch_size, random_state):
+        for start in xrange(0, len(centers), batch_size):
+            self.train_batch(centers[start:start + batch_size], contexts[start:start + batch_size], random_state)
+
+    def train(self, data, count, epochs = 5, num_threads = 1, batch_size = 256, num_skips = 2, skip_window = 1,
+              subsample = 1e-3):
+        """Trains on the word ids of data for epochs passes. Every epoch subsamples frequent words,
+        builds the shuffled skip-gram pairs and splits them into one shard per thread.
+        More than one thread only speeds training up on a multi-core machine and only in the parts
+        where the NumPy kernels release the GIL, benchmark_trainers measures it.
+        Returns examples/sec of each epoch, timed with the subsampling and pair generation.
+        seconds and examples hold the totals of the run."""
+        self.set_noise_distribution(count)
+        random_state = np.random.RandomState(self.seed + 1)
+        keep_probabilities = get_keep_probabilities(count, subsample) if subsample else None
+        #estimate for the learning rate schedule, subsampling changes the number of pairs a little each epoch
+        kept_words = len(data) if keep_probabilities is None else keep_probabilities[np.asarray(data)].sum()
+        self.total_pairs = max(int(epochs * kept_words * num_skips), 1)
+        self.processed_pairs = 0
+        self.seconds = 0.0
+        self.examples = 0
+        throughput = []
+        for epoch in xrange(epochs):
+            start_time = time.time()
+            epoch_data = data if keep_probabilities is None else subsample_data(data, keep_probabilities, random_state)
+            centers, contexts = generate_skipgram_pairs(epoch_data, num_skips, skip_window, random_state)
+            self.loss = 0.0
+            threads = []
+            for shard in xrange(num_threads):
+                shard_random_state = np.random.RandomState([self.seed, epoch, shard])
+                thread = threading.Thread(target=self.train_shard,
+                                          args=(centers[shard::num_threads], contexts[shard::num_threads], batch_size,
+                                                shard_random_state))
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+            elapsed = max(time.time() - start_time, 1e-6)
+            self.seconds += elapsed
+            self.examples += len(centers)
+            throughput.append(len(centers) / elapsed)
+            print('Epoch %d, average loss %.4f, %.0f examples/sec' % (epoch + 1, self.loss / max(len(centers), 1),
+                                                                      throughput[-1]))
+        return throughput
+
+    def get_normalized_embeddings(self):
+        norm = np.sqrt(np.sum(np.square(self.input_weights), 1, keepdims=True))
+        return self.input_weights / np.maximum(norm, 1e-12)
+
+
+def run_numpy_word2vec(vocabulary, vocabulary_size, embedding_size = 128, epochs = 5, num_threads = 1,
+                       subsample = 1e-3, negative = 5, seed = 0):
+    """Same inputs and output as word2vec.run_word2vec without TensorFlow, returns normalized embeddings."""
+    data, count, dictionary, reverse_dictionary = build_dataset(vocabulary, vocabulary_size)
+    del vocabulary
+    trainer = SkipGramTrainer(len(count), embedding_size, negative, seed=seed)
+    trainer.train(data, count, epochs, num_threads, subsample=subsample)
+    return trainer.get_normalized_embeddings()
+
+
+def benchmark_trainers(vocabulary, vocabulary_size, embedding_size = 128, epochs = 1, num_threads = 4,
+                       tensorflow_steps = 2001, seed = 0):
+    """Trains the NumPy trainer with one and with num_threads threads and the TensorFlow trainer of
+    word2vec.py on the same vocabulary. Both sides time pair generation and training steps only,
+    without building the dataset, the graph or the session. Returns seconds and examples/sec of each,
+    TensorFlow is skipped if it isn't installed."""
+    data, count, dictionary, reverse_dictionary = build_dataset(vocabulary, vocabulary_size)
+    results = {'words': len(data), 'vocabulary_size': len(count), 'embedding_size': embedding_size}
+
+    #both trainers see every pair without subsampling so examples are counted the same way
+    results['numpy'] = []
+    for threads in sorted(set([1, num_threads])):
+        trainer = SkipGramTrainer(len(count), embedding_size, seed=seed)
+        trainer.train(data, count, epochs, threads, subsample=None)
+        results['numpy'].append({'threads': threads, 'epochs': epochs, 'seconds': trainer.seconds,
+                                 'examples': trainer.examples,
+                                 'examples_per_second': trainer.examples / max(trainer.seconds, 1e-6)})
+    #Hogwild threads only help where NumPy releases the GIL, the ratio shows what they bring on this machine
+    results['numpy_thread_speedup'] = results['numpy'][-1]['examples_per_second'] / \
+        results['numpy'][0]['examples_per_second']
+
+    try:
+        import word2vec
+    except ImportError:
+        results['tensorflow'] = None
+        return results
+    stats = {}
+    word2vec.run_word2vec(vocabulary, vocabulary_size, tensorflow_steps, seed=seed, embedding_size=embedding_size,
+                          stats=stats)
+    results['tensorflow'] = {'seconds': stats['train_seconds'], 'steps': tensorflow_steps,
+                             'examples': stats['examples'],
+                             'examples_per_second': stats['examples'] / max(stats['train_seconds'], 1e-6)}
+    return results
+
+
+def main():
+    """python numpy_word2vec.py words_file [vocabulary_size] [epochs] [threads] [tensorflow_steps]
+    Benchmarks both trainers on the whitespace separated words of words_file"""
+    words = open(sys.argv[1]).read().split()
+    vocabulary_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    epochs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    num_threads = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    tensorflow_steps = int(sys.argv[5]) if len(sys.argv) > 5 else 2001
+    results = benchmark_trainers(words, vocabulary_size, epochs=epochs, num_threads=num_threads,
+                                 tensorflow_steps=tensorflow_steps)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import collections
+import random
+
+import numpy as np
+
+
+def build_dataset(words, n_words):
+    """Process raw inputs into a dataset."""
+    count = [['UNK', -1]]
+    count.extend(collections.Counter(words).most_common(n_words - 1))
+    dictionary = dict()
+    for word, _ in count:
+        dictionary[word] = len(dictionary)
+    data = list()
+    unk_count = 0
+    for word in words:
+        if word in dictionary:
+            index = dictionary[word]
+        else:
+            index = 0  # dictionary['UNK']
+            unk_count += 1
+        data.append(index)
+    count[0][1] = unk_count
+    reversed_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
+    return data, count, dictionary, reversed_dictionary
+
+
+def generate_batch(data,data_index, batch_size, num_skips, skip_window):
+    assert batch_size % num_skips == 0
+    assert num_skips <= 2 * skip_window
+    batch = np.ndarray(shape=(batch_size), dtype=np.int32)
+    labels = np.ndarray(shape=(batch_size, 1), dtype=np.int32)
+    span = 2 * skip_window + 1  # [ skip_window target skip_window ]
+    buffer = collections.deque(maxlen=span)
+    if data_index + span > len(data):
+        data_index = 0
+    buffer.extend(data[data_index:data_index + span])
+    data_index += span
+    for i in range(batch_size // num_skips):
+        target = skip_window  # target label at the center of the buffer
+        targets_to_avoid = [skip_window]
+        for j in range(num_skips):
+            while target in targets_to_avoid:
+                target = random.randint(0, span - 1)
+            targets_to_avoid.append(target)
+            batch[i * num_skips + j] = buffer[skip_window]
+            labels[i * num_skips + j, 0] = buffer[target]
+        if data_index == len(data):
+            for word in data[:span]:
+                buffer.append(word)
+            data_index = span
+        else:
+            buffer.append(data[data_index])
+            data_index += 1
+    # Backtrack a little bit to avoid skipping words in the end of a batch
+    data_index = (data_index + len(data) - span) % len(data)
+    return batch, labels, data_index
+
+
+def generate_skipgram_pairs(data, num_skips, skip_window, random_state = None):
+    """Builds the (center, context) pairs of one pass over data, the same pairs generate_batch
+    draws batch by batch: every word is a center with num_skips distinct context words from
+    the skip_window words on each side. Pairs are returned shuffled as two int32 arrays."""
+    assert num_skips <= 2 * skip_window
+    if random_state is None:
+        random_state = np.random
+    data = np.asarray(data, dtype=np.int32)
+    num_centers = len(data) - 2 * skip_window
+    if num_centers <= 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    center_positions = np.arange(skip_window, skip_window + num_centers)
+    # offsets of the window without the center, [-skip_window, -1] and [1, skip_window]
+    window_offsets = np.concatenate([np.arange(-skip_window, 0), np.arange(1, skip_window + 1)])
+    # sorting random keys gives a random permutation of the window per center, the first
+    # num_skips offsets are distinct like the rejection loop of generate_batch
+    picked = np.argsort(random_state.random_sample((num_centers, 2 * skip_window)), axis=1)[:, :num_skips]
+    context_positions = center_positions[:, np.newaxis] + window_offsets[picked]
+    centers = np.repeat(data[center_positions], num_skips)
+    contexts = data[context_positions.ravel()]
+    order = random_state.permutation(len(centers))
+    return centers[order], contexts[order]
+
+
+def get_keep_probabilities(count, threshold):
+    """Probability of keeping each word id when subsampling frequent words, as in the word2vec
+    paper: words more frequent than threshold are dropped with rising probability."""
+    counts = np.array([max(c, 0) for _, c in count], dtype=np.float64)
+    frequencies = counts / max(counts.sum(), 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = (np.sqrt(frequencies / threshold) + 1) * threshold / frequencies
+    keep[frequencies == 0] = 1.0
+    return np.minimum(keep, 1.0)
+
+
+def subsample_data(data, keep_probabilities, random_state = None):
+    """Drops frequent words from data before the context windows are built."""
+    if random_state is None:
+        random_state = np.random
+    data = np.asarray(data, dtype=np.int32)
+    return data[random_state.random_sample(len(data)) < keep_probabilities[data]]
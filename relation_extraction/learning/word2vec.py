@@ -1,91 +1,69 @@
-import collections
 import math
-import random
+import time
 
 
 import numpy as np
 from six.moves import xrange  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+#generate_batch stays importable from here, the batch loop now lives with the NumPy pair generator
+from skipgram import build_dataset, generate_batch, generate_skipgram_pairs  # pylint: disable=unused-import
 
-def build_dataset(words, n_words):
-    """Process raw inputs into a dataset."""
-    count = [['UNK', -1]]
-    count.extend(collections.Counter(words).most_common(n_words - 1))
-    dictionary = dict()
-    for word, _ in count:
-        dictionary[word] = len(dictionary)
-    data = list()
-    unk_count = 0
-    for word in words:
-        if word in dictionary:
-            index = dictionary[word]
-        else:
-            index = 0  # dictionary['UNK']
-            unk_count += 1
-        data.append(index)
-    count[0][1] = unk_count
-    reversed_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
-    return data, count, dictionary, reversed_dictionary
-
-
-def generate_batch(data,data_index, batch_size, num_skips, skip_window):
-    assert batch_size % num_skips == 0
-    assert num_skips <= 2 * skip_window
-    batch = np.ndarray(shape=(batch_size), dtype=np.int32)
-    labels = np.ndarray(shape=(batch_size, 1), dtype=np.int32)
-    span = 2 * skip_window + 1  # [ skip_window target skip_window ]
-    buffer = collections.deque(maxlen=span)
-    if data_index + span > len(data):
-        data_index = 0
-    buffer.extend(data[data_index:data_index + span])
-    data_index += span
-    for i in range(batch_size // num_skips):
-        target = skip_window  # target label at the center of the buffer
-        targets_to_avoid = [skip_window]
-        for j in range(num_skips):
-            while target in targets_to_avoid:
-                target = random.randint(0, span - 1)
-            targets_to_avoid.append(target)
-            batch[i * num_skips + j] = buffer[skip_window]
-            labels[i * num_skips + j, 0] = buffer[target]
-        if data_index == len(data):
-            for word in data[:span]:
-                buffer.append(word)
-            data_index = span
-        else:
-            buffer.append(data[data_index])
-            data_index += 1
-    # Backtrack a little bit to avoid skipping words in the end of a batch
-    data_index = (data_index + len(data) - span) % len(data)
-    return batch, labels, data_index
-
-
-def run_word2vec(vocabulary, vocabulary_size):
+
+def build_pair_dataset(data, batch_size, num_skips, skip_window, prefetch_batches, random_state):
+    """tf.data pipeline of (center, context) batches. Pairs of a whole epoch are generated with NumPy
+    by a generator that repeat() calls again for every epoch, and epochs run back to back, so batches
+    carry the pairs left at the end of an epoch into the next one and every batch holds batch_size pairs."""
+    def generate_epoch():
+        # random_state gives each epoch new pairs
+        yield generate_skipgram_pairs(data, num_skips, skip_window, random_state)
+
+    dataset = tf.data.Dataset.from_generator(generate_epoch, (tf.int32, tf.int32),
+                                             (tf.TensorShape([None]), tf.TensorShape([None])))
+    dataset = dataset.repeat().flat_map(lambda centers, contexts:
+                                        tf.data.Dataset.from_tensor_slices((centers, contexts)))
+    return dataset.batch(batch_size, drop_remainder=True).prefetch(prefetch_batches)
+
+
+def run_word2vec(vocabulary, vocabulary_size, num_steps = 100001, prefetch_batches = 64, seed = None,
+                 embedding_size = 128, stats = None):
+    """Trains skip-gram embeddings with NCE loss. Pairs of a whole epoch are generated with NumPy
+    inside a tf.data generator, so the next epoch is built while prefetched batches train.
+    If stats is a dictionary it gets train_seconds and examples of the training steps alone,
+    without building the graph, starting the session and evaluating similarities."""
     data, count, dictionary, reverse_dictionary = build_dataset(vocabulary, vocabulary_size)
     del vocabulary
+    random_state = np.random.RandomState(seed)
 
 
     batch_size = 128
-    embedding_size = 128  # Dimension of the embedding vector.
     skip_window = 1  # How many words to consider left and right.
     num_skips = 2  # How many times to reuse an input to generate a label.
 
+    pairs_per_epoch = max(len(data) - 2 * skip_window, 0) * num_skips
+    if pairs_per_epoch == 0:
+        raise ValueError('need more than ' + str(2 * skip_window) + ' words to train embeddings')
+
     # We pick a random validation set to sample nearest neighbors. Here we limit the
     # validation samples to the words that have a low numeric ID, which by
     # construction are also the most frequent.
     valid_size = 16  # Random set of words to evaluate similarity on.
     valid_window = 100  # Only pick dev samples in the head of the distribution.
-    valid_examples = np.random.choice(valid_window, valid_size, replace=False)
+    valid_examples = random_state.choice(valid_window, valid_size, replace=False)
     num_sampled = 64  # Number of negative examples to sample.
 
     graph = tf.Graph()
 
     with graph.as_default():
 
+        if seed is not None:
+            tf.set_random_seed(seed)
+
         # Input static_data.
-        train_inputs = tf.placeholder(tf.int32, shape=[batch_size])
-        train_labels = tf.placeholder(tf.int32, shape=[batch_size, 1])
+        dataset = build_pair_dataset(data, batch_size, num_skips, skip_window, prefetch_batches, random_state)
+        iterator = dataset.make_initializable_iterator()
+        train_inputs, train_contexts = iterator.get_next()
+        train_labels = tf.expand_dims(train_contexts, 1)
         valid_dataset = tf.constant(valid_examples, dtype=tf.int32)
 
         # Ops and variables pinned to the CPU because of missing GPU implementation
@@ -127,29 +105,38 @@ def run_word2vec(vocabulary, vocabulary_size):
         init = tf.global_variables_initializer()
 
     # Step 5: Begin training.
-    num_steps = 100001
-    data_index = 0
     with tf.Session(graph=graph) as session:
         # We must initialize all variables before we use them.
         init.run()
         print('Initialized')
 
+        session.run(iterator.initializer)
         average_loss = 0
+        examples = 0
+        train_seconds = 0.0
+        total_examples = 0
+        start_time = time.time()
         for step in xrange(num_steps):
-            batch_inputs, batch_labels, data_index = generate_batch(data, data_index, batch_size, num_skips, skip_window)
-            feed_dict = {train_inputs: batch_inputs, train_labels: batch_labels}
-
             # We perform one update step by evaluating the optimizer op (including it
             # in the list of returned values for session.run()
-            _, loss_val = session.run([optimizer, loss], feed_dict=feed_dict)
+            step_start_time = time.time()
+            _, loss_val, batch_inputs = session.run([optimizer, loss, train_inputs])
+            train_seconds += time.time() - step_start_time
             average_loss += loss_val
+            examples += len(batch_inputs)
+            total_examples += len(batch_inputs)
 
             if step % 2000 == 0:
                 if step > 0:
                     average_loss /= 2000
+                elapsed = max(time.time() - start_time, 1e-6)
                 # The average loss is an estimate of the loss over the last 2000 batches.
                 print('Average loss at step ', step, ': ', average_loss)
+                epoch = (step + 1) * batch_size // pairs_per_epoch + 1
+                print('Epoch %d, %.0f examples/sec' % (epoch, examples / elapsed))
                 average_loss = 0
+                examples = 0
+                start_time = time.time()
 
             # Note that this is expensive (~20% slowdown if computed every 500 steps)
             if step % 10000 == 0:
@@ -164,5 +151,8 @@ def run_word2vec(vocabulary, vocabulary_size):
                         log_str = '%s %s,' % (log_str, close_word)
                     print(log_str)
         final_embeddings = normalized_embeddings.eval()
+        if stats is not None:
+            stats['train_seconds'] = train_seconds
+            stats['examples'] = total_examples
 
         return final_embeddings
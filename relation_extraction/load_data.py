@@ -1,37 +1,33 @@
 import os
 import sys
+import time
 import collections
 import itertools
+import multiprocessing
 import cPickle as pickle
 
 import math
 import random
 import numpy as np
-
+from scipy import sparse
 
 from six.moves import xrange  # pylint: disable=redefined-builtin
 from lxml import etree
 
 from structures.sentence_structure import Sentence, Token, Dependency
 from structures.instances import Instance
+import corpus_store
+import knowledge_base
+import instrumentation
+import stage_cache
+from vocabulary import Vocabulary, HashedVocabulary
 
 
 def build_dataset(words, occur_count = None):
     """Process raw inputs into a dataset."""
-    num_total_words = len(set(words))
-    discard_count = 0
-    if occur_count is not None:
-        for c in collections.Counter(words):
-            if collections.Counter(words)[c] < occur_count:
-                discard_count +=1
-
-    num_words = num_total_words - discard_count
-
-    count = []
-    count.extend(collections.Counter(words).most_common(num_words))
-    dictionary = dict()
-    for word, _ in count:
-        dictionary[word] = len(dictionary)
+    vocabulary = Vocabulary(words)
+    count = vocabulary.most_common(occur_count)
+    dictionary = vocabulary.build_dictionary(occur_count)
     data = list()
     for word in words:
         if word in dictionary:
@@ -41,193 +37,326 @@ def build_dataset(words, occur_count = None):
     return data, count, dictionary, reversed_dictionary
 
 
-def build_instances_training(candidate_sentences, distant_interactions,reverse_distant_interactions, entity_1_list = None, entity_2_list = None, symmetric = False):
-    ''' Builds instances for training'''
-    #initialize vocabularies for different features
-    path_word_vocabulary = []
-    words_between_entities_vocabulary = []
-    dep_type_vocabulary = []
-    dep_type_word_elements_vocabulary = []
-    candidate_instances = []
+def get_feature_space_size(dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary):
+    '''Returns number of columns of the feature matrix'''
+    return len(dep_dictionary) + len(dep_path_word_dictionary) + len(dep_element_dictionary) + len(between_word_dictionary)
+
+
+def build_feature_matrix(instances, num_features):
+    '''Builds sparse CSR matrix from the active feature indices of each instance in one pass'''
+    indptr = np.zeros(len(instances) + 1, dtype=np.int64)
+    for i in range(len(instances)):
+        indptr[i + 1] = indptr[i] + len(instances[i].get_features())
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    for i in range(len(instances)):
+        indices[indptr[i]:indptr[i + 1]] = instances[i].get_features()
+    data = np.ones(indptr[-1], dtype=np.float64)
+    instrumentation.count('feature_matrix_rows', len(instances))
+    instrumentation.count('feature_nnz', len(indices))
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(instances), num_features))
+
+
+def build_candidate_pairs(candidate_sentences, entity_1_list = None, entity_2_list = None, label = 0, low_memory = False,
+                          pruner = None):
+    '''Builds forward and reverse instances with the normalized ids of both entities for every entity pair
+    allowed by the id lists. Dependency paths are found here, so the result can be shared by every fold.
+    low_memory drops the dependency structures of each sentence once its instances are built.
+    pruner (pruning.CandidatePruner) removes pairs before their instances are built'''
+    candidate_pairs = []
     for candidate_sentence in candidate_sentences:
         entity_pairs = candidate_sentence.get_entity_pairs()
+        #id lists are checked once per entity token instead of once per pair
+        entity_roles = candidate_sentence.get_entity_roles(entity_1_list, entity_2_list)
 
+        allowed_pairs = []
         for pair in entity_pairs:
-            entity_1_token = candidate_sentence.get_token(pair[0])
-            entity_2_token = candidate_sentence.get_token(pair[1])
-            entity_1 = entity_1_token.get_normalized_ner().split('|')
-            entity_2 = entity_2_token.get_normalized_ner().split('|')
-
-            if entity_1_list is not None:
-                if len(set(entity_1).intersection(entity_1_list)) == 0:
-                    continue
-
-                # check if entity_2 overlaps with entity_1_list if so continue
-                if len(set(entity_2).intersection(entity_1_list)) > 0:
-                    continue
-
-            if entity_2_list is not None:
-                if len(set(entity_2).intersection(entity_2_list)) == 0:
-                    continue
-
-                # check if entity_1 overlaps with entity_2_list if so continue
-                if len(set(entity_1).intersection(entity_2_list)) > 0:
-                    continue
-
-            entity_combos = set(itertools.product(entity_1,entity_2))
-
-            forward_train_instance = Instance(candidate_sentence, pair[0], pair[1], 0)
-            reverse_train_instance = Instance(candidate_sentence, pair[1], pair[0], 0)
-
-            if symmetric is False:
-                # check if check returned true because of reverse
-                if len(entity_combos.intersection(distant_interactions)) > 0:
-                    path_word_vocabulary += forward_train_instance.get_dep_word_path()
-                    words_between_entities_vocabulary += forward_train_instance.get_between_words()
-                    dep_type_word_elements_vocabulary += forward_train_instance.get_dep_type_word_elements()
-                    dep_type_vocabulary.append(' '.join(forward_train_instance.get_type_dependency_path()))
-                    forward_train_instance.set_label(1)
-                    candidate_instances.append(forward_train_instance)
-                elif len(entity_combos.intersection(reverse_distant_interactions)) > 0:
-                    path_word_vocabulary += reverse_train_instance.get_dep_word_path()
-                    words_between_entities_vocabulary += reverse_train_instance.get_between_words()
-                    dep_type_word_elements_vocabulary += reverse_train_instance.get_dep_type_word_elements()
-                    dep_type_vocabulary.append(' '.join(reverse_train_instance.get_type_dependency_path()))
-                    reverse_train_instance.set_label(1)
-                    candidate_instances.append(reverse_train_instance)
-                else:
-                    path_word_vocabulary += forward_train_instance.get_dep_word_path()
-                    path_word_vocabulary += reverse_train_instance.get_dep_word_path()
-                    words_between_entities_vocabulary += forward_train_instance.get_between_words()
-                    words_between_entities_vocabulary += reverse_train_instance.get_between_words()
-                    dep_type_vocabulary.append(' '.join(forward_train_instance.get_type_dependency_path()))
-                    dep_type_vocabulary.append(' '.join(reverse_train_instance.get_type_dependency_path()))
-                    dep_type_word_elements_vocabulary += forward_train_instance.get_dep_type_word_elements()
-                    dep_type_word_elements_vocabulary += reverse_train_instance.get_dep_type_word_elements()
-                    candidate_instances.append(forward_train_instance)
-                    candidate_instances.append(reverse_train_instance)
-
-
-            #if symmetric is true
+            if entity_roles[pair[0]][0] and entity_roles[pair[1]][1]:
+                allowed_pairs.append(pair)
+        instrumentation.count('candidate_sentences')
+        instrumentation.count('entity_pairs', len(entity_pairs))
+        instrumentation.count('id_list_filtered_pairs', len(entity_pairs) - len(allowed_pairs))
+
+        if pruner is not None:
+            num_allowed_pairs = len(allowed_pairs)
+            allowed_pairs = pruner.prune(candidate_sentence, allowed_pairs)
+            instrumentation.count('pruned_pairs', num_allowed_pairs - len(allowed_pairs))
+        instrumentation.count('candidate_instances', 2 * len(allowed_pairs))
+
+        for pair in allowed_pairs:
+            entity_ids = (candidate_sentence.get_entity_ids(pair[0]), candidate_sentence.get_entity_ids(pair[1]))
+
+            forward_instance = Instance(candidate_sentence, pair[0], pair[1], label)
+            reverse_instance = Instance(candidate_sentence, pair[1], pair[0], label)
+            candidate_pairs.append((forward_instance, reverse_instance, entity_ids))
+
+        if low_memory:
+            candidate_sentence.release_dependency_structures()
+
+    return candidate_pairs
+
+#modules whose code decides the candidate pairs of an abstract, part of their cache keys. dependency_graph finds
+#the dependency paths stored with the instances, vocabulary decides how their feature words are counted later
+CANDIDATE_PAIR_MODULES = ['load_data', 'corpus_store', 'pruning', 'vocabulary', 'structures.dependency_graph',
+                          'structures.instances', 'structures.sentence_structure']
+
+def get_abstract_digest(abstracts, key):
+    '''Digest of the sentences of an abstract, corpus stores are hashed without decoding the record'''
+    if isinstance(abstracts, corpus_store.CorpusStore):
+        return stage_cache.get_digest(abstracts.get_record(key))
+    return stage_cache.get_digest(pickle.dumps(abstracts[key], pickle.HIGHEST_PROTOCOL))
+
+def build_abstract_candidate_pairs(abstracts, keys, entity_1_list = None, entity_2_list = None, low_memory = False,
+                                   pruner = None, cache = None):
+    '''Returns dictionary of abstract key to the candidate pairs of its sentences. With a
+    stage_cache.StageCache pairs are read from the cache when the sentences, id lists, pruning settings
+    and code are unchanged, and computed and stored otherwise. Pruning counters only cover computed abstracts'''
+    abstract_pairs = {}
+    if cache is None:
+        for key in keys:
+            abstract_pairs[key] = build_candidate_pairs(abstracts[key], entity_1_list, entity_2_list, low_memory=low_memory,
+                                                        pruner=pruner)
+        return abstract_pairs
+
+    settings_digest = stage_cache.get_digest('candidate_pairs', stage_cache.get_code_version(CANDIDATE_PAIR_MODULES),
+                                             entity_1_list, entity_2_list, low_memory,
+                                             pruner.get_settings() if pruner is not None else None)
+    for key in keys:
+        cache_key = stage_cache.get_digest(settings_digest, get_abstract_digest(abstracts, key))
+        pairs = cache.get(cache_key)
+        if pairs is None:
+            pairs = build_candidate_pairs(abstracts[key], entity_1_list, entity_2_list, low_memory=low_memory,
+                                          pruner=pruner)
+            #stored before labels and features are set, they depend on the knowledge base and folds
+            cache.put(cache_key, pairs)
+            instrumentation.count('stage_cache_misses')
+        else:
+            instrumentation.count('stage_cache_hits')
+        abstract_pairs[key] = pairs
+    return abstract_pairs
+
+def build_instances_training(candidate_sentences, distant_interactions,reverse_distant_interactions, entity_1_list = None, entity_2_list = None, symmetric = False, min_count = None,
+                             feature_bits = None, low_memory = False, pruner = None):
+    ''' Builds instances for training, feature words seen fewer than min_count times are dropped from the dictionaries'''
+    candidate_pairs = build_candidate_pairs(candidate_sentences, entity_1_list, entity_2_list, low_memory=low_memory,
+                                            pruner=pruner)
+    return select_training_instances(candidate_pairs, distant_interactions, reverse_distant_interactions, symmetric, min_count,
+                                     feature_bits)
+
+def select_training_instances(candidate_pairs, distant_interactions, reverse_distant_interactions, symmetric = False, min_count = None,
+                              feature_bits = None, hashed_dep_paths = None):
+    ''' Labels candidate pairs, picks training instances and builds vocabularies and features.
+    If feature_bits is given features are hashed into 2**feature_bits columns per feature family instead of
+    building vocabularies, the returned dictionaries are then HashedVocabulary objects. Passing the
+    hashed_dep_paths returned by a previous call continues from it, so instances can be selected chunk by chunk'''
+    if hashed_dep_paths is not None:
+        dep_type_vocabulary = hashed_dep_paths
+    elif feature_bits is not None:
+        dep_type_vocabulary = HashedVocabulary(feature_bits, track_known=True)
+    else:
+        dep_type_vocabulary = Vocabulary()
+    if symmetric is False:
+        candidate_instances = select_asymmetric_training_instances(candidate_pairs, distant_interactions,
+                                                                   reverse_distant_interactions)
+    else:
+        candidate_instances = []
+        for forward_train_instance, reverse_train_instance, entity_ids in candidate_pairs:
+            if distant_interactions.contains_any(*entity_ids) or \
+                            reverse_distant_interactions.contains_any(*entity_ids):
+                forward_train_instance.set_label(1)
+                reverse_train_instance.set_label(1)
             else:
-                if len(entity_combos.intersection(distant_interactions)) > 0 or \
-                                len(entity_combos.intersection(reverse_distant_interactions)) > 0:
-                    forward_train_instance.set_label(1)
-                    reverse_train_instance.set_label(1)
-                else:
-                    pass
-                dep_type_vocabulary_set = set(dep_type_vocabulary)
-                forward_dep_type_path = ' '.join(forward_train_instance.get_type_dependency_path())
-                reverse_dep_type_path = ' '.join(reverse_train_instance.get_type_dependency_path())
-
-                if forward_dep_type_path in dep_type_vocabulary_set:
-                    dep_type_vocabulary.append(forward_dep_type_path)
-                    path_word_vocabulary += forward_train_instance.get_dep_word_path()
-                    dep_type_word_elements_vocabulary += forward_train_instance.get_dep_type_word_elements()
-                    words_between_entities_vocabulary += forward_train_instance.get_between_words()
-                    candidate_instances.append(forward_train_instance)
-                elif reverse_dep_type_path in dep_type_vocabulary_set:
-                    dep_type_vocabulary.append(reverse_dep_type_path)
-                    path_word_vocabulary += reverse_train_instance.get_dep_word_path()
-                    dep_type_word_elements_vocabulary += reverse_train_instance.get_dep_type_word_elements()
-                    words_between_entities_vocabulary += reverse_train_instance.get_between_words()
-                    candidate_instances.append(reverse_train_instance)
-                else:
-                    dep_type_vocabulary.append(forward_dep_type_path)
-                    path_word_vocabulary += forward_train_instance.get_dep_word_path()
-                    dep_type_word_elements_vocabulary += forward_train_instance.get_dep_type_word_elements()
-                    words_between_entities_vocabulary += forward_train_instance.get_between_words()
-                    candidate_instances.append(forward_train_instance)
-
-
-    data, count, dep_path_word_dictionary, reversed_dictionary = build_dataset(path_word_vocabulary)
-    dep_data, dep_count, dep_dictionary, dep_reversed_dictionary = build_dataset(dep_type_vocabulary)
-    dep_element_data, dep_element_count, dep_element_dictionary, dep_element_reversed_dictionary = build_dataset(dep_type_word_elements_vocabulary)
-    between_data, between_count, between_word_dictionary, between_reversed_dictionary = build_dataset(words_between_entities_vocabulary)
-
-    '''
-    dep_path_word_dictionary = {}
-    array_place = 0
-    for c in count:
-        dep_path_word_dictionary[c[0]] = array_place
-        array_place += 1
-
-    between_word_dictionary = {}
-    array_place = 0
-    for c in between_count:
-        between_word_dictionary[c[0]] = array_place
-        array_place += 1
-    '''
-    print(dep_dictionary)
-    print(dep_path_word_dictionary)
-    print(between_word_dictionary)
-    print(dep_element_dictionary)
+                pass
+            forward_dep_type_path = ' '.join(forward_train_instance.get_type_dependency_path())
+            reverse_dep_type_path = ' '.join(reverse_train_instance.get_type_dependency_path())
+
+            #dependency paths seen so far decide which direction is kept
+            if forward_dep_type_path in dep_type_vocabulary:
+                dep_type_vocabulary.add(forward_dep_type_path)
+                candidate_instances.append(forward_train_instance)
+            elif reverse_dep_type_path in dep_type_vocabulary:
+                dep_type_vocabulary.add(reverse_dep_type_path)
+                candidate_instances.append(reverse_train_instance)
+            else:
+                dep_type_vocabulary.add(forward_dep_type_path)
+                candidate_instances.append(forward_train_instance)
+
+    if feature_bits is not None:
+        if symmetric is False:
+            for ci in candidate_instances:
+                dep_type_vocabulary.add(' '.join(ci.get_type_dependency_path()))
+        dep_dictionary = dep_type_vocabulary
+        dep_path_word_dictionary = HashedVocabulary(feature_bits)
+        dep_element_dictionary = HashedVocabulary(feature_bits)
+        between_word_dictionary = HashedVocabulary(feature_bits)
+    else:
+        #count features of the selected instances, symmetric selection already counted the dependency paths
+        dep_type_vocabulary, path_word_vocabulary, dep_type_word_elements_vocabulary, words_between_entities_vocabulary = \
+            count_feature_words(candidate_instances, dep_type_vocabulary if symmetric else None)
+
+        dep_path_word_dictionary = path_word_vocabulary.build_dictionary(min_count)
+        dep_dictionary = dep_type_vocabulary.build_dictionary(min_count)
+        dep_element_dictionary = dep_type_word_elements_vocabulary.build_dictionary(min_count)
+        between_word_dictionary = words_between_entities_vocabulary.build_dictionary(min_count)
+
+        print(dep_dictionary)
+        print(dep_path_word_dictionary)
+        print(between_word_dictionary)
+        print(dep_element_dictionary)
 
     for ci in candidate_instances:
         ci.build_features(dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary)
 
     return candidate_instances, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary
 
+def select_asymmetric_training_instances(candidate_pairs, distant_interactions, reverse_distant_interactions):
+    '''Labels candidate pairs of a relation with a direction. Pairs in the knowledge base give their
+    positive direction, other pairs give both directions as negatives. Each pair is handled on its own'''
+    candidate_instances = []
+    for forward_train_instance, reverse_train_instance, entity_ids in candidate_pairs:
+        # check if check returned true because of reverse
+        if distant_interactions.contains_any(*entity_ids):
+            forward_train_instance.set_label(1)
+            candidate_instances.append(forward_train_instance)
+        elif reverse_distant_interactions.contains_any(*entity_ids):
+            reverse_train_instance.set_label(1)
+            candidate_instances.append(reverse_train_instance)
+        else:
+            candidate_instances.append(forward_train_instance)
+            candidate_instances.append(reverse_train_instance)
+    return candidate_instances
+
+def count_feature_words(instances, dep_type_vocabulary = None):
+    '''Counts feature words of instances, returns dependency path, path word, element and between word
+    vocabularies. Dependency paths are not counted again if dep_type_vocabulary is given'''
+    path_word_vocabulary = Vocabulary()
+    words_between_entities_vocabulary = Vocabulary()
+    dep_type_word_elements_vocabulary = Vocabulary()
+    count_dep_types = dep_type_vocabulary is None
+    if count_dep_types:
+        dep_type_vocabulary = Vocabulary()
+    for ci in instances:
+        path_word_vocabulary.update(ci.get_dep_word_path())
+        words_between_entities_vocabulary.update(ci.get_between_words())
+        dep_type_word_elements_vocabulary.update(ci.get_dep_type_word_elements())
+        if count_dep_types:
+            dep_type_vocabulary.add(' '.join(ci.get_type_dependency_path()))
+    return dep_type_vocabulary, path_word_vocabulary, dep_type_word_elements_vocabulary, words_between_entities_vocabulary
+
+def count_abstract_features(abstract_keys, abstract_pairs, distant_interactions, reverse_distant_interactions):
+    '''Selects training instances of every abstract once for relations with a direction, where the
+    selection of an abstract doesn't depend on the others. Counts feature words per abstract and builds
+    the feature matrix of all instances in the ids of the total vocabularies, so the training data of a
+    fold can be derived by removing the counts and rows of its held-out abstracts'''
+    abstract_rows = {}
+    abstract_vocabularies = {}
+    total_vocabularies = [Vocabulary() for _ in range(4)]
+    instances = []
+    for key in abstract_keys:
+        abstract_instances = select_asymmetric_training_instances(abstract_pairs[key], distant_interactions,
+                                                                  reverse_distant_interactions)
+        abstract_rows[key] = (len(instances), len(instances) + len(abstract_instances))
+        instances.extend(abstract_instances)
+        abstract_vocabularies[key] = count_feature_words(abstract_instances)
+        for total_vocabulary, abstract_vocabulary in zip(total_vocabularies, abstract_vocabularies[key]):
+            total_vocabulary.merge(abstract_vocabulary)
+
+    total_dictionaries = [vocabulary.build_dictionary() for vocabulary in total_vocabularies]
+    for instance in instances:
+        instance.build_features(*total_dictionaries)
+    return {'abstract_rows': abstract_rows,
+            'abstract_vocabularies': abstract_vocabularies,
+            'total_vocabularies': total_vocabularies,
+            'total_dictionaries': total_dictionaries,
+            'X': build_feature_matrix(instances, get_feature_space_size(*total_dictionaries)),
+            'y': np.array([instance.get_label() for instance in instances])}
+
+def get_fold_training_data(feature_counts, held_out_keys):
+    '''Returns feature matrix, labels and dictionaries of the training instances outside held_out_keys.
+    Vocabularies are the totals minus the held-out counts, ordered like build_dataset, and the matrix
+    columns are remapped from total to fold ids, the result is the same as selecting the fold from scratch'''
+    vocabularies = [vocabulary.copy() for vocabulary in feature_counts['total_vocabularies']]
+    keep = np.ones(feature_counts['X'].shape[0], dtype=bool)
+    for key in held_out_keys:
+        for vocabulary, held_out_vocabulary in zip(vocabularies, feature_counts['abstract_vocabularies'][key]):
+            vocabulary.subtract(held_out_vocabulary)
+        start, end = feature_counts['abstract_rows'][key]
+        keep[start:end] = False
+    dictionaries = [vocabulary.build_dictionary() for vocabulary in vocabularies]
+
+    #total feature id -> fold feature id, words only seen in held-out abstracts are not in any kept row
+    column_map = np.full(feature_counts['X'].shape[1], -1, dtype=np.int32)
+    total_offset = 0
+    fold_offset = 0
+    for total_dictionary, dictionary in zip(feature_counts['total_dictionaries'], dictionaries):
+        for word, feature_id in dictionary.items():
+            column_map[total_offset + total_dictionary[word]] = fold_offset + feature_id
+        total_offset += len(total_dictionary)
+        fold_offset += len(dictionary)
+
+    kept_X = feature_counts['X'][keep]
+    X = sparse.csr_matrix((kept_X.data, column_map[kept_X.indices], kept_X.indptr),
+                          shape=(kept_X.shape[0], get_feature_space_size(*dictionaries)))
+    X.sort_indices()
+    return X, feature_counts['y'][keep], dictionaries
+
+def get_hashing_collision_report(instances, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary):
+    '''Counts distinct feature strings and the hashed columns they use for each feature family of the instances'''
+    families = [('dependency_paths', dep_dictionary, lambda i: [' '.join(i.get_type_dependency_path())]),
+                ('dependency_words', dep_path_word_dictionary, lambda i: i.get_dep_word_path()),
+                ('dependency_elements', dep_element_dictionary, lambda i: i.get_dep_type_word_elements()),
+                ('between_words', between_word_dictionary, lambda i: i.get_between_words())]
+    report = {}
+    for name, hashed_vocabulary, get_words in families:
+        words = set()
+        for instance in instances:
+            words.update(get_words(instance))
+        columns = set(hashed_vocabulary.get_column(w) for w in words)
+        report[name] = {'features': len(words),
+                        'columns_used': len(columns),
+                        'collision_rate': 1.0 - float(len(columns)) / max(len(words), 1)}
+    return report
+
 def build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
-                            distant_interactions,reverse_distant_interactions, entity_1_list =  None, entity_2_list = None, symmetric = False):
+                            distant_interactions,reverse_distant_interactions, entity_1_list =  None, entity_2_list = None, symmetric = False,
+                            low_memory = False, pruner = None):
+    candidate_pairs = build_candidate_pairs(test_sentences, entity_1_list, entity_2_list, low_memory=low_memory, pruner=pruner)
+    return select_testing_instances(candidate_pairs, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary,
+                                    between_word_dictionary, distant_interactions, reverse_distant_interactions, symmetric)
+
+def select_testing_instances(candidate_pairs, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
+                             distant_interactions, reverse_distant_interactions, symmetric = False):
+    ''' Labels candidate pairs, picks test instances and builds their features'''
     test_instances = []
-    for test_sentence in test_sentences:
-        entity_pairs = test_sentence.get_entity_pairs()
+    for forward_test_instance, reverse_test_instance, entity_ids in candidate_pairs:
+        if symmetric is False:
+
+            # check if check returned true because of reverse
+            if distant_interactions.contains_any(*entity_ids) :
+                forward_test_instance.set_label(1)
+            elif reverse_distant_interactions.contains_any(*entity_ids):
+                reverse_test_instance.set_label(1)
+            else:
+                pass
 
-        for pair in entity_pairs:
-            entity_1_token = test_sentence.get_token(pair[0])
-            entity_2_token = test_sentence.get_token(pair[1])
-            entity_1 = entity_1_token.get_normalized_ner().split('|')
-            entity_2 = entity_2_token.get_normalized_ner().split('|')
-            if entity_1_list is not None:
-                if len(set(entity_1).intersection(entity_1_list)) == 0:
-                    continue
-
-                #check if entity_2 overlaps with entity_1_list if so continue
-                if len(set(entity_2).intersection(entity_1_list)) > 0:
-                    continue
-
-            if entity_2_list is not None:
-                if len(set(entity_2).intersection(entity_2_list)) == 0:
-                    continue
-                #check if entity_1 overlaps with entity_2_list if so continue
-                if len(set(entity_1).intersection(entity_2_list)) > 0:
-                   continue
-
-            entity_combos = set(itertools.product(entity_1,entity_2))
-            forward_test_instance = Instance(test_sentence, pair[0], pair[1], 0)
-            reverse_test_instance = Instance(test_sentence, pair[1], pair[0], 0)
-
-
-            if symmetric is False:
-
-                # check if check returned true because of reverse
-                if len(entity_combos.intersection(distant_interactions)) > 0 :
-                    forward_test_instance.set_label(1)
-                elif len(entity_combos.intersection(reverse_distant_interactions)) > 0:
-                    reverse_test_instance.set_label(1)
-                else:
-                    pass
+            test_instances.append(forward_test_instance)
+            test_instances.append(reverse_test_instance)
 
+        #if symmetric is True
+        else:
+            if distant_interactions.contains_any(*entity_ids) or \
+                    reverse_distant_interactions.contains_any(*entity_ids):
+                forward_test_instance.set_label(1)
+                reverse_test_instance.set_label(1)
+
+            forward_dep_type_path = ' '.join(forward_test_instance.get_type_dependency_path())
+            reverse_dep_type_path = ' '.join(reverse_test_instance.get_type_dependency_path())
+
+            if forward_dep_type_path in dep_dictionary:
                 test_instances.append(forward_test_instance)
+            elif reverse_dep_type_path in dep_dictionary:
                 test_instances.append(reverse_test_instance)
-
-            #if symmetric is True
             else:
-                if len(entity_combos.intersection(distant_interactions)) > 0 or \
-                        len(entity_combos.intersection(reverse_distant_interactions)) > 0:
-                    forward_test_instance.set_label(1)
-                    reverse_test_instance.set_label(1)
-
-                forward_dep_type_path = ' '.join(forward_test_instance.get_type_dependency_path())
-                reverse_dep_type_path = ' '.join(reverse_test_instance.get_type_dependency_path())
-
-                if forward_dep_type_path in dep_dictionary:
-                    test_instances.append(forward_test_instance)
-                elif reverse_dep_type_path in dep_dictionary:
-                    test_instances.append(reverse_test_instance)
-                else:
-                    test_instances.append(forward_test_instance)
+                test_instances.append(forward_test_instance)
 
 
     for instance in test_instances:
@@ -235,47 +364,25 @@ def build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictio
 
     return test_instances
 
-def build_instances_predict(predict_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary, entity_1_list = None, entity_2_list = None, symmetric = False):
+def build_instances_predict(predict_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary, entity_1_list = None, entity_2_list = None, symmetric = False,
+                            low_memory = False, pruner = None):
     predict_instances = []
-    for p_sentence in predict_sentences:
-        entity_pairs = p_sentence.get_entity_pairs()
+    candidate_pairs = build_candidate_pairs(predict_sentences, entity_1_list, entity_2_list, -1, low_memory, pruner)
+    for forward_predict_instance, reverse_predict_instance, entity_ids in candidate_pairs:
+        if symmetric is False:
+            predict_instances.append(forward_predict_instance)
+            predict_instances.append(reverse_predict_instance)
+        #if symmetric is True
+        else:
+            forward_dep_type_path = ' '.join(forward_predict_instance.get_type_dependency_path())
+            reverse_dep_type_path = ' '.join(reverse_predict_instance.get_type_dependency_path())
 
-        for pair in entity_pairs:
-            entity_1_token = p_sentence.get_token(pair[0])
-            entity_2_token = p_sentence.get_token(pair[1])
-            entity_1 = entity_1_token.get_normalized_ner().split('|')
-            entity_2 = entity_2_token.get_normalized_ner().split('|')
-            if entity_1_list is not None:
-                if len(set(entity_1).intersection(entity_1_list)) == 0:
-                    continue
-
-                #check if entity_2 overlaps with entity_1_list if so continue
-                if len(set(entity_2).intersection(entity_1_list)) > 0:
-                    continue
-
-            if entity_2_list is not None:
-                if len(set(entity_2).intersection(entity_2_list)) == 0:
-                    continue
-                #check if entity_1 overlaps with entity_2_list if so continue
-                if len(set(entity_1).intersection(entity_2_list)) > 0:
-                   continue
-
-            forward_predict_instance = Instance(p_sentence, pair[0], pair[1], -1)
-            reverse_predict_instance = Instance(p_sentence, pair[1], pair[0], -1)
-            if symmetric is False:
+            if forward_dep_type_path in dep_dictionary:
                 predict_instances.append(forward_predict_instance)
+            elif reverse_dep_type_path in dep_dictionary:
                 predict_instances.append(reverse_predict_instance)
-            #if symmetric is True
             else:
-                forward_dep_type_path = ' '.join(forward_predict_instance.get_type_dependency_path())
-                reverse_dep_type_path = ' '.join(reverse_predict_instance.get_type_dependency_path())
-
-                if forward_dep_type_path in dep_dictionary:
-                    predict_instances.append(forward_predict_instance)
-                elif reverse_dep_type_path in dep_dictionary:
-                    predict_instances.append(reverse_predict_instance)
-                else:
-                    predict_instances.append(forward_predict_instance)
+                predict_instances.append(forward_predict_instance)
 
 
     for instance in predict_instances:
@@ -283,65 +390,75 @@ def build_instances_predict(predict_sentences, dep_dictionary, dep_path_word_dic
 
     return predict_instances
 
+def build_sentence(sentence, entity_1, entity_2):
+    '''builds Sentence object from corenlp sentence element, returns None if sentence has no entity pairs'''
+    candidate_sentence = Sentence(sentence.get('id')) #get candidate sentence
+    tokens = list(sentence.iter('token')) #get tokens for sentence
+
+    for token in tokens:
+        normalized_ner = None
+        ner = token.find('NER').text
+        if token.find('NormalizedNER') is not None:
+            normalized_ner = token.find('NormalizedNER').text
+        #create token objects for sentences. Use to get word, lemma, POS, etc.
+        candidate_token = Token(token.get('id'), token.find('word').text, token.find('lemma').text, token.find('CharacterOffsetBegin').text,
+                                token.find('CharacterOffsetEnd').text, token.find('POS').text, ner, normalized_ner)
+        candidate_sentence.add_token(candidate_token)
+    #gets dependencies between tokens from stanford dependency parse
+    dependencies = list(sentence.iter('dependencies'))
+    basic_dependencies = dependencies[0]
+    #list of all dependencies in sentence
+    deps = list(basic_dependencies.iter('dep'))
+    #generates list of all dependencies within a sentence
+    for d in deps:
+        candidate_dep = Dependency(d.get('type'), candidate_sentence.get_token(d.find('governor').get('idx')), candidate_sentence.get_token(d.find('dependent').get('idx')))
+        candidate_sentence.add_dependency(candidate_dep)
+    #gets entity pairs of sentence
+    candidate_sentence.generate_entity_pairs(entity_1, entity_2)
+    if candidate_sentence.get_entity_pairs() is None:
+        return None
+    #maps token pairs to dependency types
+    candidate_sentence.build_dependency_types()
+    return candidate_sentence
+
+
+def stream_xml(xml_file, entity_1, entity_2):
+    '''yields candidate sentences of xml file one at a time, stanford corenlp parsed format only.
+    Parsed elements are cleared as soon as their sentence is built so memory does not grow with the document'''
+    for event, sentence in etree.iterparse(xml_file, events=('end',), tag=('sentence', 'coreference')):
+        parent = sentence.getparent()
+        # coreference chains are not used, their mentions also contain <sentence> elements holding only
+        # an index. Both are cleared when they end and finished chains are removed from the tree
+        if sentence.tag == 'coreference' or parent is None or parent.tag != 'sentences':
+            sentence.clear()
+            if sentence.tag == 'coreference' and parent is not None:
+                while sentence.getprevious() is not None:
+                    del parent[0]
+            continue
+        candidate_sentence = build_sentence(sentence, entity_1, entity_2)
+        sentence.clear()
+        while sentence.getprevious() is not None:
+            del parent[0]
+        if candidate_sentence is not None:
+            yield candidate_sentence
+
+
 def load_xml(xml_file, entity_1, entity_2):
     '''loads xml file for sentences, stanford corenlp parsed format only'''
-    tree = etree.parse(xml_file)
-    root = tree.getroot()
-    candidate_sentences = []
-    sentences = list(root.iter('sentence'))
-
-
-    for sentence in sentences:
-        candidate_sentence = Sentence(sentence.get('id')) #get candidate sentence
-        tokens = list(sentence.iter('token')) #get tokens for sentence
-
-        for token in tokens:
-            normalized_ner = None
-            ner = token.find('NER').text
-            if token.find('NormalizedNER') is not None:
-                normalized_ner = token.find('NormalizedNER').text
-            #create token objects for sentences. Use to get word, lemma, POS, etc.
-            candidate_token = Token(token.get('id'), token.find('word').text, token.find('lemma').text, token.find('CharacterOffsetBegin').text,
-                                    token.find('CharacterOffsetEnd').text, token.find('POS').text, ner, normalized_ner)
-            candidate_sentence.add_token(candidate_token)
-        #gets dependencies between tokens from stanford dependency parse
-        dependencies = list(sentence.iter('dependencies'))
-        basic_dependencies = dependencies[0]
-        #list of all dependencies in sentence
-        deps = list(basic_dependencies.iter('dep'))
-        #generates list of all dependencies within a sentence
-        for d in deps:
-            candidate_dep = Dependency(d.get('type'), candidate_sentence.get_token(d.find('governor').get('idx')), candidate_sentence.get_token(d.find('dependent').get('idx')))
-            candidate_sentence.add_dependency(candidate_dep)
-        #gets entity pairs of sentence
-        candidate_sentence.generate_entity_pairs(entity_1, entity_2)
-        if candidate_sentence.get_entity_pairs() is not None:
-        #generates dependency matrix
-            candidate_sentence.build_dependency_matrix()
-            candidate_sentences.append(candidate_sentence)
-
-    return candidate_sentences
+    return list(stream_xml(xml_file, entity_1, entity_2))
 
 
 def load_distant_kb(distant_kb_file, column_a, column_b,distant_rel_col):
-    '''Loads data from knowledge base into tuples'''
-    distant_interactions = set()
-    reverse_distant_interactions = set()
-    #reads in lines from kb file
-    file = open(distant_kb_file,'rU')
-    lines = file.readlines()
-    file.close()
-    for l in lines:
-        split_line = l.split('\t')
-        #column_a is entity_1 column_b is entity 2
-        tuple = (split_line[column_a],split_line[column_b])
-        if split_line[distant_rel_col].endswith('by') is False:
-            distant_interactions.add(tuple)
-        else:
-            reverse_distant_interactions.add(tuple)
+    '''Loads knowledge base from a tab separated file, or a directory saved by knowledge_base, into
+    forward and reverse relation indexes that check (entity_1 id, entity_2 id) combinations.
+    A directory raises ValueError if it was built from other columns'''
+    if os.path.isdir(distant_kb_file):
+        kb = knowledge_base.open_knowledge_base(distant_kb_file, (column_a, column_b, distant_rel_col))
+    else:
+        kb = knowledge_base.build_knowledge_base(distant_kb_file, column_a, column_b, distant_rel_col)
 
-    #returns both forward and backward tuples for relations
-    return distant_interactions,reverse_distant_interactions
+    #returns both forward and backward relations
+    return kb.forward, kb.reverse
 
 def load_id_list(id_list,column_a):
     '''loads normalized ids for entities, only called if file given'''
@@ -356,23 +473,125 @@ def load_id_list(id_list,column_a):
 
     return id_set
 
-def load_abstracts_from_directory(directory_folder,entity_1,entity_2):
-    abstract_dict = {}
-    count = 0
+def load_xml_worker(args):
+    '''loads a single xml file inside a worker process, returns its candidate sentences'''
+    xml_file, entity_1, entity_2 = args
+    return load_xml(xml_file, entity_1, entity_2)
+
+
+def list_xml_files(directory_folder):
+    '''returns sorted paths of all xml files in directory so abstract keys are the same across runs'''
+    xml_files = []
     for path, subdirs, files in os.walk(directory_folder):
         for name in files:
             if name.endswith('.xml'):
-                xmlpath = os.path.join(path, name)
-                abstract_sentences = load_xml(xmlpath,entity_1,entity_2)
-                if len(abstract_sentences) > 0:
-                    abstract_dict[count] = abstract_sentences
-                    print(count)
-                    count += 1
-            else:
-                continue
-    #save dictionary to pickle file so you don't have to read them in every time.
-    pickle.dump(abstract_dict, open(directory_folder+'.pkl', "wb"))
-    return abstract_dict
+                xml_files.append(os.path.join(path, name))
+    return sorted(xml_files)
+
+
+def load_abstracts_from_directory(directory_folder,entity_1,entity_2, num_workers = 1):
+    '''parses xml files in directory into corpus store at directory_folder + '.corpus', returns the store.
+    Files already in the store with unchanged size and mtime are not parsed again.
+    New or changed files are parsed in a process pool if num_workers > 1.
+    The store replaces the directory_folder + '.pkl' pickle earlier versions wrote, pass the .corpus
+    path wherever that pickle was used'''
+    store_path = directory_folder.rstrip(os.sep) + '.corpus'
+    previous_store = corpus_store.open_corpus_store(store_path, entity_1, entity_2)
+    xml_files = list_xml_files(directory_folder)
+    file_stats = {}
+    stale_files = []
+    for xmlpath in xml_files:
+        relative_path = os.path.relpath(xmlpath, directory_folder)
+        stat = os.stat(xmlpath)
+        file_stats[xmlpath] = (relative_path, stat.st_size, stat.st_mtime)
+        if previous_store is None or not previous_store.is_current(relative_path, stat.st_size, stat.st_mtime):
+            stale_files.append(xmlpath)
+
+    worker_args = [(xmlpath, entity_1, entity_2) for xmlpath in stale_files]
+    start_time = time.time()
+    pool = None
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        # imap returns results in submission order, keeps keys deterministic
+        parsed_files = pool.imap(load_xml_worker, worker_args, chunksize=8)
+    else:
+        parsed_files = (load_xml_worker(a) for a in worker_args)
+
+    writer = corpus_store.CorpusStoreWriter(store_path, entity_1, entity_2)
+    stale_set = set(stale_files)
+    sentence_count = 0
+    with instrumentation.stage('parse_xml'):
+        try:
+            for xmlpath in xml_files:
+                relative_path, size, mtime = file_stats[xmlpath]
+                if xmlpath in stale_set:
+                    abstract_sentences = next(parsed_files)
+                    sentence_count += len(abstract_sentences)
+                    key = writer.add_abstract(relative_path, size, mtime, abstract_sentences)
+                else:
+                    key = writer.copy_abstract(relative_path, previous_store)
+                if key is not None:
+                    instrumentation.count('abstracts_stored')
+        except BaseException:
+            #no half written records.bin.tmp is left next to the store
+            writer.abort()
+            raise
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if previous_store is not None:
+                previous_store.close()
+        writer.close()
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    instrumentation.count('xml_files', len(xml_files))
+    instrumentation.count('xml_files_parsed', len(stale_files))
+    instrumentation.count('sentences_parsed', sentence_count)
+    print('Parsed ' + str(len(stale_files)) + ' of ' + str(len(xml_files)) + ' files in ' + '%.2f' % elapsed + ' seconds (' +
+          '%.2f' % (len(stale_files) / elapsed) + ' files/sec, ' + '%.2f' % (sentence_count / elapsed) + ' sentences/sec)')
+
+    return corpus_store.CorpusStore(store_path)
+
+def iter_abstracts(abstracts, entity_1, entity_2, num_workers = 1):
+    '''yields (key, candidate sentences) one abstract at a time from a pickle, corpus store or directory of xml files.
+    Directories are parsed file by file without building a store, in a process pool if num_workers > 1.
+    Corpus stores and directories keep one abstract in memory at a time. A pickle can only be loaded whole,
+    so all of its abstracts are in memory until the last one is yielded, use a corpus store for large corpora'''
+    if abstracts.endswith('.pkl'):
+        #the pickle holds one dictionary of every abstract, it can't be read abstract by abstract
+        abstract_dict = load_abstracts_from_pickle(abstracts)
+        for key in sorted(abstract_dict):
+            yield key, abstract_dict[key]
+        return
+    if abstracts.rstrip(os.sep).endswith('.corpus'):
+        store = load_abstracts_from_store(abstracts)
+        for key in store:
+            yield key, store[key]
+        store.close()
+        return
+
+    worker_args = [(xmlpath, entity_1, entity_2) for xmlpath in list_xml_files(abstracts)]
+    pool = None
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        parsed_files = pool.imap(load_xml_worker, worker_args, chunksize=8)
+    else:
+        parsed_files = (load_xml_worker(a) for a in worker_args)
+    key = 0
+    try:
+        for abstract_sentences in parsed_files:
+            if len(abstract_sentences) > 0:
+                yield key, abstract_sentences
+                key += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def load_abstracts_from_store(store_path):
+    '''opens corpus store, abstracts are only read from disk when accessed by key'''
+    return corpus_store.CorpusStore(store_path)
 
 def load_abstracts_from_pickle(pickle_file):
     abstract_dict = pickle.load( open(pickle_file, "rb" ) )
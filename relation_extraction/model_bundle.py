@@ -0,0 +1,158 @@
+import os
+import json
+
+import numpy as np
+import six
+from scipy.special import expit
+from sklearn.externals import joblib
+
+from vocabulary import HashedVocabulary
+
+#on disk layout of a model bundle directory, every .npy file is memory mapped when the bundle is opened
+#so worker processes share the pages:
+#   bundle.json                  format version, feature mode and layout of the feature families
+#   coef.npy, intercept.npy, classes.npy   weights of the binary linear model
+#   <family>_words.npy           sorted utf-8 feature words of a dictionary family
+#   <family>_ids.npy             feature id of each word, same order as the words
+#   <family>_known_columns.npy   hashed families that track known columns (dependency paths)
+FORMAT_VERSION = 1
+BUNDLE_FILE = 'bundle.json'
+FEATURE_FAMILIES = ['dep_path', 'dep_word', 'dep_element', 'between_word']
+
+
+def encode_word(word):
+    if isinstance(word, six.text_type):
+        return word.encode('utf-8')
+    return word
+
+
+class StringTable(object):
+    def __init__(self, words, ids):
+        '''Read only feature dictionary over a sorted array of words, looked up by binary search.
+        Supports the in, [] and len operations build_features uses on dictionaries'''
+        self.words = words
+        self.ids = ids
+
+    def find(self, word):
+        '''Returns position of word in the table or None. Nothing is remembered between lookups,
+        the table is shared by the request threads of the prediction server'''
+        key = encode_word(word)
+        position = int(np.searchsorted(self.words, key))
+        if position >= len(self.words) or self.words[position] != key:
+            return None
+        return position
+
+    def __contains__(self, word):
+        return self.find(word) is not None
+
+    def __getitem__(self, word):
+        position = self.find(word)
+        if position is None:
+            raise KeyError(word)
+        return int(self.ids[position])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def items(self):
+        for position in range(len(self.words)):
+            yield self.words[position].decode('utf-8'), int(self.ids[position])
+
+
+class LinearModel(object):
+    def __init__(self, coef, intercept, classes):
+        '''Scores feature matrices with the weights of a binary logistic model, same outputs as
+        predict, predict_proba and classes_ of the sklearn model the weights come from'''
+        self.coef = coef
+        self.intercept = intercept
+        self.classes_ = classes
+
+    def decision_function(self, X):
+        return X.dot(self.coef) + self.intercept
+
+    def predict_proba(self, X):
+        positive = expit(self.decision_function(X))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(np.int64)]
+
+
+def save_dictionary(bundle_path, family, dictionary):
+    '''Writes one feature family, returns its description for bundle.json'''
+    if isinstance(dictionary, HashedVocabulary):
+        description = {'type': 'hashed', 'num_bits': dictionary.num_bits, 'track_known': dictionary.track_known}
+        if dictionary.track_known:
+            np.save(os.path.join(bundle_path, family + '_known_columns.npy'),
+                    np.array(sorted(dictionary.known_columns), dtype=np.int64))
+        return description
+    entries = sorted((encode_word(word), feature_id) for word, feature_id in dictionary.items())
+    words = np.array([e[0] for e in entries], dtype=np.bytes_)
+    if len(entries) == 0:
+        words = np.zeros(0, dtype='S1')
+    np.save(os.path.join(bundle_path, family + '_words.npy'), words)
+    np.save(os.path.join(bundle_path, family + '_ids.npy'), np.array([e[1] for e in entries], dtype=np.int32))
+    return {'type': 'dictionary', 'size': len(entries)}
+
+
+def load_dictionary(bundle_path, family, description):
+    if description['type'] == 'hashed':
+        dictionary = HashedVocabulary(description['num_bits'], description['track_known'])
+        if description['track_known']:
+            known_columns = np.load(os.path.join(bundle_path, family + '_known_columns.npy'))
+            dictionary.known_columns = set(known_columns.tolist())
+        return dictionary
+    return StringTable(np.load(os.path.join(bundle_path, family + '_words.npy'), mmap_mode='r'),
+                       np.load(os.path.join(bundle_path, family + '_ids.npy'), mmap_mode='r'))
+
+
+def save_model_bundle(bundle_path, model, dep_dictionary, dep_word_dictionary, dep_element_dictionary,
+                      between_word_dictionary):
+    '''Writes model and feature dictionaries as a bundle directory, only binary linear models
+    (LogisticRegression, SGDClassifier with log loss) can be stored'''
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.ndim != 2 or coef.shape[0] != 1 or len(model.classes_) != 2:
+        raise ValueError('model bundles only hold binary linear models')
+    if not os.path.isdir(bundle_path):
+        os.makedirs(bundle_path)
+    np.save(os.path.join(bundle_path, 'coef.npy'), coef[0])
+    np.save(os.path.join(bundle_path, 'intercept.npy'), np.asarray(model.intercept_, dtype=np.float64))
+    np.save(os.path.join(bundle_path, 'classes.npy'), np.asarray(model.classes_))
+    families = {}
+    dictionaries = [dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary]
+    for family, dictionary in zip(FEATURE_FAMILIES, dictionaries):
+        families[family] = save_dictionary(bundle_path, family, dictionary)
+    bundle = {'version': FORMAT_VERSION,
+              'model_type': type(model).__name__,
+              'num_features': int(coef.shape[1]),
+              'families': families}
+    out = open(os.path.join(bundle_path, BUNDLE_FILE), 'w')
+    json.dump(bundle, out, indent=2, sort_keys=True)
+    out.close()
+
+
+def open_model_bundle(bundle_path):
+    '''Returns (model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary)
+    like the joblib model file, arrays stay on disk until they are used'''
+    bundle_file = open(os.path.join(bundle_path, BUNDLE_FILE))
+    bundle = json.load(bundle_file)
+    bundle_file.close()
+    if bundle.get('version') != FORMAT_VERSION:
+        raise ValueError('unsupported model bundle version ' + str(bundle.get('version')) + ' in ' + bundle_path)
+    model = LinearModel(np.load(os.path.join(bundle_path, 'coef.npy'), mmap_mode='r'),
+                        np.load(os.path.join(bundle_path, 'intercept.npy')),
+                        np.load(os.path.join(bundle_path, 'classes.npy')))
+    dictionaries = [load_dictionary(bundle_path, family, bundle['families'][family]) for family in FEATURE_FAMILIES]
+    return tuple([model] + dictionaries)
+
+
+def load_model(model_file):
+    '''Loads model and dictionaries from a bundle directory or a joblib file'''
+    if os.path.isdir(model_file):
+        return open_model_bundle(model_file)
+    return joblib.load(model_file)
+
+
+def convert_model(model_file, bundle_path):
+    '''Converts joblib model file written by training into a bundle directory'''
+    save_model_bundle(bundle_path, *joblib.load(model_file))
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy import sparse
+from sklearn.linear_model import SGDClassifier
+from sklearn.externals import joblib
+from sklearn import metrics
+
+import load_data
+import instrumentation
+
+
+def write_instance_chunk(chunk_folder, chunk_number, instances, num_features):
+    '''Saves labels and sparse features of a chunk of training instances, returns path of chunk file'''
+    X = load_data.build_feature_matrix(instances, num_features)
+    y = np.array([i.get_label() for i in instances], dtype=np.int8)
+    chunk_file = os.path.join(chunk_folder, 'chunk_' + str(chunk_number) + '.npz')
+    np.savez(chunk_file, indptr=X.indptr, indices=X.indices, labels=y)
+    return chunk_file
+
+
+def load_instance_chunk(chunk_file, num_features):
+    '''Loads features and labels saved by write_instance_chunk'''
+    chunk = np.load(chunk_file)
+    indptr = chunk['indptr']
+    indices = chunk['indices']
+    X = sparse.csr_matrix((np.ones(len(indices), dtype=np.float64), indices, indptr), shape=(len(indptr) - 1, num_features))
+    return X, chunk['labels']
+
+
+def spill_training_chunks(abstracts, chunk_folder, distant_interactions, reverse_distant_interactions, entity_1, entity_1_ids,
+                          entity_2, entity_2_ids, symmetric, feature_bits, chunk_size, num_workers = 1, pruner = None):
+    '''Streams abstracts once, finds dependency paths, labels and hashes features, and writes
+    training instances to chunk files of chunk_size instances. Only one chunk is held in memory'''
+    hashed_dep_paths = None
+    dictionaries = None
+    chunk_files = []
+    chunk = []
+    instance_count = 0
+    positive_count = 0
+    for abstract_key, abstract_sentences in load_data.iter_abstracts(abstracts, entity_1, entity_2, num_workers):
+        candidate_pairs = load_data.build_candidate_pairs(abstract_sentences, entity_1_ids, entity_2_ids, pruner=pruner)
+        result = load_data.select_training_instances(candidate_pairs, distant_interactions, reverse_distant_interactions,
+                                                     symmetric, feature_bits=feature_bits, hashed_dep_paths=hashed_dep_paths)
+        abstract_instances = result[0]
+        dictionaries = result[1:]
+        hashed_dep_paths = dictionaries[0]
+        for instance in abstract_instances:
+            chunk.append(instance)
+            positive_count += instance.get_label() == 1
+            if len(chunk) >= chunk_size:
+                chunk_files.append(write_instance_chunk(chunk_folder, len(chunk_files), chunk, load_data.get_feature_space_size(*dictionaries)))
+                instance_count += len(chunk)
+                chunk = []
+    if len(chunk) > 0:
+        chunk_files.append(write_instance_chunk(chunk_folder, len(chunk_files), chunk, load_data.get_feature_space_size(*dictionaries)))
+        instance_count += len(chunk)
+    print('Number of Instances')
+    print(instance_count)
+    print('Number of Positive Instances')
+    print(positive_count)
+    instrumentation.count('training_instances', instance_count)
+    instrumentation.count('positive_training_instances', positive_count)
+    instrumentation.count('training_chunks', len(chunk_files))
+    if pruner is not None:
+        print('Candidate pruning')
+        print(pruner.get_report())
+    return chunk_files, dictionaries
+
+
+def out_of_core_train(model_out, abstracts, distant_file, distant_e1_col, distant_e2_col, distant_rel_col, entity_1,
+                      entity_1_file, entity_1_col, entity_2, entity_2_file, entity_2_col, symmetric, num_workers = 1,
+                      feature_bits = 20, chunk_size = 10000, epochs = 5, pruner = None, seed = 0):
+    '''Distant training that never holds the whole training set. Instances are built and hashed in a single
+    streaming pass and spilled to disk in chunks, then a logistic regression is trained with SGD partial_fit
+    over the chunks for several epochs, shuffling chunk order and instances inside each chunk every epoch.
+    The saved model has the same layout as distant_train so prediction can load it'''
+    if entity_1_file.upper() != "NONE":
+        entity_1_ids = load_data.load_id_list(entity_1_file, entity_1_col)
+    else:
+        entity_1_ids = None
+    if entity_2_file.upper() != "NONE":
+        entity_2_ids = load_data.load_id_list(entity_2_file, entity_2_col)
+    else:
+        entity_2_ids = None
+    distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(distant_file, distant_e1_col,
+                                                                                   distant_e2_col, distant_rel_col)
+
+    chunk_folder = tempfile.mkdtemp(prefix='relation_extraction_chunks_')
+    try:
+        with instrumentation.stage('spill_training_chunks'):
+            chunk_files, dictionaries = spill_training_chunks(abstracts, chunk_folder, distant_interactions,
+                                                              reverse_distant_interactions, entity_1, entity_1_ids,
+                                                              entity_2, entity_2_ids, symmetric, feature_bits, chunk_size,
+                                                              num_workers, pruner)
+        if len(chunk_files) == 0:
+            raise ValueError('no training instances found in ' + abstracts)
+        num_features = load_data.get_feature_space_size(*dictionaries)
+
+        random_state = np.random.RandomState(seed)
+        model = SGDClassifier(loss='log', random_state=seed)
+        classes = np.array([0, 1])
+        for epoch in range(epochs):
+            #progressive validation: each chunk is scored before the model learns from it
+            epoch_loss = 0.0
+            scored = 0
+            for c in random_state.permutation(len(chunk_files)):
+                with instrumentation.stage('load_chunk'):
+                    X, y = load_instance_chunk(chunk_files[c], num_features)
+                order = random_state.permutation(X.shape[0])
+                X = X[order]
+                y = y[order]
+                if hasattr(model, 'coef_'):
+                    epoch_loss += metrics.log_loss(y, model.predict_proba(X), labels=classes) * X.shape[0]
+                    scored += X.shape[0]
+                with instrumentation.stage('sgd_partial_fit'):
+                    model.partial_fit(X, y, classes=classes)
+            if scored > 0:
+                print('Epoch ' + str(epoch) + ' progressive log loss: ' + str(epoch_loss / scored))
+    finally:
+        shutil.rmtree(chunk_folder)
+
+    print('length of feature space')
+    print(num_features)
+    joblib.dump((model,) + tuple(dictionaries), model_out)
+    print("trained model")
+    return model
@@ -0,0 +1,317 @@
+import io
+import sys
+import json
+import time
+import threading
+
+import numpy as np
+from lxml import etree
+from six.moves import BaseHTTPServer, socketserver, queue
+
+import load_data
+import model_bundle
+from relation_extraction import build_prediction_record
+
+
+class InvalidDocumentError(ValueError):
+    '''Request body is not a CoreNLP xml document the sentences can be read from'''
+
+
+class ServerStats(object):
+    def __init__(self):
+        '''Latency and throughput counters shared by request threads and the batching thread'''
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.instances = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add_request(self, latency, error = False):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def add_batch(self, num_requests, num_instances):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += num_requests
+            self.instances += num_instances
+
+    def to_dict(self):
+        with self.lock:
+            uptime = max(time.time() - self.start_time, 1e-6)
+            return {'uptime_seconds': uptime,
+                    'requests': self.requests,
+                    'errors': self.errors,
+                    'instances': self.instances,
+                    'batches': self.batches,
+                    'mean_requests_per_batch': float(self.batched_requests) / max(self.batches, 1),
+                    'mean_instances_per_batch': float(self.instances) / max(self.batches, 1),
+                    'mean_latency_seconds': self.total_latency / max(self.requests, 1),
+                    'max_latency_seconds': self.max_latency,
+                    'requests_per_second': self.requests / uptime,
+                    'instances_per_second': self.instances / uptime}
+
+
+class MicroBatcher(object):
+    def __init__(self, model, num_features, stats, max_batch_size = 1024, max_wait = 0.005):
+        '''Coalesces instances of concurrent requests into one predict_proba call.
+        A batch is scored when it holds max_batch_size instances or max_wait seconds after its first request'''
+        self.model = model
+        self.num_features = num_features
+        self.stats = stats
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.positive_column = list(model.classes_).index(1)
+        self.jobs = queue.Queue()
+        #no job is queued behind the stop sentinel once stopped is set under the lock
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def predict(self, instances):
+        '''Blocks until instances are scored, returns predicted labels and positive probabilities'''
+        if len(instances) == 0:
+            return np.array([]), np.array([])
+        job = {'instances': instances, 'done': threading.Event()}
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError('prediction batcher is stopped')
+            self.jobs.put(job)
+        job['done'].wait()
+        if 'error' in job:
+            raise job['error']
+        return job['labels'], job['probabilities']
+
+    def stop(self):
+        '''Scores the jobs queued before the call, later predict calls raise RuntimeError'''
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.jobs.put(None)
+        self.thread.join()
+
+    def run(self):
+        try:
+            self.score_jobs()
+        finally:
+            self.fail_queued_jobs()
+
+    def fail_queued_jobs(self):
+        '''Releases callers of jobs that were not scored when the batching thread ended'''
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job['error'] = RuntimeError('prediction batcher stopped before the job was scored')
+                job['done'].set()
+
+    def score_jobs(self):
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            batch_size = len(job['instances'])
+            deadline = time.time() + self.max_wait
+            while batch_size < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+                batch_size += len(job['instances'])
+            self.score_batch(batch, batch_size)
+
+    def score_batch(self, batch, batch_size):
+        instances = []
+        for job in batch:
+            instances.extend(job['instances'])
+        try:
+            probabilities = self.model.predict_proba(load_data.build_feature_matrix(instances, self.num_features))
+            labels = self.model.classes_[np.argmax(probabilities, axis=1)]
+            offset = 0
+            for job in batch:
+                end = offset + len(job['instances'])
+                job['labels'] = labels[offset:end]
+                job['probabilities'] = probabilities[offset:end, self.positive_column]
+                offset = end
+        except Exception as e:
+            for job in batch:
+                job['error'] = e
+        self.stats.add_batch(len(batch), batch_size)
+        for job in batch:
+            job['done'].set()
+
+
+class PredictionService(object):
+    def __init__(self, model_file, entity_1, entity_1_ids, entity_2, entity_2_ids, symmetric,
+                 max_batch_size = 1024, max_wait = 0.005):
+        '''Loads the model bundle once and turns CoreNLP xml documents into scored instances'''
+        self.model, self.dep_dictionary, self.dep_word_dictionary, self.dep_element_dictionary, \
+            self.between_word_dictionary = model_bundle.load_model(model_file)
+        self.entity_1 = entity_1
+        self.entity_1_ids = entity_1_ids
+        self.entity_2 = entity_2
+        self.entity_2_ids = entity_2_ids
+        self.symmetric = symmetric
+        self.stats = ServerStats()
+        num_features = load_data.get_feature_space_size(self.dep_dictionary, self.dep_word_dictionary,
+                                                        self.dep_element_dictionary, self.between_word_dictionary)
+        self.batcher = MicroBatcher(self.model, num_features, self.stats, max_batch_size, max_wait)
+
+    def read_sentences(self, xml_document):
+        '''Candidate sentences of a CoreNLP xml document (bytes), InvalidDocumentError if they can't be read'''
+        try:
+            return list(load_data.stream_xml(io.BytesIO(xml_document), self.entity_1, self.entity_2))
+        except etree.XMLSyntaxError as e:
+            raise InvalidDocumentError('invalid xml: ' + str(e))
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+            #missing token fields or dependencies, find() returns None for absent elements
+            raise InvalidDocumentError('not a CoreNLP xml document: ' + repr(e))
+
+    def predict_xml(self, xml_document, document_id = 0):
+        '''Returns prediction records for every instance of a CoreNLP xml document (bytes)'''
+        sentences = self.read_sentences(xml_document)
+        instances = load_data.build_instances_predict(sentences, self.dep_dictionary, self.dep_word_dictionary,
+                                                      self.dep_element_dictionary, self.between_word_dictionary,
+                                                      self.entity_1_ids, self.entity_2_ids, self.symmetric)
+        labels, probabilities = self.batcher.predict(instances)
+        records = []
+        for i in range(len(instances)):
+            records.append(build_prediction_record(document_id, instances[i], labels[i], probabilities[i]))
+        return records
+
+    def stop(self):
+        self.batcher.stop()
+
+
+class PredictionRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''POST /predict with a CoreNLP xml document as body, GET /stats for counters'''
+
+    def send_json(self, status, content):
+        body = json.dumps(content, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self.send_json(200, self.server.service.stats.to_dict())
+        else:
+            self.send_json(404, {'error': 'unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/predict':
+            self.send_json(404, {'error': 'unknown path ' + self.path})
+            return
+        start_time = time.time()
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.server.service.stats.add_request(time.time() - start_time, True)
+            self.send_json(400, {'error': 'invalid Content-Length'})
+            return
+        document = self.rfile.read(content_length)
+        try:
+            records = self.server.service.predict_xml(document, self.server.next_document_id())
+        except InvalidDocumentError as e:
+            self.server.service.stats.add_request(time.time() - start_time, True)
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            #model or scoring failures are errors of the server, not of the request
+            self.server.service.stats.add_request(time.time() - start_time, True)
+            self.send_json(500, {'error': str(e)})
+            return
+        self.server.service.stats.add_request(time.time() - start_time)
+        self.send_json(200, {'predictions': records})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        '''Threaded http server, each request thread waits on the shared micro batcher'''
+        BaseHTTPServer.HTTPServer.__init__(self, address, PredictionRequestHandler)
+        self.service = service
+        self.document_lock = threading.Lock()
+        self.document_count = 0
+
+    def next_document_id(self):
+        with self.document_lock:
+            self.document_count += 1
+            return self.document_count
+
+
+def start_server(service, host = '127.0.0.1', port = 0):
+    '''Starts server in a background thread, port 0 picks a free port (server.server_address has the result)'''
+    server = PredictionServer((host, port), service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    '''python prediction_server.py model_file entity_1 entity_1_file entity_1_col entity_2 entity_2_file entity_2_col
+    symmetric [port] [max_batch_size] [max_wait_ms]'''
+    model_file = sys.argv[1]
+    entity_1 = sys.argv[2].upper()
+    entity_1_file = sys.argv[3]
+    entity_1_col = int(sys.argv[4])
+    entity_2 = sys.argv[5].upper()
+    entity_2_file = sys.argv[6]
+    entity_2_col = int(sys.argv[7])
+    symmetric = sys.argv[8].upper() in ['TRUE', 'Y', 'YES']
+    port = int(sys.argv[9]) if len(sys.argv) > 9 else 8000
+    max_batch_size = int(sys.argv[10]) if len(sys.argv) > 10 else 1024
+    max_wait = float(sys.argv[11]) / 1000 if len(sys.argv) > 11 else 0.005
+
+    if entity_1_file.upper() != "NONE":
+        entity_1_ids = load_data.load_id_list(entity_1_file, entity_1_col)
+    else:
+        entity_1_ids = None
+    if entity_2_file.upper() != "NONE":
+        entity_2_ids = load_data.load_id_list(entity_2_file, entity_2_col)
+    else:
+        entity_2_ids = None
+
+    service = PredictionService(model_file, entity_1, entity_1_ids, entity_2, entity_2_ids, symmetric,
+                                max_batch_size, max_wait)
+    server = PredictionServer(('127.0.0.1', port), service)
+    print('serving on http://127.0.0.1:' + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import collections
+
+#order the rules are applied in, each candidate is counted under the first rule that removes it
+PRUNING_RULES = ['token_distance', 'path_length', 'duplicate_ids', 'pair_cap']
+
+
+class CandidatePruner(object):
+    def __init__(self, max_token_distance = None, max_path_length = None, max_pairs_per_sentence = None,
+                 dedup_normalized_ids = False):
+        '''Removes entity pairs of a sentence before instances are built. Rules left as None are off.
+        max_path_length counts dependency edges, pairs without a path are kept like before.
+        dedup_normalized_ids keeps the first pair of each combination of normalized ids in a sentence.
+        max_pairs_per_sentence keeps the pairs closest in the sentence'''
+        self.max_token_distance = max_token_distance
+        self.max_path_length = max_path_length
+        self.max_pairs_per_sentence = max_pairs_per_sentence
+        self.dedup_normalized_ids = dedup_normalized_ids
+        self.counters = collections.Counter()
+
+    def prune(self, sentence, pairs):
+        '''Returns the (start, end) token positions of pairs that are kept, in their original order.
+        pairs are the candidates of one sentence that passed the id list filters'''
+        self.counters['sentences'] += 1
+        self.counters['candidates'] += len(pairs)
+        kept = []
+        seen_ids = set()
+        for pair in pairs:
+            if self.max_token_distance is not None and abs(pair[0] - pair[1]) > self.max_token_distance:
+                self.counters['token_distance'] += 1
+                continue
+            if self.max_path_length is not None:
+                #path search trees are cached on the sentence, the instances reuse them
+                path = sentence.get_shortest_path(pair[0], pair[1])
+                if len(path) - 1 > self.max_path_length:
+                    self.counters['path_length'] += 1
+                    continue
+            if self.dedup_normalized_ids:
+                ids = (sentence.get_token(pair[0]).get_normalized_ner(), sentence.get_token(pair[1]).get_normalized_ner())
+                if ids in seen_ids:
+                    self.counters['duplicate_ids'] += 1
+                    continue
+                seen_ids.add(ids)
+            kept.append(pair)
+
+        if self.max_pairs_per_sentence is not None and len(kept) > self.max_pairs_per_sentence:
+            closest = sorted(range(len(kept)), key=lambda i: abs(kept[i][0] - kept[i][1]))[:self.max_pairs_per_sentence]
+            self.counters['pair_cap'] += len(kept) - self.max_pairs_per_sentence
+            kept = [kept[i] for i in sorted(closest)]
+
+        self.counters['kept'] += len(kept)
+        return kept
+
+    def get_report(self):
+        '''Returns counts of candidates, kept pairs and pairs removed by each rule'''
+        report = {'sentences': self.counters['sentences'],
+                  'candidates': self.counters['candidates'],
+                  'kept': self.counters['kept']}
+        for rule in PRUNING_RULES:
+            report['removed_' + rule] = self.counters[rule]
+        return report
+
+    def reset(self):
+        self.counters.clear()
+
+    def get_settings(self):
+        '''Returns the rule thresholds, pruned candidates depend on nothing else'''
+        return {'max_token_distance': self.max_token_distance,
+                'max_path_length': self.max_path_length,
+                'max_pairs_per_sentence': self.max_pairs_per_sentence,
+                'dedup_normalized_ids': self.dedup_normalized_ids}
+
+
+def parse_pruning_options(options):
+    '''Builds pruner from a command line string like max_distance=20,max_path=6,max_pairs=50,dedup.
+    Returns None for NONE or an empty string'''
+    if options is None or options.upper() in ['', 'NONE']:
+        return None
+    settings = {}
+    for option in options.split(','):
+        name, _, value = option.strip().partition('=')
+        name = name.lower()
+        if name == 'max_distance':
+            settings['max_token_distance'] = int(value)
+        elif name == 'max_path':
+            settings['max_path_length'] = int(value)
+        elif name == 'max_pairs':
+            settings['max_pairs_per_sentence'] = int(value)
+        elif name == 'dedup':
+            settings['dedup_normalized_ids'] = True
+        else:
+            raise ValueError('unknown pruning option ' + option)
+    return CandidatePruner(**settings)
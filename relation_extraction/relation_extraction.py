@@ -1,13 +1,25 @@
+import io
 import sys
+import json
 import operator
 
 import load_data
+import out_of_core
+import pruning
+import knowledge_base
+import model_bundle
+import instrumentation
+import stage_cache
 
 import random
 import itertools
+import multiprocessing
 
+import six
 import structures
 import numpy as np
+import matplotlib
+matplotlib.use('Agg') #no display needed, plots are saved to files
 import matplotlib.pyplot as plt
 import cPickle as pickle
 
@@ -20,158 +32,279 @@ from sklearn.model_selection import cross_val_score
 from sklearn import metrics
 
 
+def get_indexed_positions(index, label, norm_ids):
+    '''Returns positions of instances with the given label that have any of the normalized ids in index'''
+    positions = set()
+    for norm_id in norm_ids:
+        positions.update(index.get((label, norm_id), []))
+    return positions
+
 def create_instance_groupings(group_instances, symmetric):
+    '''Groups instances that mention the same normalized entities. Each instance only visits the
+    instances sharing a normalized id with it (found through inverted indexes of start and end ids),
+    in list order, so the groups are the same as comparing every pair of instances'''
 
     instance_to_group_dict = {}
     group_to_instance_dict = {}
     instance_dict = {}
     group = 0
 
-    for ig in group_instances:
-        start_norm = set(ig.get_sentence().get_token(ig.get_start()).get_normalized_ner().split('|'))
-        end_norm = set(ig.get_sentence().get_token(ig.get_end()).get_normalized_ner().split('|'))
+    #(label, normalized id) -> positions of instances with that id at their start/end entity
+    start_index = collections.defaultdict(list)
+    end_index = collections.defaultdict(list)
+    for position, ig in enumerate(group_instances):
+        #ids were split once per token when the sentence was built
+        start_norm = set(ig.get_sentence().get_entity_ids(ig.get_start()))
+        end_norm = set(ig.get_sentence().get_entity_ids(ig.get_end()))
         instance_dict[ig] = [start_norm, end_norm]
         instance_to_group_dict[ig] = group
         group += 1
+        for norm_id in start_norm:
+            start_index[(ig.get_label(), norm_id)].append(position)
+        for norm_id in end_norm:
+            end_index[(ig.get_label(), norm_id)].append(position)
 
-    for instance_1 in group_instances:
+    for position_1, instance_1 in enumerate(group_instances):
         max_val_start = 0
         max_val_end = 0
-        for instance_2 in group_instances:
+        label = instance_1.get_label()
+        start_1, end_1 = instance_dict[instance_1]
+
+        #only instances with the same label sharing ids with instance_1 can change its group
+        candidates = get_indexed_positions(start_index, label, start_1) & get_indexed_positions(end_index, label, end_1)
+        if symmetric is True:
+            candidates |= get_indexed_positions(start_index, label, end_1) & get_indexed_positions(end_index, label, start_1)
+        candidates.discard(position_1)
+
+        for position_2 in sorted(candidates):
+            instance_2 = group_instances[position_2]
+            start_2, end_2 = instance_dict[instance_2]
 
             recent_update = False
 
-            if instance_1 == instance_2 or instance_1.get_label() != instance_2.get_label():
-                continue
-
-            if len(instance_dict[instance_1][0].intersection(instance_dict[instance_2][0])) > 0 and \
-                            len(instance_dict[instance_1][1].intersection(instance_dict[instance_2][1])) > 0:
-                if len(instance_dict[instance_1][0].intersection(
-                        instance_dict[instance_2][0])) > max_val_start and \
-                                len(instance_dict[instance_1][1].intersection(
-                                    instance_dict[instance_2][1])) > max_val_end:
-                    max_val_start = len(instance_dict[instance_1][0].intersection(instance_dict[instance_2][0]))
-                    max_val_end = len(instance_dict[instance_1][1].intersection(instance_dict[instance_2][1]))
+            forward_start_overlap = len(start_1.intersection(start_2))
+            forward_end_overlap = len(end_1.intersection(end_2))
+            if forward_start_overlap > 0 and forward_end_overlap > 0:
+                if forward_start_overlap > max_val_start and forward_end_overlap > max_val_end:
+                    max_val_start = forward_start_overlap
+                    max_val_end = forward_end_overlap
                     instance_to_group_dict[instance_1] = instance_to_group_dict[instance_2]
                     recent_update = True
 
             # check reverse direction if relation is symmetric and the forward direction wasn't incorporated
             if symmetric is True and recent_update is False:
-                if len(instance_dict[instance_1][1].intersection(instance_dict[instance_2][0])) > 0 and \
-                                len(instance_dict[instance_1][0].intersection(
-                                    instance_dict[instance_2][1])) > 0:
-                    if len(instance_dict[instance_1][1].intersection(
-                            instance_dict[instance_2][0])) > max_val_start and \
-                                    len(instance_dict[instance_1][0].intersection(
-                                        instance_dict[instance_2][1])) > max_val_end:
-                        max_val_start = len(
-                            instance_dict[instance_1][1].intersection(instance_dict[instance_2][0]))
-                        max_val_end = len(
-                            instance_dict[instance_1][0].intersection(instance_dict[instance_2][1]))
+                reverse_start_overlap = len(end_1.intersection(start_2))
+                reverse_end_overlap = len(start_1.intersection(end_2))
+                if reverse_start_overlap > 0 and reverse_end_overlap > 0:
+                    if reverse_start_overlap > max_val_start and reverse_end_overlap > max_val_end:
+                        max_val_start = reverse_start_overlap
+                        max_val_end = reverse_end_overlap
                         instance_to_group_dict[instance_1] = instance_to_group_dict[instance_2]
 
-    for ig in instance_to_group_dict:
+    for ig in group_instances:
         if instance_to_group_dict[ig] not in group_to_instance_dict:
             group_to_instance_dict[instance_to_group_dict[ig]] = []
         group_to_instance_dict[instance_to_group_dict[ig]].append(ig)
 
     return instance_to_group_dict, group_to_instance_dict, instance_dict
 
-def k_fold_cross_validation(k,sentences_dict, distant_interactions, reverse_distant_interactions, entity_1_ids, entity_2_ids, symmetric):
-
-    training_list = sorted(sentences_dict.iterkeys())
-
-
-    #split training sentences for cross validation
-    ten_fold_length = len(training_list)/k
-    print(ten_fold_length)
-    all_chunks = [training_list[i:i + ten_fold_length] for i in xrange(0, len(training_list), ten_fold_length)]
-
-
+def score_instance_groups(model, instances, group_ids, num_features):
+    '''Scores all instances with one predict_proba call and combines them per group with noisy-or.
+    group_ids must be non decreasing. Returns label and probability of every group whose instances share one label'''
+    if len(instances) == 0:
+        return np.array([], dtype=np.float64), np.array([], dtype=np.float64)
+    group_ids = np.asarray(group_ids)
+    labels = np.array([i.label for i in instances], dtype=np.float64)
+    predicted_prob = model.predict_proba(load_data.build_feature_matrix(instances, num_features))[:, 1]
+
+    group_starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+    noisy_or = 1 - np.multiply.reduceat(1 - predicted_prob, group_starts)
+    #groups with mixed labels are left out of the evaluation
+    single_label = np.minimum.reduceat(labels, group_starts) == np.maximum.reduceat(labels, group_starts)
+    return labels[group_starts][single_label], noisy_or[single_label]
+
+def write_pr_report(total_test, total_predicted_prob, report_prefix, feature_mode = 'dictionary'):
+    '''Writes precision recall curve (tsv and png) and summary metrics (json) of cross validation'''
+    positives = collections.Counter(total_test)[1]
+    accuracy = float(positives) / total_test.size if total_test.size > 0 else 0.0
+    if positives > 0:
+        precision, recall, thresholds = metrics.precision_recall_curve(total_test, total_predicted_prob, 1)
+        average_precision = float(metrics.average_precision_score(total_test, total_predicted_prob))
+        pr_auc = float(metrics.auc(recall, precision))
+    else:
+        #no test groups or no positive group, the curve is undefined and the report stays empty
+        precision, recall, thresholds = np.array([]), np.array([]), np.array([])
+        average_precision = None
+        pr_auc = None
+
+    curve_file = open(report_prefix + '_pr_curve.tsv', 'w')
+    curve_file.write('threshold\tprecision\trecall\n')
+    for i in range(len(thresholds)):
+        curve_file.write(repr(float(thresholds[i])) + '\t' + repr(float(precision[i])) + '\t' + repr(float(recall[i])) + '\n')
+    curve_file.close()
+
+    summary = {'feature_mode': feature_mode,
+               'groups': int(total_test.size),
+               'positive_groups': int(positives),
+               'baseline_precision': accuracy,
+               'average_precision': average_precision,
+               'pr_auc': pr_auc}
+    summary_file = open(report_prefix + '_cv_summary.json', 'w')
+    json.dump(summary, summary_file, indent=2, sort_keys=True)
+    summary_file.close()
+
+    plt.figure()
+    plt.step(recall, precision, color='b', alpha=0.2, where='post')
+    plt.fill_between(recall, precision, step='post', alpha=0.2,
+                         color='b')
 
-    total_test = np.array([])
-    total_predicted_prob = np.array([])
-    for i in range(len(all_chunks)):
-        #print('building')
-        print('Fold #: ' + str(i))
-        fold_chunks = all_chunks[:]
-        fold_test_abstracts = fold_chunks.pop(i)
-        fold_training_abstracts = list(itertools.chain.from_iterable(fold_chunks))
-        fold_training_sentences = []
-        for key in fold_training_abstracts:
-            fold_training_sentences = fold_training_sentences + sentences_dict[key]
-        print(len(fold_training_sentences))
+    plt.plot((0.0, 1.0), (accuracy, accuracy))
 
-        fold_training_instances, fold_dep_dictionary, fold_dep_word_dictionary, fold_dep_element_dictionary, fold_between_word_dictionary = load_data.build_instances_training(
-            fold_training_sentences, distant_interactions, reverse_distant_interactions, entity_1_ids, entity_2_ids, symmetric)
+    plt.xlabel('Recall')
+    plt.ylabel('Precision')
+    plt.ylim([0.0, 1.05])
+    plt.xlim([0.0, 1.0])
+    plt.savefig(report_prefix + '_pr_curve.png')
+    plt.close()
+    return summary
+
+#state shared with fold worker processes, set before the pool forks so instances are not pickled
+_k_fold_state = {}
+
+def run_fold(i):
+    '''Trains on every chunk except chunk i, returns labels and noisy-or probabilities of the entity groups in chunk i'''
+    all_chunks = _k_fold_state['all_chunks']
+    abstract_pairs = _k_fold_state['abstract_pairs']
+    distant_interactions = _k_fold_state['distant_interactions']
+    reverse_distant_interactions = _k_fold_state['reverse_distant_interactions']
+    symmetric = _k_fold_state['symmetric']
+    feature_bits = _k_fold_state['feature_bits']
+
+    print('Fold #: ' + str(i))
+    fold_chunks = all_chunks[:]
+    fold_test_abstracts = fold_chunks.pop(i)
+    fold_training_abstracts = list(itertools.chain.from_iterable(fold_chunks))
+    print(sum(len(abstract_pairs[key]) for key in fold_training_abstracts))
+
+    if _k_fold_state.get('feature_counts') is not None:
+        #vocabularies and features of the training abstracts are derived from the totals and the held-out fold
+        with instrumentation.stage('fold_select_instances'):
+            fold_train_X, fold_train_y, fold_dictionaries = load_data.get_fold_training_data(
+                _k_fold_state['feature_counts'], fold_test_abstracts)
+        fold_dep_dictionary, fold_dep_word_dictionary, fold_dep_element_dictionary, fold_between_word_dictionary = fold_dictionaries
+        print(fold_train_X.shape[0])
+        fold_num_features = fold_train_X.shape[1]
+    else:
+        fold_training_pairs = list(itertools.chain.from_iterable(abstract_pairs[key] for key in fold_training_abstracts))
+        with instrumentation.stage('fold_select_instances'):
+            fold_training_instances, fold_dep_dictionary, fold_dep_word_dictionary, fold_dep_element_dictionary, fold_between_word_dictionary = load_data.select_training_instances(
+                fold_training_pairs, distant_interactions, reverse_distant_interactions, symmetric, feature_bits=feature_bits)
 
         #print('# of train instances: ' + str(len(fold_training_instances)))
         print(len(fold_training_instances))
 
         #train model
-        X = []
+        fold_num_features = load_data.get_feature_space_size(fold_dep_dictionary, fold_dep_word_dictionary,
+                                                             fold_dep_element_dictionary, fold_between_word_dictionary)
         y = []
         for t in fold_training_instances:
-            X.append(t.features)
             y.append(t.label)
 
 
-        fold_train_X = np.array(X)
+        with instrumentation.stage('fold_vectorize'):
+            fold_train_X = load_data.build_feature_matrix(fold_training_instances, fold_num_features)
         fold_train_y = np.array(y)
 
-        model = LogisticRegression()
+    model = LogisticRegression()
+    with instrumentation.stage('fold_train'):
         model.fit(fold_train_X, fold_train_y)
 
+    #instances of the same entity group are kept next to each other, group ids increase along the list
+    fold_test_instances = []
+    fold_group_ids = []
+    group_offset = 0
+    for key in fold_test_abstracts:
+        abstract_test_instances = load_data.select_testing_instances(abstract_pairs[key], fold_dep_dictionary, fold_dep_word_dictionary,fold_dep_element_dictionary,
+                                                                     fold_between_word_dictionary,distant_interactions,reverse_distant_interactions,symmetric)
+
+        instance_to_group_dict, group_to_instance_dict, instance_dict = create_instance_groupings(abstract_test_instances,symmetric)
+
+        for g in sorted(group_to_instance_dict):
+            for ti in group_to_instance_dict[g]:
+                fold_test_instances.append(ti)
+                fold_group_ids.append(group_offset)
+            group_offset += 1
+
+    with instrumentation.stage('fold_score'):
+        return score_instance_groups(model, fold_test_instances, fold_group_ids, fold_num_features)
+
+def k_fold_cross_validation(k,sentences_dict, distant_interactions, reverse_distant_interactions, entity_1_ids, entity_2_ids, symmetric, num_workers = 1,
+                            report_prefix = 'cross_validation', feature_bits = None, low_memory = False, pruner = None,
+                            abstract_pairs = None):
+    '''Cross validation over abstracts, folds are run in a process pool if num_workers > 1.
+    Instances and dependency paths of each abstract are built once and shared by every fold.
+    Precision recall curve and summary metrics are written to files starting with report_prefix.
+    feature_bits switches the folds to hashed features, low_memory drops dependency structures of sentences
+    once their instances are built, pruner removes entity pairs before instances are built.
+    abstract_pairs (from load_data.build_abstract_candidate_pairs) skips building the candidate pairs'''
 
-        for key in fold_test_abstracts:
-            fold_test_sentences = sentences_dict[key]
-            fold_test_instances = load_data.build_instances_testing(fold_test_sentences, fold_dep_dictionary, fold_dep_word_dictionary,fold_dep_element_dictionary,
-                                                                fold_between_word_dictionary,distant_interactions,reverse_distant_interactions, entity_1_ids,entity_2_ids,symmetric)
-
-            instance_to_group_dict, group_to_instance_dict, instance_dict = create_instance_groupings(fold_test_instances,symmetric)
-
-
-            for g in group_to_instance_dict:
-                group_X = []
-                group_y = []
-                for ti in group_to_instance_dict[g]:
-                    group_X.append(ti.features)
-                    group_y.append(ti.label)
-
-                group_test_X = np.array(group_X)
-                group_test_y = np.unique(group_y)
-
-                if group_test_y.size == 1:
-                    total_test = np.append(total_test, group_test_y[0])
-                else:
-                    continue
-                    print('error')
-                #total_test = np.append(total_test,group_y)
-
-                predicted_prob = model.predict_proba(group_test_X)[:, 1]
-                negation_predicted_prob = 1 - predicted_prob
-                noisy_or = 1 - np.prod(negation_predicted_prob)
-                total_predicted_prob = np.append(total_predicted_prob, noisy_or)
-
-                # Generate precision recall curves
+    training_list = sorted(sentences_dict.iterkeys())
 
-    positives = collections.Counter(total_test)[1]
-    accuracy = float(positives) / total_test.size
-    precision, recall, _ = metrics.precision_recall_curve(total_test, total_predicted_prob, 1)
-    plt.step(recall, precision, color='b', alpha=0.2, where='post')
-    plt.fill_between(recall, precision, step='post', alpha=0.2,
-                         color='b')
 
-    plt.plot((0.0, 1.0), (accuracy, accuracy))
+    #split training sentences for cross validation
+    ten_fold_length = len(training_list)/k
+    print(ten_fold_length)
+    all_chunks = [training_list[i:i + ten_fold_length] for i in xrange(0, len(training_list), ten_fold_length)]
 
-    plt.xlabel('Recall')
-    plt.ylabel('Precision')
-    plt.ylim([0.0, 1.05])
-    plt.xlim([0.0, 1.0])
-    plt.show()
+    if abstract_pairs is None:
+        with instrumentation.stage('cv_build_candidate_pairs'):
+            abstract_pairs = load_data.build_abstract_candidate_pairs(sentences_dict, training_list, entity_1_ids,
+                                                                      entity_2_ids, low_memory, pruner)
+        if pruner is not None:
+            print('Candidate pruning')
+            print(pruner.get_report())
+            pruner.reset()
+
+    #with dictionary features and a directed relation each abstract's instances are selected and counted once,
+    #symmetric selection depends on the paths of the abstracts before it and hashed features have no vocabularies
+    feature_counts = None
+    if symmetric is False and feature_bits is None:
+        with instrumentation.stage('cv_count_features'):
+            feature_counts = load_data.count_abstract_features(training_list, abstract_pairs, distant_interactions,
+                                                               reverse_distant_interactions)
+
+    _k_fold_state.update({'all_chunks': all_chunks, 'abstract_pairs': abstract_pairs, 'symmetric': symmetric,
+                          'feature_counts': feature_counts,
+                          'feature_bits': feature_bits,
+                          'distant_interactions': distant_interactions,
+                          'reverse_distant_interactions': reverse_distant_interactions})
+    #stages inside run_fold are only recorded when folds run in this process
+    try:
+        with instrumentation.stage('cv_folds'):
+            if num_workers > 1:
+                pool = multiprocessing.Pool(num_workers)
+                try:
+                    # map keeps fold order so the aggregated results match a sequential run
+                    fold_results = pool.map(run_fold, range(len(all_chunks)))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                fold_results = [run_fold(i) for i in range(len(all_chunks))]
+    finally:
+        _k_fold_state.clear()
+
+    total_test = np.concatenate([r[0] for r in fold_results])
+    total_predicted_prob = np.concatenate([r[1] for r in fold_results])
+
+    # Generate precision recall curves
+    feature_mode = 'dictionary' if feature_bits is None else 'hashed_' + str(feature_bits) + '_bits'
+    summary = write_pr_report(total_test, total_predicted_prob, report_prefix, feature_mode)
+    print(summary)
+    return total_test, total_predicted_prob
 
 def predict_sentences(model_file, abstracts, entity_1, entity_1_file, entity_1_col,
-                      entity_2, entity_2_file, entity_2_col, symmetric):
+                      entity_2, entity_2_file, entity_2_col, symmetric, num_workers = 1, pruner = None):
     if entity_1_file.upper() != "NONE":
         entity_1_ids = load_data.load_id_list(entity_1_file, entity_1_col)
     else:
@@ -182,10 +315,13 @@ def predict_sentences(model_file, abstracts, entity_1, entity_1_file, entity_1_c
         entity_2_ids = None
 
 
-    if abstracts.endswith('.pkl'):
-        predict_abstract_sentences = load_data.load_abstracts_from_pickle(abstracts)
-    else:
-        predict_abstract_sentences = load_data.load_abstracts_from_directory(abstracts, entity_1, entity_2)
+    with instrumentation.stage('load_corpus'):
+        if abstracts.endswith('.pkl'):
+            predict_abstract_sentences = load_data.load_abstracts_from_pickle(abstracts)
+        elif abstracts.rstrip('/').endswith('.corpus'):
+            predict_abstract_sentences = load_data.load_abstracts_from_store(abstracts)
+        else:
+            predict_abstract_sentences = load_data.load_abstracts_from_directory(abstracts, entity_1, entity_2, num_workers)
 
     predict_candidate_sentences = []
     for key in predict_abstract_sentences:
@@ -193,21 +329,23 @@ def predict_sentences(model_file, abstracts, entity_1, entity_1_file, entity_1_c
 
 
 
-    model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary = joblib.load(model_file)
-    predict_instances = load_data.build_instances_predict(predict_candidate_sentences, dep_dictionary,
-                                                          dep_word_dictionary, dep_element_dictionary,
-                                                          between_word_dictionary, entity_1_ids, entity_2_ids,
-                                                          symmetric)
+    with instrumentation.stage('load_model'):
+        model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary = model_bundle.load_model(model_file)
+    with instrumentation.stage('build_predict_instances'):
+        predict_instances = load_data.build_instances_predict(predict_candidate_sentences, dep_dictionary,
+                                                              dep_word_dictionary, dep_element_dictionary,
+                                                              between_word_dictionary, entity_1_ids, entity_2_ids,
+                                                              symmetric, pruner=pruner)
 
-    X = []
     instance_sentences = set()
     for p in predict_instances:
-        X.append(p.features)
         instance_sentences.add(p.get_sentence())
 
-    X_predict = np.array(X)
-
-    predicted_labels = model.predict(X_predict)
+    num_features = load_data.get_feature_space_size(dep_dictionary, dep_word_dictionary, dep_element_dictionary,
+                                                    between_word_dictionary)
+    with instrumentation.stage('predict'):
+        X_predict = load_data.build_feature_matrix(predict_instances, num_features)
+        predicted_labels = model.predict(X_predict)
     print('Number of Sentences')
     print(len(instance_sentences))
     print('Number of Instances')
@@ -215,10 +353,114 @@ def predict_sentences(model_file, abstracts, entity_1, entity_1_file, entity_1_c
     return predict_instances, predicted_labels
 
 
+def get_entity_mention(sentence, token_position):
+    '''Returns token positions of the entity mention containing token_position'''
+    for entity_type in sentence.get_entities():
+        for mention in sentence.get_entities()[entity_type]:
+            if token_position in mention:
+                return mention
+    return [token_position]
+
+PREDICTION_FIELDS = ['abstract', 'sentence_id', 'start', 'end', 'start_mention', 'end_mention',
+                     'start_normalized_ner', 'end_normalized_ner', 'label', 'probability', 'sentence']
+
+def build_prediction_record(abstract_key, instance, label, probability):
+    '''Returns dictionary describing one scored instance'''
+    sentence = instance.get_sentence()
+    start_mention = get_entity_mention(sentence, instance.get_start())
+    end_mention = get_entity_mention(sentence, instance.get_end())
+    return {'abstract': abstract_key,
+            'sentence_id': sentence.sentence_id,
+            'start': instance.get_start(),
+            'end': instance.get_end(),
+            'start_mention': ' '.join(sentence.get_token(a).get_word() for a in start_mention),
+            'end_mention': ' '.join(sentence.get_token(b).get_word() for b in end_mention),
+            'start_normalized_ner': sentence.get_token(instance.get_start()).get_normalized_ner(),
+            'end_normalized_ner': sentence.get_token(instance.get_end()).get_normalized_ner(),
+            'label': int(label),
+            'probability': float(probability),
+            'sentence': sentence.get_sentence_string().strip()}
+
+def format_prediction_field(value):
+    '''Text of one tsv field, floats are written with repr so they keep the precision of the jsonl output'''
+    if isinstance(value, float):
+        return six.text_type(repr(value))
+    return six.text_type(value).replace(u'\t', u' ')
+
+def write_prediction_chunk(outfile, output_format, model, chunk, num_features):
+    '''Scores a chunk of (abstract key, instance) with one predict_proba call and writes one line per instance'''
+    instances = [instance for abstract_key, instance in chunk]
+    probabilities = model.predict_proba(load_data.build_feature_matrix(instances, num_features))
+    labels = model.classes_[np.argmax(probabilities, axis=1)]
+    positive_column = list(model.classes_).index(1)
+    for i in range(len(chunk)):
+        record = build_prediction_record(chunk[i][0], chunk[i][1], labels[i], probabilities[i, positive_column])
+        if output_format == 'jsonl':
+            outfile.write(six.text_type(json.dumps(record, sort_keys=True)) + u'\n')
+        else:
+            outfile.write(u'\t'.join(format_prediction_field(record[f]) for f in PREDICTION_FIELDS) + u'\n')
+    outfile.flush()
+
+def stream_predictions(model_file, abstracts, entity_1, entity_1_file, entity_1_col,
+                       entity_2, entity_2_file, entity_2_col, symmetric, out_file, output_format = 'tsv',
+                       chunk_size = 1000, num_workers = 1, pruner = None):
+    '''Predicts relations abstract by abstract, scoring and writing instances in chunks of chunk_size
+    so memory stays bounded and results appear in out_file while the run progresses.
+    Memory is only bounded for corpus stores and xml directories, a .pkl corpus is loaded whole'''
+    if entity_1_file.upper() != "NONE":
+        entity_1_ids = load_data.load_id_list(entity_1_file, entity_1_col)
+    else:
+        entity_1_ids = None
+    if entity_2_file.upper() != "NONE":
+        entity_2_ids = load_data.load_id_list(entity_2_file, entity_2_col)
+    else:
+        entity_2_ids = None
+
+    with instrumentation.stage('load_model'):
+        model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary = model_bundle.load_model(model_file)
+    num_features = load_data.get_feature_space_size(dep_dictionary, dep_word_dictionary, dep_element_dictionary,
+                                                    between_word_dictionary)
+
+    outfile = io.open(out_file, 'w', encoding='utf-8', buffering=1024 * 1024)
+    if output_format != 'jsonl':
+        outfile.write(u'\t'.join(six.text_type(f) for f in PREDICTION_FIELDS) + u'\n')
+    instance_count = 0
+    chunk = []
+    for abstract_key, abstract_sentences in load_data.iter_abstracts(abstracts, entity_1, entity_2, num_workers):
+        with instrumentation.stage('build_predict_instances'):
+            abstract_instances = load_data.build_instances_predict(abstract_sentences, dep_dictionary, dep_word_dictionary,
+                                                                   dep_element_dictionary, between_word_dictionary,
+                                                                   entity_1_ids, entity_2_ids, symmetric, pruner=pruner)
+        for instance in abstract_instances:
+            chunk.append((abstract_key, instance))
+            if len(chunk) >= chunk_size:
+                with instrumentation.stage('score_and_write'):
+                    write_prediction_chunk(outfile, output_format, model, chunk, num_features)
+                instance_count += len(chunk)
+                chunk = []
+    if len(chunk) > 0:
+        with instrumentation.stage('score_and_write'):
+            write_prediction_chunk(outfile, output_format, model, chunk, num_features)
+        instance_count += len(chunk)
+    instrumentation.count('predicted_instances', instance_count)
+    outfile.close()
+    print('Number of Instances')
+    print(instance_count)
+    if pruner is not None:
+        print('Candidate pruning')
+        print(pruner.get_report())
+    return instance_count
+
+
 def distant_train(model_out, abstracts, distant_file, distant_e1_col, distant_e2_col, distant_rel_col, entity_1,
                   entity_1_file, entity_1_col,
-                  entity_2, entity_2_file, entity_2_col, symmetric):
-    '''Method for distantly training the data'''
+                  entity_2, entity_2_file, entity_2_col, symmetric, num_workers = 1, feature_bits = None, low_memory = False,
+                  pruner = None, cache = None):
+    '''Method for distantly training the data, feature_bits trains on hashed features instead of dictionaries.
+    low_memory drops dependency structures of sentences once their instances are built.
+    pruner (pruning.CandidatePruner) removes entity pairs before instances are built.
+    Candidate pairs are built once for cross validation and the final model, with cache
+    (stage_cache.StageCache) they are kept across runs so a new knowledge base only repeats labelling'''
 
     #following is used to help differentiate genes that are both Human and Virus
     #get normalized ids for entity_1 optional
@@ -233,41 +475,68 @@ def distant_train(model_out, abstracts, distant_file, distant_e1_col, distant_e2
         entity_2_ids = None
 
     #load the distant knowledge base
-    distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(distant_file, distant_e1_col,
-                                                                                   distant_e2_col, distant_rel_col)
+    with instrumentation.stage('load_knowledge_base'):
+        distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(distant_file, distant_e1_col,
+                                                                                       distant_e2_col, distant_rel_col)
     #load the sentence data
-    if abstracts.endswith('.pkl'):
-        training_abstract_sentences = load_data.load_abstracts_from_pickle(abstracts)
-    else:
-        training_sentences = load_data.load_abstracts_from_directory(abstracts, entity_1, entity_2)
+    with instrumentation.stage('load_corpus'):
+        if abstracts.endswith('.pkl'):
+            training_abstract_sentences = load_data.load_abstracts_from_pickle(abstracts)
+        elif abstracts.rstrip('/').endswith('.corpus'):
+            training_abstract_sentences = load_data.load_abstracts_from_store(abstracts)
+        else:
+            training_abstract_sentences = load_data.load_abstracts_from_directory(abstracts, entity_1, entity_2, num_workers)
     print(len(training_abstract_sentences))
-
-    k_fold_cross_validation(10,training_abstract_sentences,distant_interactions,reverse_distant_interactions, entity_1_ids, entity_2_ids,symmetric)
-
-
-
-
-    training_sentences = []
+    instrumentation.count('abstracts', len(training_abstract_sentences))
+
+    with instrumentation.stage('build_candidate_pairs'):
+        abstract_pairs = load_data.build_abstract_candidate_pairs(training_abstract_sentences, list(training_abstract_sentences),
+                                                                  entity_1_ids, entity_2_ids, low_memory, pruner, cache)
+    if pruner is not None:
+        print('Candidate pruning')
+        print(pruner.get_report())
+    if cache is not None:
+        print('Stage cache')
+        print(cache.get_report())
+
+    with instrumentation.stage('cross_validation'):
+        k_fold_cross_validation(10,training_abstract_sentences,distant_interactions,reverse_distant_interactions, entity_1_ids, entity_2_ids,symmetric, num_workers,
+                                model_out, low_memory=low_memory, pruner=pruner, abstract_pairs=abstract_pairs)
+    if feature_bits is not None:
+        #same folds with hashed features to compare against the dictionary features
+        with instrumentation.stage('cross_validation_hashed'):
+            k_fold_cross_validation(10,training_abstract_sentences,distant_interactions,reverse_distant_interactions, entity_1_ids, entity_2_ids,symmetric, num_workers,
+                                    model_out + '_hashed', feature_bits, low_memory, pruner, abstract_pairs)
+
+    training_pairs = []
     for key in training_abstract_sentences:
-        training_sentences = training_sentences + training_abstract_sentences[key]
-
+        training_pairs.extend(abstract_pairs[key])
 
-    training_instances, dep_dictionary, dep_word_dictionary, element_dictionary, between_word_dictionary = load_data.build_instances_training(
-        training_sentences, distant_interactions, reverse_distant_interactions, entity_1_ids, entity_2_ids, symmetric)
+    with instrumentation.stage('build_training_instances'):
+        training_instances, dep_dictionary, dep_word_dictionary, element_dictionary, between_word_dictionary = load_data.select_training_instances(
+            training_pairs, distant_interactions, reverse_distant_interactions, symmetric, feature_bits=feature_bits)
+    if feature_bits is not None:
+        print('Hashed feature collisions')
+        print(load_data.get_hashing_collision_report(training_instances, dep_dictionary, dep_word_dictionary, element_dictionary,
+                                                     between_word_dictionary))
 
-    X = []
     y = []
     instance_sentences = set()
     for t in training_instances:
         instance_sentences.add(t.get_sentence())
-        X.append(t.features)
         y.append(t.label)
 
-    X_train = np.array(X)
+    num_features = load_data.get_feature_space_size(dep_dictionary, dep_word_dictionary, element_dictionary,
+                                                    between_word_dictionary)
+    with instrumentation.stage('vectorize'):
+        X_train = load_data.build_feature_matrix(training_instances, num_features)
     y_train = np.ravel(y)
+    instrumentation.count('training_instances', len(training_instances))
+    instrumentation.count('positive_training_instances', y.count(1))
 
     model = LogisticRegression()
-    model.fit(X_train, y_train)
+    with instrumentation.stage('train'):
+        model.fit(X_train, y_train)
     print('Number of Sentences')
     print(len(instance_sentences))
     print('Number of Instances')
@@ -284,15 +553,15 @@ def distant_train(model_out, abstracts, distant_file, distant_e1_col, distant_e2
     print('Number of elements')
     print(len(element_dictionary))
     print('length of feature space')
-    print(len(dep_dictionary) + len(dep_word_dictionary) + len(element_dictionary) + len(between_word_dictionary))
-    joblib.dump((model, dep_dictionary, dep_word_dictionary, element_dictionary, between_word_dictionary), model_out)
+    print(num_features)
+    with instrumentation.stage('save_model'):
+        joblib.dump((model, dep_dictionary, dep_word_dictionary, element_dictionary, between_word_dictionary), model_out)
 
     print("trained model")
 
 
-def main():
-    ''' Main method, mode determines whether program runs training, testing, or prediction'''
-    mode = sys.argv[1] #what option
+def run_mode(mode):
+    '''Runs training, testing, or prediction depending on mode, the other arguments are read from sys.argv'''
     if mode.upper() == "DISTANT_TRAIN":
         model_out = sys.argv[2] #location of where model should be saved after training
         sentence_file = sys.argv[3] #xml file of sentences from Stanford Parser
@@ -307,11 +576,68 @@ def main():
         entity_2_file = sys.argv[12] #entity_2 file location
         entity_2_col = int(sys.argv[13]) #column for entity 2
         symmetric = sys.argv[14].upper() in ['TRUE', 'Y', 'YES'] #is the relation symmetrical (i.e. binds)
+        num_workers = int(sys.argv[15]) if len(sys.argv) > 15 else 1 #optional number of processes for xml parsing and cross validation folds
+        feature_bits = None #optional bits per feature family for hashed features, NONE for dictionaries
+        if len(sys.argv) > 16 and sys.argv[16].upper() != "NONE":
+            feature_bits = int(sys.argv[16])
+        low_memory = len(sys.argv) > 17 and sys.argv[17].upper() in ['TRUE', 'Y', 'YES'] #optional, drop dependency graphs after path search
+        #optional candidate pruning, e.g. max_distance=20,max_path=6,max_pairs=50,dedup
+        pruner = pruning.parse_pruning_options(sys.argv[18]) if len(sys.argv) > 18 else None
+        #optional folder of the stage cache and its size limit in MB, candidate pairs are reused across runs
+        cache = None
+        if len(sys.argv) > 19 and sys.argv[19].upper() != "NONE":
+            cache_mb = float(sys.argv[20]) if len(sys.argv) > 20 else stage_cache.DEFAULT_MAX_MB
+            cache = stage_cache.StageCache(sys.argv[19], cache_mb)
 
         #calls training method
         distant_train(model_out, sentence_file, distant_file, distant_e1_col, distant_e2_col, distant_rel_col, entity_1,
                       entity_1_file, entity_1_col,
-                      entity_2, entity_2_file, entity_2_col, symmetric)
+                      entity_2, entity_2_file, entity_2_col, symmetric, num_workers, feature_bits, low_memory, pruner,
+                      cache)
+
+    elif mode.upper() == "OUT_OF_CORE_TRAIN":
+        model_out = sys.argv[2]
+        sentence_file = sys.argv[3] #directory of xml files, corpus store or pickle, streamed one abstract at a time
+        distant_file = sys.argv[4]
+        distant_e1_col = int(sys.argv[5])
+        distant_e2_col = int(sys.argv[6])
+        distant_rel_col = int(sys.argv[7])
+        entity_1 = sys.argv[8].upper()
+        entity_1_file = sys.argv[9]
+        entity_1_col = int(sys.argv[10])
+        entity_2 = sys.argv[11].upper()
+        entity_2_file = sys.argv[12]
+        entity_2_col = int(sys.argv[13])
+        symmetric = sys.argv[14].upper() in ['TRUE', 'Y', 'YES']
+        num_workers = int(sys.argv[15]) if len(sys.argv) > 15 else 1 #optional number of xml parsing processes
+        feature_bits = int(sys.argv[16]) if len(sys.argv) > 16 else 20 #bits per feature family, features are always hashed
+        chunk_size = int(sys.argv[17]) if len(sys.argv) > 17 else 10000 #instances per chunk on disk and per sgd update
+        epochs = int(sys.argv[18]) if len(sys.argv) > 18 else 5 #passes over the chunks
+        pruner = pruning.parse_pruning_options(sys.argv[19]) if len(sys.argv) > 19 else None #optional candidate pruning
+
+        out_of_core.out_of_core_train(model_out, sentence_file, distant_file, distant_e1_col, distant_e2_col,
+                                      distant_rel_col, entity_1, entity_1_file, entity_1_col, entity_2, entity_2_file,
+                                      entity_2_col, symmetric, num_workers, feature_bits, chunk_size, epochs, pruner)
+
+    elif mode.upper() == "BUILD_KB":
+        distant_file = sys.argv[2] #tab separated distant supervision knowledge base
+        distant_e1_col = int(sys.argv[3])
+        distant_e2_col = int(sys.argv[4])
+        distant_rel_col = int(sys.argv[5])
+        kb_out = sys.argv[6] #directory, can be given instead of the knowledge base file when training
+
+        kb = knowledge_base.build_knowledge_base(distant_file, distant_e1_col, distant_e2_col, distant_rel_col)
+        kb.save(kb_out)
+        print('Number of Entities')
+        print(len(kb.entity_table))
+        print('Number of Relations')
+        print(len(kb.forward) + len(kb.reverse))
+
+    elif mode.upper() == "CONVERT_MODEL":
+        model_file = sys.argv[2] #joblib model file written by DISTANT_TRAIN or OUT_OF_CORE_TRAIN
+        bundle_out = sys.argv[3] #directory, can be given instead of the model file when predicting
+
+        model_bundle.convert_model(model_file, bundle_out)
 
     elif mode.upper() == "TEST":
         model_file = sys.argv[2]
@@ -336,37 +662,38 @@ def main():
         entity_2_file = sys.argv[8]
         entity_2_col = int(sys.argv[9])
         symmetric = sys.argv[10].upper() in ['TRUE', 'Y', 'YES']
+        num_workers = int(sys.argv[11]) if len(sys.argv) > 11 else 1 #optional number of xml parsing processes
 
-        predicted_instances, predicted_labels = predict_sentences(model_file, sentence_file, entity_1, entity_1_file,
-                                                                  entity_1_col,
-                                                                  entity_2, entity_2_file, entity_2_col, symmetric)
-
-        outfile = open('/Users/kiblawi/Workspace/Data/predicted_sentences.txt', 'w')
-        for i in range(len(predicted_labels)):
-            pi = predicted_instances[i]
-            sp = []
-            ep = []
-            for e in pi.get_sentence().entities:
-                for l in pi.get_sentence().entities[e]:
-                    if pi.start in l:
-                        sp = l
-                    elif pi.end in l:
-                        ep = l
-            outfile.write('Instance: ' + str(i) + '\n')
-            outfile.write('Label: ' + str(predicted_labels[i]) + '\n')
-            outfile.write(
-                ' '.join('Human_gene:' + pi.get_sentence().get_token(a).get_word() for a in sp).encode(
-                    'utf-8') + '\t' + 'Viral_gene:' + ' '.join(
-                    pi.get_sentence().get_token(b).get_word() for b in ep).encode('utf-8') + '\n')
-            outfile.write('Human_gene_index: ' + str(pi.start) + '\t' + 'Viral_gene_index: ' + str(pi.end) + '\n')
-            outfile.write(pi.get_sentence().get_sentence_string().encode('utf-8') + '\n')
-            outfile.write('Accuracy: \n\n')
-        outfile.close()
+        out_file = sys.argv[12] if len(sys.argv) > 12 else 'predicted_instances.tsv' #.jsonl for json lines output
+        chunk_size = int(sys.argv[13]) if len(sys.argv) > 13 else 1000 #number of instances scored at once
+        output_format = 'jsonl' if out_file.endswith('.jsonl') else 'tsv'
+        pruner = pruning.parse_pruning_options(sys.argv[14]) if len(sys.argv) > 14 else None #optional candidate pruning
+
+        stream_predictions(model_file, sentence_file, entity_1, entity_1_file, entity_1_col,
+                           entity_2, entity_2_file, entity_2_col, symmetric, out_file, output_format,
+                           chunk_size, num_workers, pruner)
 
 
     else:
         print("usage error")
 
 
+def main():
+    ''' Main method, mode determines whether program runs training, testing, or prediction'''
+    mode = sys.argv[1] #what option
+    #RELATION_EXTRACTION_REPORT=report.json and/or RELATION_EXTRACTION_PROFILE=folder turn on the run report
+    instrumentation.enable_from_environment()
+    instrumentation.set_info('mode', mode.upper())
+    instrumentation.set_info('arguments', sys.argv[2:])
+    try:
+        run_mode(mode)
+    except BaseException as e:
+        #report and profiles of failed runs are written too, they are the ones that need diagnosing
+        instrumentation.set_info('error', repr(e))
+        raise
+    finally:
+        instrumentation.finish()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import sys
+import zlib
+import hashlib
+import cPickle as pickle
+
+#bump to drop every cached entry, e.g. when an entry's layout changes without a change in the listed modules
+FORMAT_VERSION = 1
+ENTRY_SUFFIX = '.entry'
+DEFAULT_MAX_MB = 2048
+_code_versions = {}
+
+
+def get_code_version(module_names):
+    '''Digest of the source files of modules, entries made by other code get other keys'''
+    module_names = tuple(sorted(module_names))
+    if module_names not in _code_versions:
+        digest = hashlib.sha1(str(FORMAT_VERSION).encode('utf-8'))
+        for name in module_names:
+            __import__(name)
+            source_file = sys.modules[name].__file__
+            if source_file.endswith('.pyc') or source_file.endswith('.pyo'):
+                source_file = source_file[:-1]
+            source = open(source_file, 'rb')
+            digest.update(name.encode('utf-8'))
+            digest.update(source.read())
+            source.close()
+        _code_versions[module_names] = digest.hexdigest()
+    return _code_versions[module_names]
+
+
+def get_digest(*parts):
+    '''sha1 of the parts, byte strings are hashed as they are and other values by their repr.
+    Sets and dicts are sorted first so equal inputs give equal digests'''
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (set, frozenset)):
+            part = sorted(part)
+        elif isinstance(part, dict):
+            part = sorted(part.items())
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class StageCache(object):
+    def __init__(self, cache_folder, max_mb = DEFAULT_MAX_MB):
+        '''Content addressed store of pipeline stage outputs. Keys are digests of the stage inputs and
+        the code that computes them, so entries never need to be invalidated. When the cache grows beyond
+        max_mb the least recently used entries are deleted'''
+        self.cache_folder = cache_folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(cache_folder):
+            os.makedirs(cache_folder)
+        self.total_bytes = sum(size for path, size, mtime in self.list_entries())
+
+    def get_path(self, key):
+        return os.path.join(self.cache_folder, key[:2], key + ENTRY_SUFFIX)
+
+    def list_entries(self):
+        '''Returns (path, size, last use time) of every entry'''
+        entries = []
+        for path, subdirs, files in os.walk(self.cache_folder):
+            for name in files:
+                if name.endswith(ENTRY_SUFFIX):
+                    stat = os.stat(os.path.join(path, name))
+                    entries.append((os.path.join(path, name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key, default = None):
+        '''Returns cached value of key, default if there is none'''
+        path = self.get_path(key)
+        try:
+            entry = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return default
+        try:
+            value = pickle.loads(zlib.decompress(entry.read()))
+        except (zlib.error, EOFError, pickle.UnpicklingError):
+            #half written or damaged entry, computed again by the caller
+            entry.close()
+            self.misses += 1
+            return default
+        entry.close()
+        #modification time records the last use for eviction
+        os.utime(path, None)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''Stores value under key, written to a temporary file first so readers never see half an entry'''
+        path = self.get_path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        record = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 1)
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+        entry = open(temp_path, 'wb')
+        entry.write(record)
+        entry.close()
+        if os.path.exists(path):
+            self.total_bytes -= os.path.getsize(path)
+        os.rename(temp_path, path)
+        self.total_bytes += len(record)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        '''Deletes least recently used entries until the cache is back to 90% of its size limit'''
+        entries = self.list_entries()
+        self.total_bytes = sum(size for path, size, mtime in entries)
+        target_bytes = 0.9 * self.max_bytes
+        for path, size, mtime in sorted(entries, key=lambda e: e[2]):
+            if self.total_bytes <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+
+    def get_report(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size_mb': self.total_bytes / (1024.0 * 1024.0)}
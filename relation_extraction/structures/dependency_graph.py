@@ -0,0 +1,50 @@
+#functions for finding shortest paths over the dependency parse of a sentence
+
+
+def build_adjacency(num_tokens, dependencies):
+    '''Builds undirected adjacency list (sorted neighbour token ids) from list of Dependency objects'''
+    neighbours = [set() for x in range(num_tokens)]
+    for dependency in dependencies:
+        governor_position = int(dependency.get_governor_token().get_token_id())
+        dependent_position = int(dependency.get_dependent_token().get_token_id())
+        if governor_position == dependent_position:
+            continue
+        neighbours[governor_position].add(dependent_position)
+        neighbours[dependent_position].add(governor_position)
+    return [sorted(n) for n in neighbours]
+
+
+def shortest_path_tree(adjacency, source):
+    '''Breadth first search from source, returns list of previous nodes (-1 if unreached).
+    Every dependency edge has weight 1, so nodes are expanded level by level and, within a level,
+    in increasing token order. This keeps the tie-breaking of the original dijkstra implementation
+    which always picked the lowest token id among the closest unexpanded nodes.'''
+    previous = [-1] * len(adjacency)
+    visited = [False] * len(adjacency)
+    visited[source] = True
+    frontier = [source]
+    while len(frontier) > 0:
+        next_frontier = []
+        for u in frontier:
+            for v in adjacency[u]:
+                if visited[v] is False:
+                    visited[v] = True
+                    previous[v] = u
+                    next_frontier.append(v)
+        next_frontier.sort()
+        frontier = next_frontier
+    return previous
+
+
+def extract_path(previous, source, target):
+    '''Walks back from target to source through shortest path tree, empty list if no path'''
+    if source == target or previous[target] == -1:
+        return []
+    path = [target]
+    prev = previous[target]
+    while prev != source:
+        path.append(prev)
+        prev = previous[prev]
+    path.append(source)
+    path.reverse()
+    return path
@@ -1,19 +1,67 @@
 import sys
 import itertools
 
+from structures.dependency_graph import build_adjacency, shortest_path_tree, extract_path
+
 #class objects for tokens, dependencies, and sentences
 
+#words, lemmas, part of speech, ner and dependency types repeat across the whole corpus,
+#every token keeps a reference to one shared copy of each string instead of its own.
+#The interpreter's intern table drops strings nobody references any more, so it doesn't grow
+#without bound in the prediction server or in workers that parse many files
+if sys.version_info[0] >= 3:
+    _intern = sys.intern
+else:
+    _intern = intern
+
+
+def intern_string(value):
+    '''Returns the shared copy of a string, None stays None. On python 2 only byte strings
+    can be interned, unicode strings (non ascii text from lxml) are returned as they are'''
+    if isinstance(value, str):
+        return _intern(value)
+    return value
+
+
+def to_offset(value):
+    if value is None:
+        return None
+    return int(value)
+
+
 class Token(object):
+    __slots__ = ('token_id', 'word', 'lemma', 'char_begin', 'char_end', 'pos', 'ner', 'normalized_ner', 'feature_word')
+
     def __init__(self, token_id, word, lemma, char_begin, char_end, pos, ner, normalized_ner=None):
         '''Constructor for Token objects'''
         self.token_id = int(token_id)
-        self.word = word
-        self.lemma = lemma
-        self.char_begin = char_begin
-        self.char_end = char_end
-        self.pos = pos
-        self.ner = ner
-        self.normalized_ner = normalized_ner
+        self.word = intern_string(word)
+        self.lemma = intern_string(lemma)
+        self.char_begin = to_offset(char_begin)
+        self.char_end = to_offset(char_end)
+        self.pos = intern_string(pos)
+        self.ner = intern_string(ner)
+        self.normalized_ner = intern_string(normalized_ner)
+        self.build_feature_word()
+
+    def __getstate__(self):
+        return (self.token_id, self.word, self.lemma, self.char_begin, self.char_end, self.pos, self.ner, self.normalized_ner)
+
+    def __setstate__(self, state):
+        # tokens pickled before __slots__ carry their attributes as a dictionary
+        if isinstance(state, dict):
+            state = (state['token_id'], state['word'], state['lemma'], state['char_begin'], state['char_end'],
+                     state['pos'], state['ner'], state['normalized_ner'])
+        self.__init__(*state)
+
+    def build_feature_word(self):
+        '''Word used for features, entity mentions are replaced by GENE or their ner type'''
+        if self.normalized_ner is None:
+            self.feature_word = self.lemma
+        elif 'GENE' in self.ner:
+            self.feature_word = 'GENE'
+        else:
+            self.feature_word = self.ner
 
     def get_word(self):
         '''Prints the word identified with the Token object'''
@@ -24,7 +72,8 @@ class Token(object):
         return self.token_id
 
     def set_ner(self,new_ner):
-        self.ner = new_ner
+        self.ner = intern_string(new_ner)
+        self.build_feature_word()
 
     def get_ner(self):
         '''Returns ner of token'''
@@ -42,13 +91,27 @@ class Token(object):
         ''' returns part of speech of token'''
         return self.pos
 
+    def get_feature_word(self):
+        '''returns lemma, or GENE/ner type for entity mentions'''
+        return self.feature_word
+
 class Dependency(object):
+    __slots__ = ('type', 'governor_token', 'dependent_token')
+
     def __init__(self, type, governor_token, dependent_token):
         '''Constructor for dependency type'''
-        self.type = type
+        self.type = intern_string(type)
         self.governor_token = governor_token
         self.dependent_token = dependent_token
 
+    def __getstate__(self):
+        return (self.type, self.governor_token, self.dependent_token)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = (state['type'], state['governor_token'], state['dependent_token'])
+        self.__init__(*state)
+
     def get_governor_token(self):
         '''returns governor token for dependency'''
         return self.governor_token
@@ -68,15 +131,24 @@ class Sentence(object):
         self.sentence_id=sentence_id
         self.tokens = []
         self.entities = {}
+        self.entity_ids = {}
         self.pairs = []
         self.dependencies = []
-        self.dependency_matrix = None
+        self.dependency_types = None
+        self.dependency_graph = None
         self.dependency_paths = None
 
         #Create root token and initialize to first position
         root = Token('0','ROOT','ROOT', None, None, None, None, None)
         self.tokens.append(root)
 
+    def __getstate__(self):
+        '''Adjacency lists and path search trees are rebuilt when needed, they are left out of pickles'''
+        state = self.__dict__.copy()
+        state['dependency_graph'] = None
+        state['dependency_paths'] = None
+        return state
+
     def get_last_token(self):
         return self.tokens[-1]
 
@@ -84,6 +156,8 @@ class Sentence(object):
         '''Adds a token to sentence and entity type of token to entities dictionary'''
         previous_token = self.get_last_token()
         self.tokens.append(token)
+        if token.get_normalized_ner() is not None:
+            self.entity_ids[token.get_token_id()] = self.split_normalized_ids(token)
         #Some genes belong in both virus and human which is why we split
         ners = token.get_ner().split('|')
         for ner in ners:
@@ -106,6 +180,38 @@ class Sentence(object):
     def get_entities(self):
         return self.entities
 
+    def split_normalized_ids(self, token):
+        '''Normalized ids of a token, genes in both virus and human have several ids joined by |'''
+        return tuple(intern_string(i) for i in token.get_normalized_ner().split('|'))
+
+    def get_entity_ids(self, token_position):
+        '''Returns tuple of normalized ids of an entity token, computed once when the token is added'''
+        # sentences pickled before the index existed don't have the attribute
+        if getattr(self, 'entity_ids', None) is None:
+            self.entity_ids = {}
+            for token in self.tokens[1:]:
+                if token.get_normalized_ner() is not None:
+                    self.entity_ids[token.get_token_id()] = self.split_normalized_ids(token)
+        return self.entity_ids.get(token_position, ())
+
+    def get_entity_roles(self, entity_1_list = None, entity_2_list = None):
+        '''Checks each entity token of the pairs against the id lists once, returns dictionary of
+        token position to (can be entity 1, can be entity 2). A token can be entity 1 if one of its ids
+        is in entity_1_list and none is in entity_2_list, and the other way round for entity 2.
+        A missing list allows every token for that side'''
+        roles = {}
+        for pair in self.pairs or []:
+            for position in pair:
+                if position in roles:
+                    continue
+                ids = self.get_entity_ids(position)
+                in_list_1 = entity_1_list is not None and not entity_1_list.isdisjoint(ids)
+                in_list_2 = entity_2_list is not None and not entity_2_list.isdisjoint(ids)
+                can_be_1 = (entity_1_list is None or in_list_1) and not in_list_2
+                can_be_2 = (entity_2_list is None or in_list_2) and not in_list_1
+                roles[position] = (can_be_1, can_be_2)
+        return roles
+
     def generate_entity_pairs(self, entity_type_1, entity_type_2):
         '''generates pairs between entities'''
         if entity_type_1 in self.entities and entity_type_2 in self.entities: #check if both entities in sentence
@@ -143,22 +249,60 @@ class Sentence(object):
         for d in self.dependencies:
             d.print_dependency()
 
-    def build_dependency_matrix(self):
-        self.dependency_matrix = [['' for y in range(len(self.tokens))] for x in range(len(self.tokens))]
+    def build_dependency_types(self):
+        '''Maps (start, end) token positions of every edge to its dependency type, reverse edges
+        get the type prefixed with "-" unless the tokens are already linked in that direction'''
+        self.dependency_types = {}
         for dependency in self.dependencies:
-            governor_position = int(dependency.get_governor_token().get_token_id())
-            dependent_position = int(dependency.get_dependent_token().get_token_id())
+            governor_position = dependency.get_governor_token().get_token_id()
+            dependent_position = dependency.get_dependent_token().get_token_id()
             type = dependency.get_type()
-            self.dependency_matrix[governor_position][dependent_position]=type
+            self.dependency_types[(governor_position, dependent_position)] = type
             # add the reverse only if the slot is empty
-            if self.dependency_matrix[dependent_position][governor_position] == "":
-                self.dependency_matrix[dependent_position][governor_position] = "-" + type
+            if (dependent_position, governor_position) not in self.dependency_types:
+                self.dependency_types[(dependent_position, governor_position)] = intern_string("-" + type)
 
     def get_dependency_type(self,start,end):
-        return self.dependency_matrix[start][end]
+        '''Returns type of edge between tokens, empty string if they are not linked'''
+        if getattr(self, 'dependency_types', None) is None:
+            self.build_dependency_types()
+        return self.dependency_types.get((start, end), '')
 
     def get_dependency_matrix(self):
-        return self.dependency_matrix
+        '''Returns dense token by token matrix of dependency types, built on request only'''
+        dependency_matrix = [['' for y in range(len(self.tokens))] for x in range(len(self.tokens))]
+        if getattr(self, 'dependency_types', None) is None:
+            self.build_dependency_types()
+        for (start, end), type in self.dependency_types.items():
+            dependency_matrix[start][end] = type
+        return dependency_matrix
+
+    def release_dependency_structures(self):
+        '''Drops edge types, adjacency lists and path search trees once instances are built,
+        they are rebuilt from the dependencies if the sentence is used again'''
+        self.dependency_types = None
+        self.dependency_graph = None
+        self.dependency_paths = None
+
+    def build_dependency_graph(self):
+        '''Builds adjacency list of dependency parse, resets shortest path trees'''
+        self.dependency_graph = build_adjacency(len(self.tokens), self.dependencies)
+        self.dependency_paths = {}
+
+    def get_dependency_graph(self):
+        # sentences pickled before adjacency lists existed don't have the attribute
+        if getattr(self, 'dependency_graph', None) is None:
+            self.build_dependency_graph()
+        return self.dependency_graph
+
+    def get_shortest_path(self, start, end):
+        '''Returns shortest dependency path between tokens, one search per source token is shared by all pairs'''
+        graph = self.get_dependency_graph()
+        if self.dependency_paths is None:
+            self.dependency_paths = {}
+        if start not in self.dependency_paths:
+            self.dependency_paths[start] = shortest_path_tree(graph, start)
+        return extract_path(self.dependency_paths[start], start, end)
 
     def clear_all(self):
         for t in self.tokens:
@@ -0,0 +1,185 @@
+import os
+import sys
+import random
+
+from lxml import etree
+
+#words used for tokens that are not entities, a few relation words so dependency paths repeat
+FILLER_WORDS = ['bind', 'interact', 'protein', 'cell', 'inhibit', 'the', 'of', 'with', 'activate', 'express',
+                'by', 'and', 'virus', 'infection', 'complex', 'domain', 'require', 'mediate', 'host', 'replication']
+DEPENDENCY_TYPES = ['nsubj', 'dobj', 'amod', 'nmod', 'conj', 'compound', 'advmod', 'case', 'det', 'acl']
+RELATION_TYPES = ['binds', 'activates', 'inhibits', 'activated_by', 'inhibited_by']
+
+
+class SyntheticCorpusSettings(object):
+    def __init__(self, num_documents = 100, sentences_per_document = 8, sentence_length = 25, entity_density = 0.2,
+                 dependency_depth = 6, num_entity_1_ids = 500, num_entity_2_ids = 100, num_relations = 2000,
+                 entity_1 = 'HUMAN_GENE', entity_2 = 'VIRAL_GENE', seed = 0):
+        '''Shape of a generated corpus. sentence_length is the mean number of tokens, entity_density the
+        fraction of tokens that are entity mentions and dependency_depth the maximum depth of parse trees'''
+        self.num_documents = num_documents
+        self.sentences_per_document = sentences_per_document
+        self.sentence_length = sentence_length
+        self.entity_density = entity_density
+        self.dependency_depth = dependency_depth
+        self.num_entity_1_ids = num_entity_1_ids
+        self.num_entity_2_ids = num_entity_2_ids
+        self.num_relations = num_relations
+        self.entity_1 = entity_1
+        self.entity_2 = entity_2
+        self.seed = seed
+
+    def get_entity_1_ids(self):
+        return [str(i) for i in range(1, self.num_entity_1_ids + 1)]
+
+    def get_entity_2_ids(self):
+        return [str(i) for i in range(100000, 100000 + self.num_entity_2_ids)]
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def add_text_element(parent, tag, text):
+    element = etree.SubElement(parent, tag)
+    element.text = text
+    return element
+
+
+def generate_dependencies(random_state, num_tokens, max_depth):
+    '''Returns (type, governor, dependent) of a random tree over tokens 1..num_tokens hanging from ROOT (0),
+    no token is deeper than max_depth'''
+    order = list(range(1, num_tokens + 1))
+    random_state.shuffle(order)
+    depth = {order[0]: 1}
+    attached = [order[0]]
+    dependencies = [('root', 0, order[0])]
+    for token in order[1:]:
+        candidates = [t for t in attached if depth[t] < max_depth] or attached
+        governor = random_state.choice(candidates)
+        depth[token] = depth[governor] + 1
+        attached.append(token)
+        dependencies.append((random_state.choice(DEPENDENCY_TYPES), governor, token))
+    return dependencies
+
+
+def generate_sentence(random_state, settings, sentence_id, entity_1_ids, entity_2_ids):
+    '''Builds one CoreNLP sentence element with tokens and basic dependencies'''
+    sentence = etree.Element('sentence', id=str(sentence_id))
+    tokens = etree.SubElement(sentence, 'tokens')
+    num_tokens = max(3, int(random_state.gauss(settings.sentence_length, settings.sentence_length / 4.0)))
+    offset = 0
+    for token_id in range(1, num_tokens + 1):
+        token = etree.SubElement(tokens, 'token', id=str(token_id))
+        draw = random_state.random()
+        normalized_ner = None
+        if draw < settings.entity_density / 2.0:
+            word, ner = 'HG' + str(token_id), settings.entity_1
+            #some genes have several normalized ids
+            normalized_ner = '|'.join(random_state.sample(entity_1_ids, random_state.choice([1, 1, 1, 2])))
+        elif draw < settings.entity_density:
+            word, ner = 'VG' + str(token_id), settings.entity_2
+            normalized_ner = random_state.choice(entity_2_ids)
+        else:
+            word, ner = random_state.choice(FILLER_WORDS), 'O'
+        add_text_element(token, 'word', word)
+        add_text_element(token, 'lemma', word.lower())
+        add_text_element(token, 'CharacterOffsetBegin', str(offset))
+        add_text_element(token, 'CharacterOffsetEnd', str(offset + len(word)))
+        add_text_element(token, 'POS', 'NN')
+        add_text_element(token, 'NER', ner)
+        if normalized_ner is not None:
+            add_text_element(token, 'NormalizedNER', normalized_ner)
+        offset += len(word) + 1
+    add_text_element(sentence, 'parse', '(ROOT)')
+    basic = etree.SubElement(sentence, 'dependencies', type='basic-dependencies')
+    for dep_type, governor, dependent in generate_dependencies(random_state, num_tokens, settings.dependency_depth):
+        dep = etree.SubElement(basic, 'dep', type=dep_type)
+        add_text_element(dep, 'governor', 'ROOT' if governor == 0 else 'x').set('idx', str(governor))
+        add_text_element(dep, 'dependent', 'x').set('idx', str(dependent))
+    etree.SubElement(sentence, 'dependencies', type='collapsed-dependencies')
+    return sentence
+
+
+def generate_document(random_state, settings):
+    '''Builds a CoreNLP document, with a coreference section whose mentions hold <sentence> elements too'''
+    entity_1_ids = settings.get_entity_1_ids()
+    entity_2_ids = settings.get_entity_2_ids()
+    root = etree.Element('root')
+    document = etree.SubElement(root, 'document')
+    sentences = etree.SubElement(document, 'sentences')
+    num_sentences = random_state.randint(1, 2 * settings.sentences_per_document - 1)
+    for sentence_id in range(1, num_sentences + 1):
+        sentences.append(generate_sentence(random_state, settings, sentence_id, entity_1_ids, entity_2_ids))
+    coreference = etree.SubElement(etree.SubElement(document, 'coreference'), 'coreference')
+    mention = etree.SubElement(coreference, 'mention')
+    add_text_element(mention, 'sentence', '1')
+    add_text_element(mention, 'start', '1')
+    return etree.ElementTree(root)
+
+
+def generate_corpus(out_folder, settings):
+    '''Writes settings.num_documents xml files to out_folder, returns their paths'''
+    random_state = random.Random(settings.seed)
+    if not os.path.isdir(out_folder):
+        os.makedirs(out_folder)
+    xml_files = []
+    for d in range(settings.num_documents):
+        xml_file = os.path.join(out_folder, 'document_' + str(d).zfill(6) + '.xml')
+        generate_document(random_state, settings).write(xml_file, xml_declaration=True, encoding='UTF-8')
+        xml_files.append(xml_file)
+    return xml_files
+
+
+def write_knowledge_base(kb_file, settings):
+    '''Writes tab separated knowledge base: entity_1 id, entity_2 id, relation type'''
+    random_state = random.Random(settings.seed + 1)
+    entity_1_ids = settings.get_entity_1_ids()
+    entity_2_ids = settings.get_entity_2_ids()
+    kb = open(kb_file, 'w')
+    for _ in range(settings.num_relations):
+        kb.write(random_state.choice(entity_1_ids) + '\t' + random_state.choice(entity_2_ids) + '\t' +
+                 random_state.choice(RELATION_TYPES) + '\n')
+    kb.close()
+
+
+def write_id_list(id_file, ids):
+    '''Writes id list in the layout load_id_list reads, ids in column 0'''
+    id_list = open(id_file, 'w')
+    for i in ids:
+        id_list.write(i + '\tsynthetic\n')
+    id_list.close()
+
+
+def generate_dataset(out_folder, settings):
+    '''Writes corpus to out_folder/corpus and knowledge base and id lists next to it, returns their paths'''
+    paths = {'corpus': os.path.join(out_folder, 'corpus'),
+             'knowledge_base': os.path.join(out_folder, 'knowledge_base.tsv'),
+             'entity_1_ids': os.path.join(out_folder, 'entity_1_ids.tsv'),
+             'entity_2_ids': os.path.join(out_folder, 'entity_2_ids.tsv')}
+    generate_corpus(paths['corpus'], settings)
+    write_knowledge_base(paths['knowledge_base'], settings)
+    write_id_list(paths['entity_1_ids'], settings.get_entity_1_ids())
+    write_id_list(paths['entity_2_ids'], settings.get_entity_2_ids())
+    return paths
+
+
+def main():
+    '''python synthetic_corpus.py out_folder [num_documents] [sentence_length] [entity_density] [dependency_depth] [seed]'''
+    out_folder = sys.argv[1]
+    settings = SyntheticCorpusSettings()
+    if len(sys.argv) > 2:
+        settings.num_documents = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        settings.sentence_length = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        settings.entity_density = float(sys.argv[4])
+    if len(sys.argv) > 5:
+        settings.dependency_depth = int(sys.argv[5])
+    if len(sys.argv) > 6:
+        settings.seed = int(sys.argv[6])
+    paths = generate_dataset(out_folder, settings)
+    print(paths)
+
+
+if __name__ == "__main__":
+    main()
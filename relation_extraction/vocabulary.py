@@ -0,0 +1,97 @@
+import zlib
+import collections
+
+import six
+
+
+class Vocabulary(object):
+    def __init__(self, words = None):
+        '''Counts feature words in one pass, only unique words are kept in memory'''
+        self.counts = collections.Counter()
+        if words is not None:
+            self.update(words)
+
+    def add(self, word):
+        '''Counts a single word'''
+        self.counts[word] += 1
+
+    def update(self, words):
+        '''Counts every word of an iterable'''
+        self.counts.update(words)
+
+    def merge(self, other):
+        '''Adds counts of another vocabulary'''
+        self.counts.update(other.counts)
+
+    def subtract(self, other):
+        '''Removes counts of another vocabulary whose words were counted in this one,
+        words whose count drops to zero are dropped'''
+        for word, c in other.counts.items():
+            remaining = self.counts[word] - c
+            if remaining > 0:
+                self.counts[word] = remaining
+            else:
+                del self.counts[word]
+
+    def copy(self):
+        vocabulary = Vocabulary()
+        vocabulary.counts = self.counts.copy()
+        return vocabulary
+
+    def __contains__(self, word):
+        return word in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get_count(self, word):
+        return self.counts[word]
+
+    def most_common(self, min_count = None):
+        '''Returns (word, count) pairs with count >= min_count ordered by count, ties broken by word
+        so ids are the same across runs and processes'''
+        count = []
+        for word, c in self.counts.items():
+            if min_count is None or c >= min_count:
+                count.append((word, c))
+        count.sort(key=lambda wc: (-wc[1], wc[0]))
+        return count
+
+    def build_dictionary(self, min_count = None):
+        '''Returns dictionary mapping word to feature id, most common words get the lowest ids'''
+        dictionary = dict()
+        for word, _ in self.most_common(min_count):
+            dictionary[word] = len(dictionary)
+        return dictionary
+
+
+class HashedVocabulary(object):
+    def __init__(self, num_bits, track_known = False):
+        '''Stands in for a feature dictionary by hashing words into 2**num_bits columns, nothing is stored per word.
+        With track_known only words added during training are members, which keeps dependency path
+        membership checks (symmetric relations, unseen paths) working without a dictionary'''
+        self.num_bits = num_bits
+        self.num_columns = 1 << num_bits
+        self.track_known = track_known
+        self.known_columns = set()
+
+    def get_column(self, word):
+        '''Stable across processes and runs, unlike hash() of strings in python 3'''
+        if isinstance(word, six.text_type):
+            word = word.encode('utf-8')
+        return (zlib.crc32(word) & 0xffffffff) % self.num_columns
+
+    def add(self, word):
+        if self.track_known:
+            self.known_columns.add(self.get_column(word))
+
+    def __contains__(self, word):
+        if self.track_known:
+            return self.get_column(word) in self.known_columns
+        return True
+
+    def __getitem__(self, word):
+        return self.get_column(word)
+
+    def __len__(self):
+        return self.num_columns
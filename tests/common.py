@@ -0,0 +1,60 @@
+import os
+import sys
+
+#modules of the package import each other by name, so the package folder goes on the path
+PACKAGE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'relation_extraction')
+if PACKAGE_FOLDER not in sys.path:
+    sys.path.insert(0, PACKAGE_FOLDER)
+#the embedding scripts in learning import each other the same way
+LEARNING_FOLDER = os.path.join(PACKAGE_FOLDER, 'learning')
+if LEARNING_FOLDER not in sys.path:
+    sys.path.insert(0, LEARNING_FOLDER)
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.externals import joblib
+
+import load_data
+import synthetic_corpus
+
+
+def generate_dataset(out_folder, num_documents = 20, seed = 0):
+    '''Small synthetic corpus with knowledge base and id lists, returns settings and paths'''
+    settings = synthetic_corpus.SyntheticCorpusSettings(num_documents=num_documents, sentences_per_document=4,
+                                                        num_entity_1_ids=40, num_entity_2_ids=10,
+                                                        num_relations=150, seed=seed)
+    return settings, synthetic_corpus.generate_dataset(out_folder, settings)
+
+
+def load_sentences(paths, settings):
+    sentences = []
+    for xml_file in load_data.list_xml_files(paths['corpus']):
+        sentences.extend(load_data.load_xml(xml_file, settings.entity_1, settings.entity_2))
+    return sentences
+
+
+def load_abstracts(paths, settings):
+    '''Candidate sentences of every xml file with any, keyed like load_abstracts_from_directory numbers them'''
+    abstracts = {}
+    for xml_file in load_data.list_xml_files(paths['corpus']):
+        sentences = load_data.load_xml(xml_file, settings.entity_1, settings.entity_2)
+        if len(sentences) > 0:
+            abstracts[len(abstracts)] = sentences
+    return abstracts
+
+
+def train_model(paths, settings, model_file):
+    '''Distantly trains a model on the dataset and writes it like DISTANT_TRAIN does'''
+    sentences = load_sentences(paths, settings)
+    entity_1_ids = load_data.load_id_list(paths['entity_1_ids'], 0)
+    entity_2_ids = load_data.load_id_list(paths['entity_2_ids'], 0)
+    distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(paths['knowledge_base'], 0, 1, 2)
+    candidate_pairs = load_data.build_candidate_pairs(sentences, entity_1_ids, entity_2_ids)
+    selected = load_data.select_training_instances(candidate_pairs, distant_interactions, reverse_distant_interactions)
+    training_instances = selected[0]
+    dictionaries = selected[1:]
+    X = load_data.build_feature_matrix(training_instances, load_data.get_feature_space_size(*dictionaries))
+    y = np.array([t.get_label() for t in training_instances])
+    model = LogisticRegression().fit(X, y)
+    joblib.dump(tuple([model] + list(dictionaries)), model_file)
+    return sentences, entity_1_ids, entity_2_ids
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import common
+import corpus_store
+import load_data
+
+
+class CorpusStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.settings, self.paths = common.generate_dataset(os.path.join(self.folder, 'data'), num_documents=5)
+        self.corpus = self.paths['corpus']
+        self.store_path = self.corpus + '.corpus'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def load_store(self):
+        return load_data.load_abstracts_from_directory(self.corpus, self.settings.entity_1, self.settings.entity_2)
+
+    def test_store_holds_parsed_abstracts(self):
+        store = self.load_store()
+        sentences = [s for key in store for s in store[key]]
+        expected = common.load_sentences(self.paths, self.settings)
+        self.assertEqual([(s.sentence_id, s.get_entity_pairs()) for s in sentences],
+                         [(s.sentence_id, s.get_entity_pairs()) for s in expected])
+        store.close()
+
+    def test_failed_ingest_leaves_no_temporary_files(self):
+        store = self.load_store()
+        num_abstracts = len(store)
+        store.close()
+        broken = open(os.path.join(self.corpus, 'zz_broken.xml'), 'w')
+        broken.write('<root><document><sentences><sentence id="1">')
+        broken.close()
+        self.assertRaises(Exception, self.load_store)
+        self.assertEqual(sorted(os.listdir(self.store_path)), sorted([corpus_store.RECORDS_FILE,
+                                                                     corpus_store.INDEX_FILE]))
+        #the previous store is still complete
+        store = corpus_store.CorpusStore(self.store_path)
+        self.assertEqual(len(store), num_abstracts)
+        store.close()
+
+    def test_failed_close_leaves_no_temporary_files(self):
+        writer = corpus_store.CorpusStoreWriter(self.store_path, self.settings.entity_1, self.settings.entity_2)
+        writer.add_record('a.xml', 1, 1.0, b'record', 1)
+        writer.files['a.xml']['unpicklable'] = lambda: None
+        self.assertRaises(Exception, writer.close)
+        self.assertEqual(os.listdir(self.store_path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
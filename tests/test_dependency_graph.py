@@ -0,0 +1,101 @@
+import random
+import unittest
+
+import common
+from structures.dependency_graph import build_adjacency, shortest_path_tree, extract_path
+from structures.sentence_structure import Sentence, Token, Dependency
+
+
+def baseline_dijkstra(adj_matrix, source):
+    '''Shortest path search of the original Sentence code, kept as the reference for tie-breaking'''
+    infinity = float('inf')
+    distance = [infinity] * len(adj_matrix)
+    previous = [-1] * len(adj_matrix)
+    distance[source] = 0
+    unreached = list(range(len(adj_matrix)))
+    while len(unreached) > 0:
+        u = distance.index(min(distance))
+        if distance[u] == infinity:
+            break
+        unreached.remove(u)
+        for v in unreached:
+            if adj_matrix[u][v] != '':
+                alt = distance[u] + 1
+                if alt < distance[v]:
+                    distance[v] = alt
+                    previous[v] = u
+        distance[u] = infinity
+    return previous
+
+
+def baseline_path(previous, source, target):
+    '''Path reconstruction of the original Instance code'''
+    if previous[target] == -1:
+        return []
+    p = previous[target]
+    path = [p, target]
+    while p != source:
+        p = previous[p]
+        path.insert(0, p)
+    return path
+
+
+def build_sentence(num_tokens, edges):
+    sentence = Sentence('1')
+    for i in range(1, num_tokens + 1):
+        sentence.add_token(Token(str(i), 'w' + str(i), 'l' + str(i), '0', '1', 'NN', 'O', None))
+    for governor, dependent in edges:
+        sentence.add_dependency(Dependency('dep', sentence.get_token(governor), sentence.get_token(dependent)))
+    return sentence
+
+
+def random_edges(random_state, num_tokens, disconnect):
+    '''Random parse tree rooted at token 0 with a few extra edges like enhanced dependencies'''
+    edges = [(random_state.randint(0, i - 1), i) for i in range(1, num_tokens + 1)]
+    for _ in range(random_state.randint(0, 5)):
+        edges.append((random_state.randint(0, num_tokens), random_state.randint(0, num_tokens)))
+    if disconnect:
+        edges = edges[:-3]
+    return edges
+
+
+class ShortestPathParityTest(unittest.TestCase):
+    def assert_same_paths(self, sentence):
+        matrix = sentence.get_dependency_matrix()
+        adjacency = build_adjacency(len(sentence.get_tokens()), sentence.dependencies)
+        for source in range(len(matrix)):
+            previous = baseline_dijkstra(matrix, source)
+            tree = shortest_path_tree(adjacency, source)
+            for target in range(len(matrix)):
+                expected = baseline_path(previous, source, target)
+                self.assertEqual(extract_path(tree, source, target), expected)
+                self.assertEqual(sentence.get_shortest_path(source, target), expected)
+
+    def test_random_graphs(self):
+        random_state = random.Random(1)
+        for trial in range(300):
+            num_tokens = random_state.randint(1, 30)
+            disconnect = num_tokens > 3 and random_state.random() < 0.2
+            self.assert_same_paths(build_sentence(num_tokens, random_edges(random_state, num_tokens, disconnect)))
+
+    def test_disconnected_graph(self):
+        #tokens 4 and 5 are only linked to each other
+        sentence = build_sentence(5, [(0, 1), (1, 2), (2, 3), (4, 5)])
+        self.assert_same_paths(sentence)
+        self.assertEqual(sentence.get_shortest_path(1, 5), [])
+        self.assertEqual(sentence.get_shortest_path(4, 5), [4, 5])
+
+    def test_ties_pick_lowest_token(self):
+        #1 reaches 6 through 2, 3 or 4 in two steps, the lowest token id wins like in the original search
+        sentence = build_sentence(6, [(1, 4), (1, 3), (1, 2), (4, 6), (3, 6), (2, 6), (0, 1), (5, 6)])
+        self.assert_same_paths(sentence)
+        self.assertEqual(sentence.get_shortest_path(1, 6), [1, 2, 6])
+        self.assertEqual(sentence.get_shortest_path(0, 5), [0, 1, 2, 6, 5])
+
+    def test_self_loops_and_repeated_edges(self):
+        sentence = build_sentence(4, [(0, 1), (1, 1), (1, 2), (2, 1), (2, 3), (3, 4), (4, 3)])
+        self.assert_same_paths(sentence)
+
+
+if __name__ == '__main__':
+    unittest.main()
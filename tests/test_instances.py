@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import common
+import load_data
+
+
+def dense_features(instance, dep_dictionary, dep_word_dictionary, dep_type_word_element_dictionary,
+                   between_word_dictionary):
+    '''Feature vector the way Instance.build_features built it before it stored active indices'''
+    dep_word_features = [0] * len(dep_word_dictionary)
+    dep_features = [0] * len(dep_dictionary)
+    dep_type_word_element_features = [0] * len(dep_type_word_element_dictionary)
+    between_features = [0] * len(between_word_dictionary)
+
+    for i in set(dep_word_dictionary.keys()).intersection(set(instance.get_dep_word_path())):
+        dep_word_features[dep_word_dictionary[i]] = 1
+    for i in set(dep_type_word_element_dictionary.keys()).intersection(set(instance.get_dep_type_word_elements())):
+        dep_type_word_element_features[dep_type_word_element_dictionary[i]] = 1
+    for i in set(between_word_dictionary.keys()).intersection(set(instance.get_between_words())):
+        between_features[between_word_dictionary[i]] = 1
+    dep_path_string = ' '.join(instance.get_type_dependency_path())
+    if dep_path_string in dep_dictionary:
+        dep_features[dep_dictionary[dep_path_string]] = 1
+    return dep_features + dep_word_features + dep_type_word_element_features + between_features
+
+
+class BuildFeaturesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        settings, cls.paths = common.generate_dataset(cls.folder)
+        cls.sentences = common.load_sentences(cls.paths, settings)
+        cls.entity_1_ids = load_data.load_id_list(cls.paths['entity_1_ids'], 0)
+        cls.entity_2_ids = load_data.load_id_list(cls.paths['entity_2_ids'], 0)
+        cls.distant_interactions, cls.reverse_distant_interactions = \
+            load_data.load_distant_kb(cls.paths['knowledge_base'], 0, 1, 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def assert_matches_dense(self, symmetric, min_count = None):
+        instances, dep, dep_word, dep_element, between_word = load_data.build_instances_training(
+            self.sentences, self.distant_interactions, self.reverse_distant_interactions, self.entity_1_ids,
+            self.entity_2_ids, symmetric, min_count)
+        self.assertGreater(len(instances), 0)
+        num_features = load_data.get_feature_space_size(dep, dep_word, dep_element, between_word)
+        dense = np.array([dense_features(i, dep, dep_word, dep_element, between_word) for i in instances])
+        self.assertEqual(dense.shape[1], num_features)
+        for instance, row in zip(instances, dense):
+            self.assertEqual(instance.get_features(), np.flatnonzero(row).tolist())
+        X = load_data.build_feature_matrix(instances, num_features)
+        np.testing.assert_array_equal(X.toarray(), dense)
+
+        #test instances only keep features of the training dictionaries
+        test_instances = load_data.build_instances_testing(
+            self.sentences, dep, dep_word, dep_element, between_word, self.distant_interactions,
+            self.reverse_distant_interactions, self.entity_1_ids, self.entity_2_ids, symmetric)
+        for instance in test_instances:
+            self.assertEqual(instance.get_features(),
+                             np.flatnonzero(dense_features(instance, dep, dep_word, dep_element, between_word)).tolist())
+
+    def test_directed_features(self):
+        self.assert_matches_dense(False)
+
+    def test_symmetric_features(self):
+        self.assert_matches_dense(True)
+
+    def test_features_with_min_count(self):
+        self.assert_matches_dense(False, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
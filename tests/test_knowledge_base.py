@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import common
+import knowledge_base
+import load_data
+
+
+class KnowledgeBaseTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.kb_file = os.path.join(self.folder, 'kb.tsv')
+        kb = open(self.kb_file, 'w')
+        kb.write('a\tx\tbinds\nb\ty\tinhibited_by\na\tz\tactivates\n')
+        kb.close()
+        self.kb_path = os.path.join(self.folder, 'kb')
+        knowledge_base.build_knowledge_base(self.kb_file, 0, 1, 2).save(self.kb_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_directory_answers_like_file(self):
+        from_file = load_data.load_distant_kb(self.kb_file, 0, 1, 2)
+        from_directory = load_data.load_distant_kb(self.kb_path, 0, 1, 2)
+        for pair in [('a', 'x'), ('b', 'y'), ('a', 'z'), ('x', 'a'), ('a', 'y'), ('c', 'x')]:
+            self.assertEqual(pair in from_file[0], pair in from_directory[0])
+            self.assertEqual(pair in from_file[1], pair in from_directory[1])
+        self.assertIn(('a', 'x'), from_directory[0])
+        self.assertIn(('b', 'y'), from_directory[1])
+
+    def test_directory_rejects_other_columns(self):
+        self.assertRaises(ValueError, load_data.load_distant_kb, self.kb_path, 1, 0, 2)
+        self.assertRaises(ValueError, load_data.load_distant_kb, self.kb_path, 0, 1, 3)
+
+    def test_id_cache_is_bounded(self):
+        max_cached_ids = knowledge_base.MAX_CACHED_IDS
+        knowledge_base.MAX_CACHED_IDS = 10
+        try:
+            table = knowledge_base.open_knowledge_base(self.kb_path).entity_table
+            for i in range(100):
+                self.assertIsNone(table.get_number('missing' + str(i)))
+                self.assertLessEqual(len(table.numbers), 10)
+            self.assertIsNotNone(table.get_number('a'))
+        finally:
+            knowledge_base.MAX_CACHED_IDS = max_cached_ids
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from lxml import etree
+
+import common
+import load_data
+import synthetic_corpus
+from vocabulary import HashedVocabulary
+
+
+def describe(sentences):
+    return [(s.sentence_id, [t.get_word() for t in s.get_tokens()], s.get_entity_pairs(),
+             sorted(s.dependency_types.items())) for s in sentences]
+
+
+class StreamXmlTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = synthetic_corpus.SyntheticCorpusSettings(sentences_per_document=6, seed=3)
+        self.document = synthetic_corpus.generate_document(random.Random(3), self.settings)
+
+    def stream(self, document):
+        xml = etree.tostring(document, xml_declaration=True, encoding='UTF-8')
+        return list(load_data.stream_xml(io.BytesIO(xml), self.settings.entity_1, self.settings.entity_2))
+
+    def test_coreference_does_not_change_sentences(self):
+        expected = self.stream(self.document)
+        self.assertGreater(len(expected), 0)
+
+        #many chains whose mentions point at every sentence, like a long CoreNLP document
+        root = self.document.getroot()
+        outer = root.find('document/coreference')
+        num_sentences = len(root.find('document/sentences'))
+        for chain in range(200):
+            coreference = etree.SubElement(outer, 'coreference')
+            for sentence_id in range(1, num_sentences + 1):
+                mention = etree.SubElement(coreference, 'mention')
+                synthetic_corpus.add_text_element(mention, 'sentence', str(sentence_id))
+                synthetic_corpus.add_text_element(mention, 'start', '1')
+                synthetic_corpus.add_text_element(mention, 'text', 'it')
+        self.assertEqual(describe(self.stream(self.document)), describe(expected))
+
+    def test_document_without_coreference(self):
+        expected = self.stream(self.document)
+        root = self.document.getroot()
+        root.find('document').remove(root.find('document/coreference'))
+        self.assertEqual(describe(self.stream(self.document)), describe(expected))
+
+
+class StubInstance(object):
+    '''Instance with fixed feature words, enough for the collision report'''
+    def __init__(self, dep_path, dep_words, dep_elements, between_words):
+        self.dep_path = dep_path
+        self.dep_words = dep_words
+        self.dep_elements = dep_elements
+        self.between_words = between_words
+
+    def get_type_dependency_path(self):
+        return self.dep_path
+
+    def get_dep_word_path(self):
+        return self.dep_words
+
+    def get_dep_type_word_elements(self):
+        return self.dep_elements
+
+    def get_between_words(self):
+        return self.between_words
+
+
+class HashedFeaturesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_features_stay_in_family_ranges(self):
+        settings, paths = common.generate_dataset(self.folder)
+        sentences = common.load_sentences(paths, settings)
+        distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(paths['knowledge_base'], 0, 1, 2)
+        candidate_pairs = load_data.build_candidate_pairs(sentences, load_data.load_id_list(paths['entity_1_ids'], 0),
+                                                          load_data.load_id_list(paths['entity_2_ids'], 0))
+        feature_bits = 4
+        num_columns = 1 << feature_bits
+        instances, dep, dep_word, dep_element, between_word = load_data.select_training_instances(
+            candidate_pairs, distant_interactions, reverse_distant_interactions, feature_bits=feature_bits)
+        self.assertGreater(len(instances), 0)
+        self.assertEqual(load_data.get_feature_space_size(dep, dep_word, dep_element, between_word), 4 * num_columns)
+
+        for instance in instances:
+            families = [[' '.join(instance.get_type_dependency_path())], instance.get_dep_word_path(),
+                        instance.get_dep_type_word_elements(), instance.get_between_words()]
+            expected = set()
+            for family, (dictionary, words) in enumerate(zip([dep, dep_word, dep_element, between_word], families)):
+                offset = family * num_columns
+                for word in words:
+                    if word in dictionary:
+                        column = dictionary[word]
+                        self.assertTrue(0 <= column < num_columns)
+                        expected.add(offset + column)
+            self.assertEqual(instance.get_features(), sorted(expected))
+            self.assertTrue(all(0 <= f < 4 * num_columns for f in instance.get_features()))
+
+    def test_collision_report(self):
+        feature_bits = 3
+        hashed = HashedVocabulary(feature_bits)
+        #two words sharing a column and one word in a column of its own
+        words = ['word' + str(i) for i in range(100)]
+        first = words[0]
+        colliding = [w for w in words[1:] if hashed.get_column(w) == hashed.get_column(first)][0]
+        separate = [w for w in words[1:] if hashed.get_column(w) != hashed.get_column(first)][0]
+
+        instances = [StubInstance(['nsubj', 'dobj'], [first, colliding], [first], [first, separate]),
+                     StubInstance(['nsubj', 'dobj'], [colliding], [first], [separate])]
+        dictionaries = [HashedVocabulary(feature_bits, track_known=True)] + \
+                       [HashedVocabulary(feature_bits) for _ in range(3)]
+        report = load_data.get_hashing_collision_report(instances, *dictionaries)
+
+        self.assertEqual(report['dependency_paths'], {'features': 1, 'columns_used': 1, 'collision_rate': 0.0})
+        self.assertEqual(report['dependency_words'], {'features': 2, 'columns_used': 1, 'collision_rate': 0.5})
+        self.assertEqual(report['dependency_elements'], {'features': 1, 'columns_used': 1, 'collision_rate': 0.0})
+        self.assertEqual(report['between_words'], {'features': 2, 'columns_used': 2, 'collision_rate': 0.0})
+
+
+class FoldTrainingDataTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_matches_selecting_fold_from_scratch(self):
+        settings, paths = common.generate_dataset(self.folder, num_documents=25)
+        abstracts = common.load_abstracts(paths, settings)
+        keys = sorted(abstracts)
+        entity_1_ids = load_data.load_id_list(paths['entity_1_ids'], 0)
+        entity_2_ids = load_data.load_id_list(paths['entity_2_ids'], 0)
+        distant_interactions, reverse_distant_interactions = load_data.load_distant_kb(paths['knowledge_base'], 0, 1, 2)
+        feature_counts = load_data.count_abstract_features(
+            keys, load_data.build_abstract_candidate_pairs(abstracts, keys, entity_1_ids, entity_2_ids),
+            distant_interactions, reverse_distant_interactions)
+
+        k = 5
+        for i in range(k):
+            held_out_keys = keys[i::k]
+            X, y, dictionaries = load_data.get_fold_training_data(feature_counts, held_out_keys)
+
+            #fresh candidate pairs, so nothing set on the instances by the counting above is reused
+            training_keys = [key for key in keys if key not in held_out_keys]
+            abstract_pairs = load_data.build_abstract_candidate_pairs(abstracts, training_keys, entity_1_ids,
+                                                                      entity_2_ids)
+            training_pairs = []
+            for key in training_keys:
+                training_pairs.extend(abstract_pairs[key])
+            selected = load_data.select_training_instances(training_pairs, distant_interactions,
+                                                           reverse_distant_interactions)
+            instances = selected[0]
+            self.assertGreater(len(instances), 0)
+            self.assertEqual(list(dictionaries), list(selected[1:]))
+            expected_X = load_data.build_feature_matrix(instances, load_data.get_feature_space_size(*selected[1:]))
+            self.assertEqual(X.shape, expected_X.shape)
+            np.testing.assert_array_equal(X.toarray(), expected_X.toarray())
+            np.testing.assert_array_equal(y, [instance.get_label() for instance in instances])
+
+
+if __name__ == '__main__':
+    unittest.main()
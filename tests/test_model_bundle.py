@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from sklearn.externals import joblib
+
+import common
+import load_data
+import model_bundle
+
+
+class ModelBundleTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.settings, paths = common.generate_dataset(os.path.join(cls.folder, 'data'))
+        cls.model_file = os.path.join(cls.folder, 'model.pkl')
+        cls.bundle_path = os.path.join(cls.folder, 'model.bundle')
+        cls.sentences, cls.entity_1_ids, cls.entity_2_ids = common.train_model(paths, cls.settings, cls.model_file)
+        model_bundle.convert_model(cls.model_file, cls.bundle_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def predict(self, model_file):
+        model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary = \
+            model_bundle.load_model(model_file)
+        instances = load_data.build_instances_predict(self.sentences, dep_dictionary, dep_word_dictionary,
+                                                      dep_element_dictionary, between_word_dictionary,
+                                                      self.entity_1_ids, self.entity_2_ids)
+        num_features = load_data.get_feature_space_size(dep_dictionary, dep_word_dictionary, dep_element_dictionary,
+                                                        between_word_dictionary)
+        X = load_data.build_feature_matrix(instances, num_features)
+        return X, model.predict(X), model.predict_proba(X)
+
+    def test_bundle_predicts_like_joblib_model(self):
+        joblib_X, joblib_labels, joblib_probabilities = self.predict(self.model_file)
+        bundle_X, bundle_labels, bundle_probabilities = self.predict(self.bundle_path)
+        self.assertGreater(joblib_X.shape[0], 0)
+        self.assertEqual((joblib_X != bundle_X).nnz, 0)
+        np.testing.assert_array_equal(joblib_labels, bundle_labels)
+        np.testing.assert_allclose(joblib_probabilities, bundle_probabilities, rtol=1e-12)
+
+    def test_string_table_matches_dictionary(self):
+        dictionaries = joblib.load(self.model_file)[1:]
+        tables = model_bundle.open_model_bundle(self.bundle_path)[1:]
+        for dictionary, table in zip(dictionaries, tables):
+            self.assertEqual(len(dictionary), len(table))
+            for word, feature_id in dictionary.items():
+                self.assertIn(word, table)
+                self.assertEqual(table[word], feature_id)
+            self.assertNotIn(u'not a feature word', table)
+            self.assertRaises(KeyError, table.__getitem__, u'not a feature word')
+
+    def test_string_table_lookups_from_threads(self):
+        dictionary = joblib.load(self.model_file)[1]
+        table = model_bundle.open_model_bundle(self.bundle_path)[1]
+        words = sorted(dictionary.keys()) + [u'missing_' + str(i) for i in range(20)]
+        errors = []
+
+        def look_up(offset):
+            for repeat in range(50):
+                for word in words[offset:] + words[:offset]:
+                    expected = dictionary.get(word)
+                    found = table[word] if word in table else None
+                    if found != expected:
+                        errors.append((word, found, expected))
+
+        threads = [threading.Thread(target=look_up, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
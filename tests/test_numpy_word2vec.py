@@ -0,0 +1,48 @@
+import math
+import unittest
+
+import numpy as np
+
+import common
+from numpy_word2vec import SkipGramTrainer
+from skipgram import build_dataset
+
+
+def generate_words(num_words = 20000, seed = 0):
+    '''Words drawn from a few fixed phrases, so context words are predictable'''
+    random_state = np.random.RandomState(seed)
+    phrases = [['w' + str(p) + '_' + str(i) for i in range(5)] for p in range(20)]
+    words = []
+    while len(words) < num_words:
+        words.extend(phrases[random_state.randint(len(phrases))])
+    return words
+
+
+class SkipGramTrainerTest(unittest.TestCase):
+    def setUp(self):
+        self.data, self.count, _, _ = build_dataset(generate_words(), 200)
+
+    def train(self, epochs = 3):
+        trainer = SkipGramTrainer(len(self.count), embedding_size=16, seed=5)
+        #without subsampling every epoch trains on the same number of pairs
+        trainer.train(self.data, self.count, epochs, subsample=None)
+        return trainer
+
+    def test_single_thread_is_deterministic(self):
+        first = self.train()
+        second = self.train()
+        np.testing.assert_array_equal(first.input_weights, second.input_weights)
+        np.testing.assert_array_equal(first.output_weights, second.output_weights)
+        self.assertEqual(first.loss, second.loss)
+        self.assertEqual(first.examples, second.examples)
+
+    def test_training_lowers_loss(self):
+        trainer = self.train()
+        #output weights start at zero, every score is 0.5 before the first update
+        initial_loss = (1 + trainer.negative) * math.log(2.0)
+        final_loss = trainer.loss / (trainer.examples // 3)
+        self.assertLess(final_loss, 0.75 * initial_loss)
+
+
+if __name__ == '__main__':
+    unittest.main()
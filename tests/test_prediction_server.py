@@ -0,0 +1,144 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from six.moves import queue
+from six.moves.urllib import request, error
+
+import common
+import load_data
+import model_bundle
+import prediction_server
+
+
+class FailingModel(object):
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        raise RuntimeError('model failure')
+
+
+class PredictionServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.settings, paths = common.generate_dataset(os.path.join(cls.folder, 'data'))
+        cls.model_file = os.path.join(cls.folder, 'model.pkl')
+        sentences, entity_1_ids, entity_2_ids = common.train_model(paths, cls.settings, cls.model_file)
+        cls.xml_files = load_data.list_xml_files(paths['corpus'])
+        cls.service = prediction_server.PredictionService(cls.model_file, cls.settings.entity_1, entity_1_ids,
+                                                          cls.settings.entity_2, entity_2_ids, False, 256, 0.01)
+        cls.server = prediction_server.start_server(cls.service, port=0)
+        cls.url = 'http://127.0.0.1:' + str(cls.server.server_address[1])
+
+        #predictions of the model without the server, one document at a time
+        model, dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary = \
+            model_bundle.load_model(cls.model_file)
+        num_features = load_data.get_feature_space_size(dep_dictionary, dep_word_dictionary, dep_element_dictionary,
+                                                        between_word_dictionary)
+        cls.expected = {}
+        for xml_file in cls.xml_files:
+            instances = load_data.build_instances_predict(
+                load_data.load_xml(xml_file, cls.settings.entity_1, cls.settings.entity_2), dep_dictionary,
+                dep_word_dictionary, dep_element_dictionary, between_word_dictionary, entity_1_ids, entity_2_ids)
+            probabilities = model.predict_proba(load_data.build_feature_matrix(instances, num_features))[:, 1] \
+                if len(instances) > 0 else []
+            cls.expected[xml_file] = [(i.get_start(), i.get_end(), p) for i, p in zip(instances, probabilities)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.stop()
+        shutil.rmtree(cls.folder)
+
+    def post(self, body):
+        '''Returns status and json content of POST /predict'''
+        try:
+            response = request.urlopen(request.Request(self.url + '/predict', body, {'Content-Type': 'application/xml'}))
+        except error.HTTPError as e:
+            return e.code, json.loads(e.read().decode('utf-8'))
+        return response.getcode(), json.loads(response.read().decode('utf-8'))
+
+    def get_stats(self):
+        return json.loads(request.urlopen(self.url + '/stats').read().decode('utf-8'))
+
+    def test_predict_concurrent_documents(self):
+        results = {}
+
+        def post_file(xml_file):
+            results[xml_file] = self.post(open(xml_file, 'rb').read())
+
+        threads = [threading.Thread(target=post_file, args=(f,)) for f in self.xml_files]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(sum(len(e) for e in self.expected.values()), 0)
+        for xml_file in self.xml_files:
+            status, content = results[xml_file]
+            self.assertEqual(status, 200)
+            predicted = [(r['start'], r['end'], r['probability']) for r in content['predictions']]
+            self.assertEqual(len(predicted), len(self.expected[xml_file]))
+            for (start, end, probability), (expected_start, expected_end, expected_probability) in \
+                    zip(predicted, self.expected[xml_file]):
+                self.assertEqual((start, end), (expected_start, expected_end))
+                self.assertAlmostEqual(probability, expected_probability, places=9)
+
+        stats = self.get_stats()
+        self.assertGreaterEqual(stats['requests'], len(self.xml_files))
+        self.assertGreater(stats['batches'], 0)
+        self.assertIn('mean_latency_seconds', stats)
+
+    def test_invalid_document_is_bad_request(self):
+        status, content = self.post(b'<root><unclosed></root>')
+        self.assertEqual(status, 400)
+        self.assertIn('error', content)
+
+    def test_scoring_failure_is_server_error(self):
+        if len(self.expected[self.xml_files[0]]) == 0:
+            self.skipTest('first document has no instances')
+        batcher = self.service.batcher
+        model = batcher.model
+        batcher.model = FailingModel()
+        try:
+            status, content = self.post(open(self.xml_files[0], 'rb').read())
+        finally:
+            batcher.model = model
+        self.assertEqual(status, 500)
+        self.assertIn('model failure', content['error'])
+
+    def test_unknown_path(self):
+        try:
+            request.urlopen(self.url + '/unknown')
+        except error.HTTPError as e:
+            self.assertEqual(e.code, 404)
+        else:
+            self.fail('expected 404')
+
+
+class MicroBatcherStopTest(unittest.TestCase):
+    def test_predict_after_stop_raises(self):
+        batcher = prediction_server.MicroBatcher(FailingModel(), 1, prediction_server.ServerStats())
+        batcher.stop()
+        self.assertRaises(RuntimeError, batcher.predict, [object()])
+
+    def test_jobs_behind_sentinel_get_an_error(self):
+        stats = prediction_server.ServerStats()
+        batcher = prediction_server.MicroBatcher.__new__(prediction_server.MicroBatcher)
+        batcher.jobs = queue.Queue()
+        batcher.jobs.put(None)
+        job = {'instances': [object()], 'done': threading.Event()}
+        batcher.jobs.put(job)
+        batcher.stats = stats
+        batcher.run()
+        self.assertTrue(job['done'].is_set())
+        self.assertIsInstance(job['error'], RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import common
+import instrumentation
+import load_data
+import relation_extraction
+
+
+class PrReportTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.folder, 'cv')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read_report(self):
+        curve = open(self.prefix + '_pr_curve.tsv').read().splitlines()
+        summary = json.load(open(self.prefix + '_cv_summary.json'))
+        self.assertTrue(os.path.exists(self.prefix + '_pr_curve.png'))
+        return curve, summary
+
+    def test_report(self):
+        summary = relation_extraction.write_pr_report(np.array([1.0, 0.0, 1.0, 0.0]), np.array([0.9, 0.2, 0.6, 0.7]),
+                                                      self.prefix)
+        curve, written = self.read_report()
+        self.assertEqual(written, summary)
+        self.assertEqual(summary['groups'], 4)
+        self.assertEqual(summary['positive_groups'], 2)
+        self.assertAlmostEqual(summary['baseline_precision'], 0.5)
+        self.assertGreater(len(curve), 1)
+
+    def test_no_test_groups(self):
+        summary = relation_extraction.write_pr_report(np.array([]), np.array([]), self.prefix)
+        curve, written = self.read_report()
+        self.assertEqual(curve, ['threshold\tprecision\trecall'])
+        self.assertEqual(summary['groups'], 0)
+        self.assertIsNone(summary['average_precision'])
+        self.assertIsNone(written['pr_auc'])
+
+    def test_no_positive_groups(self):
+        summary = relation_extraction.write_pr_report(np.array([0.0, 0.0]), np.array([0.3, 0.1]), self.prefix)
+        curve, written = self.read_report()
+        self.assertEqual(curve, ['threshold\tprecision\trecall'])
+        self.assertEqual(summary['positive_groups'], 0)
+        self.assertEqual(summary['baseline_precision'], 0.0)
+        self.assertIsNone(summary['pr_auc'])
+
+
+class CrossValidationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.settings, paths = common.generate_dataset(os.path.join(cls.folder, 'data'), num_documents=30)
+        cls.abstracts = common.load_abstracts(paths, cls.settings)
+        cls.entity_1_ids = load_data.load_id_list(paths['entity_1_ids'], 0)
+        cls.entity_2_ids = load_data.load_id_list(paths['entity_2_ids'], 0)
+        cls.distant_interactions, cls.reverse_distant_interactions = \
+            load_data.load_distant_kb(paths['knowledge_base'], 0, 1, 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def run_folds(self, num_workers, symmetric, feature_bits = None):
+        report_prefix = os.path.join(self.folder, 'cv_' + str(num_workers) + '_' + str(symmetric) + '_' +
+                                     str(feature_bits))
+        total_test, total_predicted_prob = relation_extraction.k_fold_cross_validation(
+            5, self.abstracts, self.distant_interactions, self.reverse_distant_interactions, self.entity_1_ids,
+            self.entity_2_ids, symmetric, num_workers, report_prefix, feature_bits)
+        summary = json.load(open(report_prefix + '_cv_summary.json'))
+        curve = open(report_prefix + '_pr_curve.tsv').read()
+        return total_test, total_predicted_prob, summary, curve
+
+    def assert_same_folds(self, symmetric, feature_bits = None):
+        sequential = self.run_folds(1, symmetric, feature_bits)
+        parallel = self.run_folds(2, symmetric, feature_bits)
+        self.assertGreater(len(sequential[0]), 0)
+        np.testing.assert_array_equal(sequential[0], parallel[0])
+        np.testing.assert_array_equal(sequential[1], parallel[1])
+        self.assertEqual(sequential[2], parallel[2])
+        self.assertEqual(sequential[3], parallel[3])
+
+    def test_parallel_folds_match_sequential(self):
+        self.assert_same_folds(False)
+
+    def test_parallel_symmetric_folds_match_sequential(self):
+        self.assert_same_folds(True)
+
+
+class DistantTrainTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.argv = sys.argv
+
+    def tearDown(self):
+        sys.argv = self.argv
+        instrumentation.disable()
+        shutil.rmtree(self.folder)
+
+    def test_hashed_run_writes_comparison(self):
+        settings, paths = common.generate_dataset(os.path.join(self.folder, 'data'), num_documents=30)
+        model_out = os.path.join(self.folder, 'model.pkl')
+        sys.argv = ['relation_extraction.py', 'DISTANT_TRAIN', model_out, paths['corpus'], paths['knowledge_base'],
+                    '0', '1', '2', settings.entity_1, paths['entity_1_ids'], '0', settings.entity_2,
+                    paths['entity_2_ids'], '0', 'FALSE', '1', '8']
+        relation_extraction.main()
+
+        dictionary_summary = json.load(open(model_out + '_cv_summary.json'))
+        hashed_summary = json.load(open(model_out + '_hashed_cv_summary.json'))
+        self.assertEqual(dictionary_summary['feature_mode'], 'dictionary')
+        self.assertEqual(hashed_summary['feature_mode'], 'hashed_8_bits')
+        #same folds, only the features differ
+        self.assertGreater(hashed_summary['groups'], 0)
+        self.assertEqual(hashed_summary['groups'], dictionary_summary['groups'])
+        self.assertEqual(hashed_summary['positive_groups'], dictionary_summary['positive_groups'])
+        self.assertTrue(os.path.exists(model_out + '_hashed_pr_curve.tsv'))
+
+
+class StreamPredictionsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.settings, cls.paths = common.generate_dataset(os.path.join(cls.folder, 'data'))
+        cls.model_file = os.path.join(cls.folder, 'model.pkl')
+        common.train_model(cls.paths, cls.settings, cls.model_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def predict(self, out_file, output_format):
+        relation_extraction.stream_predictions(self.model_file, self.paths['corpus'], self.settings.entity_1,
+                                               self.paths['entity_1_ids'], 0, self.settings.entity_2,
+                                               self.paths['entity_2_ids'], 0, False, out_file, output_format,
+                                               chunk_size=7)
+
+    def test_tsv_and_jsonl_agree(self):
+        tsv_file = os.path.join(self.folder, 'predictions.tsv')
+        jsonl_file = os.path.join(self.folder, 'predictions.jsonl')
+        self.predict(tsv_file, 'tsv')
+        self.predict(jsonl_file, 'jsonl')
+        lines = open(tsv_file).read().splitlines()
+        fields = lines[0].split('\t')
+        tsv_records = [dict(zip(fields, line.split('\t'))) for line in lines[1:]]
+        jsonl_records = [json.loads(line) for line in open(jsonl_file).read().splitlines()]
+        self.assertGreater(len(tsv_records), 0)
+        self.assertEqual(len(tsv_records), len(jsonl_records))
+        for tsv_record, jsonl_record in zip(tsv_records, jsonl_records):
+            self.assertEqual(float(tsv_record['probability']), jsonl_record['probability'])
+            self.assertEqual(int(tsv_record['label']), jsonl_record['label'])
+            self.assertEqual(int(tsv_record['start']), jsonl_record['start'])
+            self.assertEqual(int(tsv_record['end']), jsonl_record['end'])
+
+    def test_floats_keep_full_precision(self):
+        self.assertEqual(float(relation_extraction.format_prediction_field(0.12345678901234567)), 0.12345678901234567)
+        self.assertEqual(relation_extraction.format_prediction_field(u'a\tb'), u'a b')
+
+
+class MainReportTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.argv = sys.argv
+        self.environment = os.environ.get(instrumentation.REPORT_ENVIRONMENT_VARIABLE)
+
+    def tearDown(self):
+        sys.argv = self.argv
+        if self.environment is None:
+            os.environ.pop(instrumentation.REPORT_ENVIRONMENT_VARIABLE, None)
+        else:
+            os.environ[instrumentation.REPORT_ENVIRONMENT_VARIABLE] = self.environment
+        instrumentation.disable()
+        shutil.rmtree(self.folder)
+
+    def test_failed_run_writes_report(self):
+        report_file = os.path.join(self.folder, 'report.json')
+        os.environ[instrumentation.REPORT_ENVIRONMENT_VARIABLE] = report_file
+        sys.argv = ['relation_extraction.py', 'CONVERT_MODEL', os.path.join(self.folder, 'missing.pkl'),
+                    os.path.join(self.folder, 'bundle')]
+        self.assertRaises(IOError, relation_extraction.main)
+        report = json.load(open(report_file))
+        self.assertEqual(report['info']['mode'], 'CONVERT_MODEL')
+        self.assertIn('error', report['info'])
+        self.assertFalse(instrumentation.is_enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import collections
+import random
+import unittest
+
+import numpy as np
+
+import common
+import skipgram
+
+try:
+    import tensorflow as tf
+    import word2vec
+except ImportError:
+    tf = None
+
+
+def window_pairs(data, skip_window):
+    '''Every (center, context) pair of the windows of data, each center gets all 2 * skip_window contexts'''
+    pairs = collections.Counter()
+    for position in range(skip_window, len(data) - skip_window):
+        for offset in range(-skip_window, skip_window + 1):
+            if offset != 0:
+                pairs[(data[position], data[position + offset])] += 1
+    return pairs
+
+
+def loop_pairs(data, num_skips, skip_window):
+    '''Pairs of one pass of the generate_batch loop over data'''
+    random.seed(0)
+    num_centers = len(data) - 2 * skip_window
+    batch, labels, _ = skipgram.generate_batch(data, 0, num_centers * num_skips, num_skips, skip_window)
+    return collections.Counter(zip(batch.tolist(), labels[:, 0].tolist()))
+
+
+class SkipGramPairsTest(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.data = random_state.randint(0, 30, 500).tolist()
+
+    def vectorized_pairs(self, num_skips, skip_window):
+        centers, contexts = skipgram.generate_skipgram_pairs(self.data, num_skips, skip_window,
+                                                             np.random.RandomState(1))
+        self.assertEqual(centers.dtype, np.int32)
+        self.assertEqual(contexts.dtype, np.int32)
+        return collections.Counter(zip(centers.tolist(), contexts.tolist()))
+
+    def test_full_window_matches_loop(self):
+        #with num_skips == 2 * skip_window both take every context of the window, so the pairs are the same
+        for skip_window in [1, 2, 3]:
+            expected = loop_pairs(self.data, 2 * skip_window, skip_window)
+            self.assertEqual(expected, window_pairs(self.data, skip_window))
+            self.assertEqual(self.vectorized_pairs(2 * skip_window, skip_window), expected)
+
+    def test_partial_window_draws_like_loop(self):
+        #fewer skips pick random contexts, both generators give each center num_skips of its window
+        num_skips, skip_window = 2, 2
+        allowed = window_pairs(self.data, skip_window)
+        for pairs in [loop_pairs(self.data, num_skips, skip_window), self.vectorized_pairs(num_skips, skip_window)]:
+            self.assertEqual(sum(pairs.values()), (len(self.data) - 2 * skip_window) * num_skips)
+            for pair, count in pairs.items():
+                self.assertLessEqual(count, allowed[pair])
+            centers = collections.Counter()
+            for (center, _), count in pairs.items():
+                centers[center] += count
+            self.assertEqual(centers, collections.Counter(
+                dict((c, num_skips * n) for c, n in
+                     collections.Counter(self.data[skip_window:len(self.data) - skip_window]).items())))
+
+    def test_short_data(self):
+        centers, contexts = skipgram.generate_skipgram_pairs([1, 2], 2, 1)
+        self.assertEqual(len(centers), 0)
+        self.assertEqual(len(contexts), 0)
+
+
+@unittest.skipUnless(tf is not None, 'tensorflow is not installed')
+class PairDatasetTest(unittest.TestCase):
+    def test_batches_cross_epochs(self):
+        data = list(range(20))
+        batch_size, num_skips, skip_window = 8, 2, 1
+        #36 pairs per epoch, batches of 8 run over the end of the first epoch
+        pairs_per_epoch = (len(data) - 2 * skip_window) * num_skips
+        num_batches = 2 * pairs_per_epoch // batch_size
+        graph = tf.Graph()
+        with graph.as_default():
+            dataset = word2vec.build_pair_dataset(data, batch_size, num_skips, skip_window, 4,
+                                                  np.random.RandomState(0))
+            iterator = dataset.make_initializable_iterator()
+            centers, contexts = iterator.get_next()
+            self.assertEqual(centers.shape.as_list(), [batch_size])
+            self.assertEqual(contexts.shape.as_list(), [batch_size])
+        with tf.Session(graph=graph) as session:
+            session.run(iterator.initializer)
+            seen = []
+            for _ in range(num_batches):
+                batch_centers, batch_contexts = session.run([centers, contexts])
+                self.assertEqual(batch_centers.shape, (batch_size,))
+                self.assertEqual(batch_contexts.shape, (batch_size,))
+                self.assertEqual(batch_centers.dtype, np.int32)
+                seen.extend(zip(batch_centers.tolist(), batch_contexts.tolist()))
+        #every pair of two whole epochs comes through once per epoch
+        expected = window_pairs(data, skip_window)
+        self.assertEqual(collections.Counter(seen), collections.Counter(
+            dict((pair, 2 * count) for pair, count in expected.items())))
+
+
+if __name__ == '__main__':
+    unittest.main()
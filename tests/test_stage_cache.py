@@ -0,0 +1,124 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import common
+import load_data
+import stage_cache
+
+
+def describe_pairs(abstract_pairs):
+    return dict((key, [(forward.get_type_dependency_path(), reverse.get_type_dependency_path(), entity_ids)
+                       for forward, reverse, entity_ids in pairs])
+                for key, pairs in abstract_pairs.items())
+
+
+class StageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.folder, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_hit_miss_eviction(self):
+        #room for three entries of 3000 random bytes, which do not compress, within 90% of the limit
+        cache = stage_cache.StageCache(self.cache_folder, 11000 / (1024.0 * 1024.0))
+        values = dict(('key' + str(i), os.urandom(3000)) for i in range(4))
+        self.assertIsNone(cache.get('key0'))
+        for i in range(3):
+            cache.put('key' + str(i), values['key' + str(i)])
+        for i in range(3):
+            os.utime(cache.get_path('key' + str(i)), (1000 * (i + 1), 1000 * (i + 1)))
+        self.assertEqual(cache.get('key0'), values['key0'])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        #key1 is now the least recently used entry
+        cache.put('key3', values['key3'])
+        self.assertLessEqual(cache.total_bytes, 0.9 * cache.max_bytes)
+        self.assertIsNone(cache.get('key1'))
+        for key in ['key0', 'key2', 'key3']:
+            self.assertEqual(cache.get(key), values[key])
+        self.assertEqual(cache.get_report()['hits'], 4)
+        self.assertEqual(cache.get_report()['misses'], 2)
+
+        #a new cache on the folder sees the remaining entries
+        reopened = stage_cache.StageCache(self.cache_folder, 11000 / (1024.0 * 1024.0))
+        self.assertEqual(reopened.total_bytes, cache.total_bytes)
+        self.assertEqual(reopened.get('key2'), values['key2'])
+
+    def test_damaged_entry_is_a_miss(self):
+        cache = stage_cache.StageCache(self.cache_folder)
+        cache.put('key', [1, 2, 3])
+        entry = open(cache.get_path('key'), 'wb')
+        entry.write(b'not an entry')
+        entry.close()
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_code_version_follows_source(self):
+        module_folder = os.path.join(self.folder, 'modules')
+        os.makedirs(module_folder)
+        source_file = os.path.join(module_folder, 'cached_stage_module.py')
+        sys.path.insert(0, module_folder)
+        try:
+            open(source_file, 'w').write('VALUE = 1\n')
+            version = stage_cache.get_code_version(['cached_stage_module'])
+            self.assertEqual(stage_cache.get_code_version(['cached_stage_module']), version)
+
+            #versions are kept for the process, a new run reads the changed source
+            open(source_file, 'w').write('VALUE = 2\n')
+            stage_cache._code_versions.clear()
+            self.assertNotEqual(stage_cache.get_code_version(['cached_stage_module']), version)
+        finally:
+            sys.path.remove(module_folder)
+            sys.modules.pop('cached_stage_module', None)
+            stage_cache._code_versions.clear()
+
+    def test_candidate_pairs_invalidation(self):
+        settings, paths = common.generate_dataset(os.path.join(self.folder, 'data'))
+        abstracts = common.load_abstracts(paths, settings)
+        keys = sorted(abstracts)
+        entity_1_ids = load_data.load_id_list(paths['entity_1_ids'], 0)
+        entity_2_ids = load_data.load_id_list(paths['entity_2_ids'], 0)
+        expected = describe_pairs(load_data.build_abstract_candidate_pairs(abstracts, keys, entity_1_ids,
+                                                                           entity_2_ids))
+
+        def build(cache, abstracts = abstracts, entity_1_ids = entity_1_ids):
+            hits, misses = cache.hits, cache.misses
+            abstract_pairs = load_data.build_abstract_candidate_pairs(abstracts, keys, entity_1_ids, entity_2_ids,
+                                                                      cache=cache)
+            return abstract_pairs, cache.hits - hits, cache.misses - misses
+
+        cache = stage_cache.StageCache(self.cache_folder)
+        abstract_pairs, hits, misses = build(cache)
+        self.assertEqual((hits, misses), (0, len(keys)))
+        self.assertEqual(describe_pairs(abstract_pairs), expected)
+        abstract_pairs, hits, misses = build(cache)
+        self.assertEqual((hits, misses), (len(keys), 0))
+        self.assertEqual(describe_pairs(abstract_pairs), expected)
+
+        #changed sentences of one abstract
+        changed = dict(abstracts)
+        changed[keys[0]] = abstracts[keys[0]][1:]
+        self.assertGreater(len(abstracts[keys[0]]), 1)
+        self.assertEqual(build(cache, changed)[1:], (len(keys) - 1, 1))
+
+        #changed id lists
+        self.assertEqual(build(cache, entity_1_ids=set(list(entity_1_ids)[1:]))[1:], (0, len(keys)))
+
+        #changed code of the modules computing the pairs
+        module_names = tuple(sorted(load_data.CANDIDATE_PAIR_MODULES))
+        version = stage_cache.get_code_version(module_names)
+        try:
+            stage_cache._code_versions[module_names] = version + 'changed'
+            self.assertEqual(build(cache)[1:], (0, len(keys)))
+        finally:
+            stage_cache._code_versions[module_names] = version
+        self.assertEqual(build(cache)[1:], (len(keys), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import collections
+import random
+import unittest
+
+import common
+import load_data
+from vocabulary import Vocabulary
+
+
+def old_build_dictionary(words, occur_count = None):
+    '''Dictionary the way build_dataset built it from a list of repeated words before Vocabulary'''
+    num_words = len(set(words))
+    if occur_count is not None:
+        counter = collections.Counter(words)
+        num_words -= len([c for c in counter if counter[c] < occur_count])
+    dictionary = dict()
+    for word, _ in collections.Counter(words).most_common(num_words):
+        dictionary[word] = len(dictionary)
+    return dictionary
+
+
+class BuildDictionaryTest(unittest.TestCase):
+    def setUp(self):
+        random_state = random.Random(0)
+        #skewed counts with many ties, like feature words
+        self.words = []
+        for i in range(200):
+            self.words.extend(['word' + str(i)] * (1 + int(random_state.paretovariate(1.5))))
+        random_state.shuffle(self.words)
+
+    def assert_matches_old(self, min_count):
+        expected = old_build_dictionary(self.words, min_count)
+        dictionary = Vocabulary(self.words).build_dictionary(min_count)
+        counts = collections.Counter(self.words)
+        self.assertEqual(set(dictionary), set(expected))
+        self.assertEqual(sorted(dictionary.values()), list(range(len(dictionary))))
+        #most_common left the order of ties to the dictionary, they are now ordered by word
+        for word in dictionary:
+            for other in dictionary:
+                if counts[word] != counts[other]:
+                    self.assertEqual(dictionary[word] < dictionary[other], expected[word] < expected[other])
+                elif word < other:
+                    self.assertLess(dictionary[word], dictionary[other])
+
+    def test_matches_old_dictionary(self):
+        self.assert_matches_old(None)
+
+    def test_matches_old_dictionary_with_min_count(self):
+        for min_count in [1, 2, 3, 10, 1000]:
+            self.assert_matches_old(min_count)
+
+    def test_tie_order_does_not_depend_on_insertion(self):
+        reverse = Vocabulary(list(reversed(self.words)))
+        self.assertEqual(reverse.build_dictionary(), Vocabulary(self.words).build_dictionary())
+        self.assertEqual(reverse.build_dictionary(2), Vocabulary(self.words).build_dictionary(2))
+
+    def test_incremental_counts(self):
+        vocabulary = Vocabulary()
+        for word in self.words[:100]:
+            vocabulary.add(word)
+        vocabulary.update(self.words[100:300])
+        rest = Vocabulary(self.words[300:])
+        vocabulary.merge(rest)
+        self.assertEqual(vocabulary.build_dictionary(2), Vocabulary(self.words).build_dictionary(2))
+        vocabulary.subtract(rest)
+        self.assertEqual(vocabulary.build_dictionary(), Vocabulary(self.words[:300]).build_dictionary())
+
+    def test_build_dataset(self):
+        data, count, dictionary, reversed_dictionary = load_data.build_dataset(self.words, 2)
+        self.assertEqual(set(dictionary), set(old_build_dictionary(self.words, 2)))
+        self.assertEqual(data, [dictionary[w] for w in self.words if w in dictionary])
+        self.assertEqual(count, [(reversed_dictionary[i], c) for i, (_, c) in enumerate(count)])
+
+
+if __name__ == '__main__':
+    unittest.main()